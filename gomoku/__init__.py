@@ -0,0 +1,36 @@
+"""五子棋
+
+核心模块(board、game、ai、sgf)不依赖pygame，可以在无界面环境中导入。
+包的顶层名称按需延迟导入，`import gomoku`本身不会加载任何子模块。
+"""
+
+import importlib
+
+# 顶层名称 -> 所在子模块
+_LAZY_ATTRS = {
+    "Board": "board",
+    "Game": "game",
+    "AI": "ai",
+    "RandomAI": "ai",
+    "PatternAI": "ai",
+    "EnhancedMinimaxAI": "ai",
+    "get_ai_by_level": "ai",
+    "create_sgf": "sgf",
+    "parse_sgf": "sgf",
+    "iter_sgf_games": "sgf",
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
@@ -0,0 +1,540 @@
+"""可选的numba加速: 在扁平int8数组上编译的胜负判断、棋形评估、候选位置和局面评估
+
+安装了numba时，EnhancedMinimaxAI在搜索中维护一份与列表棋盘同步的扁平数组
+(交叉点row * size + col的值为0/1/2)，候选位置、着手排序、威胁点扫描和局面评估
+改用这里编译好的函数；没有numba或设置了环境变量GOMOKU_ACCEL=python时仍使用ai.py中的纯Python实现。
+这里的函数本身也是普通的Python代码，未编译时(.py_func)与编译后的结果相同。
+
+编译结果缓存在__pycache__中，只有第一次运行时需要几秒钟编译。AI第一次需要时在后台线程中
+调用warm_up()编译(见ai.load_accel)，编译完成前的搜索使用纯Python实现，不会因为编译而超时。
+
+python -m gomoku.accel check --positions 200   # 与纯Python实现逐项对比
+python -m gomoku.accel bench                   # 比较两种实现的局面评估和搜索用时
+"""
+
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKEND = (
+    "numba"
+    if numba is not None and os.environ.get("GOMOKU_ACCEL") != "python"
+    else "python"
+)
+
+# 四个方向: 水平、垂直、两个对角线
+_DR = (0, 1, 1, 1)
+_DC = (1, 0, 1, -1)
+_MAX_COUNT = 6  # 分数表的行数上限，六连及以上不计分
+WIN_SCORE = 100000.0
+
+
+def _jit(function):
+    return numba.njit(cache=True)(function) if BACKEND == "numba" else function
+
+
+def score_tables(pattern_ai):
+    """PatternAI的棋形分数和防守分转为(连子数, 开放端数)下标的两个数组"""
+    pattern = np.zeros((_MAX_COUNT + 1, 3))
+    block = np.zeros((_MAX_COUNT + 1, 3))
+    for (count, open_ends), score in pattern_ai._pattern_scores.items():
+        pattern[count, open_ends] = score
+    for (count, open_ends), score in pattern_ai._block_scores.items():
+        block[count, open_ends] = score
+    return pattern, block
+
+
+@_jit
+def check_win(cells, size, row, col, stone, exact):
+    """与Board.check_win相同，exact为True时只有恰好五连算胜(连珠规则的黑棋)"""
+    for d in range(4):
+        dr, dc = _DR[d], _DC[d]
+        count = 1
+        r, c = row + dr, col + dc
+        while 0 <= r < size and 0 <= c < size and cells[r * size + c] == stone:
+            count += 1
+            r += dr
+            c += dc
+        r, c = row - dr, col - dc
+        while 0 <= r < size and 0 <= c < size and cells[r * size + c] == stone:
+            count += 1
+            r -= dr
+            c -= dc
+        if count == 5 or (count > 5 and not exact):
+            return True
+    return False
+
+
+@_jit
+def scan_direction(cells, size, row, col, dr, dc, player):
+    """与PatternAI.scan_direction相同，返回(连子数, 开放端数)"""
+    count = 1
+    open_ends = 0
+    r, c = row + dr, col + dc
+    while 0 <= r < size and 0 <= c < size and cells[r * size + c] == player:
+        count += 1
+        r += dr
+        c += dc
+    if 0 <= r < size and 0 <= c < size and cells[r * size + c] == 0:
+        open_ends += 1
+    r, c = row - dr, col - dc
+    while 0 <= r < size and 0 <= c < size and cells[r * size + c] == player:
+        count += 1
+        r -= dr
+        c -= dc
+    if 0 <= r < size and 0 <= c < size and cells[r * size + c] == 0:
+        open_ends += 1
+    return count, open_ends
+
+
+@_jit
+def evaluate_direction(cells, size, row, col, dr, dc, player, pattern):
+    """与PatternAI._evaluate_direction相同"""
+    count, open_ends = scan_direction(cells, size, row, col, dr, dc, player)
+    if count >= _MAX_COUNT:
+        return 0.0
+    return pattern[count, open_ends]
+
+
+@_jit
+def evaluate_position(cells, size, row, col, player, pattern, block):
+    """与PatternAI.evaluate_position相同(加法顺序也相同)"""
+    if cells[row * size + col] != 0:
+        return 0.0
+    total = 0.0
+    for d in range(4):
+        total += evaluate_direction(cells, size, row, col, _DR[d], _DC[d], player, pattern)
+        count, open_ends = scan_direction(cells, size, row, col, _DR[d], _DC[d], 3 - player)
+        if count < _MAX_COUNT:
+            total += block[count, open_ends]
+    return total
+
+
+@_jit
+def candidate_cells(cells, size, stones, stone_count):
+    """前stone_count个棋子周围两格内的空位编号，按编号从小到大"""
+    near = np.zeros(size * size, np.bool_)
+    for i in range(stone_count):
+        row, col = divmod(stones[i], size)
+        for r in range(max(0, row - 2), min(size, row + 3)):
+            for c in range(max(0, col - 2), min(size, col + 3)):
+                if cells[r * size + c] == 0:
+                    near[r * size + c] = True
+    return np.nonzero(near)[0]
+
+
+# threat_cells返回的标志位
+FIVE, FOUR, THREE, OPP_FIVE, OPP_FOUR = 1, 2, 4, 8, 16
+
+
+@_jit
+def threat_cells(cells, size, stones, stone_count, mover, exact_black):
+    """与EnhancedMinimaxAI._scan_threats相同的威胁点，返回(空位编号, 标志位)两个数组
+
+    只包含有威胁的空位，按编号从小到大；exact_black为True时黑棋只有恰好五子才算成五。
+    """
+    near = np.zeros(size * size, np.bool_)
+    for i in range(stone_count):
+        row, col = divmod(stones[i], size)
+        for r in range(max(0, row - 1), min(size, row + 2)):
+            for c in range(max(0, col - 1), min(size, col + 2)):
+                if cells[r * size + c] == 0:
+                    near[r * size + c] = True
+    opponent = 3 - mover
+    mover_exact = exact_black and mover == 1
+    opponent_exact = exact_black and opponent == 1
+    found = np.zeros(size * size, np.int64)
+    flags = np.zeros(size * size, np.int64)
+    n = 0
+    for cell in range(size * size):
+        if not near[cell]:
+            continue
+        row, col = divmod(cell, size)
+        five = four = three = opp_five = opp_four = False
+        for d in range(4):
+            count, open_ends = scan_direction(cells, size, row, col, _DR[d], _DC[d], mover)
+            if count == 5 or (count > 5 and not mover_exact):
+                five = True
+            elif count == 4 and open_ends > 0:
+                four = True
+            elif count == 3 and open_ends == 2:
+                three = True
+            count, open_ends = scan_direction(
+                cells, size, row, col, _DR[d], _DC[d], opponent
+            )
+            if count == 5 or (count > 5 and not opponent_exact):
+                opp_five = True
+            elif count == 4 and open_ends == 2:
+                opp_four = True
+        flag = 0
+        if five:
+            flag = FIVE
+        elif four:
+            flag = FOUR
+        elif three:
+            flag = THREE
+        if opp_five:
+            flag |= OPP_FIVE
+        elif opp_four:
+            flag |= OPP_FOUR
+        if flag:
+            found[n] = cell
+            flags[n] = flag
+            n += 1
+    return found[:n], flags[:n]
+
+
+@_jit
+def evaluate_board(
+    cells,
+    size,
+    stones,
+    stone_count,
+    player,
+    pattern,
+    block,
+    empty_values,
+    empty_total,
+    attack,
+    defense,
+):
+    """与EnhancedMinimaxAI._evaluate_board的手工评估相同
+
+    相邻空位按编号顺序累加，与纯Python实现(按集合顺序)只有浮点舍入上的差别。
+    """
+    ordered = np.sort(stones[:stone_count])
+    for cell in ordered:
+        row, col = divmod(cell, size)
+        stone = cells[cell]
+        for d in range(4):
+            count = 1
+            for i in range(1, 5):
+                r, c = row + _DR[d] * i, col + _DC[d] * i
+                if 0 <= r < size and 0 <= c < size and cells[r * size + c] == stone:
+                    count += 1
+                else:
+                    break
+            if count >= 5:
+                return WIN_SCORE if stone == player else -WIN_SCORE
+
+    far_score = empty_total
+    near = np.zeros(size * size, np.bool_)
+    for cell in ordered:
+        far_score -= empty_values[cell]
+        row, col = divmod(cell, size)
+        for r in range(max(0, row - 1), min(size, row + 2)):
+            for c in range(max(0, col - 1), min(size, col + 2)):
+                near[r * size + c] = True
+
+    my_score = 0.0
+    opp_score = 0.0
+    for cell in range(size * size):
+        if near[cell] and cells[cell] == 0:
+            far_score -= empty_values[cell]
+            row, col = divmod(cell, size)
+            my_score += evaluate_position(cells, size, row, col, player, pattern, block)
+            opp_score += evaluate_position(
+                cells, size, row, col, 3 - player, pattern, block
+            )
+
+    my_score = (my_score + far_score) * attack
+    opp_score = (opp_score + far_score) * defense
+    return my_score - opp_score
+
+
+class SearchArrays:
+    """搜索中与列表棋盘同步的扁平数组和分数表，由EnhancedMinimaxAI在_start_search中建立"""
+
+    def __init__(self, board, stones, pattern_ai):
+        size = len(board)
+        self.size = size
+        self.cells = np.array(board, np.int8).reshape(-1)
+        self.stones = np.zeros(size * size, np.int64)  # 落子顺序，与AI的_stones相同
+        self.stones[: len(stones)] = stones
+        self.count = len(stones)
+        self.pattern, self.block = score_tables(pattern_ai)
+        values, total = pattern_ai.get_empty_cell_values()
+        self.empty_values = np.array(values, np.float64)
+        self.empty_total = float(total)
+        self.attack = float(pattern_ai.attack_weight)
+        self.defense = float(pattern_ai.defense_weight)
+
+    def place(self, cell, player):
+        self.cells[cell] = player
+        self.stones[self.count] = cell
+        self.count += 1
+
+    def remove(self, cell):
+        self.cells[cell] = 0
+        self.count -= 1
+
+    def candidates(self, cell_live):
+        """候选位置，cell_live为LiveWindows.cell_live，规则与_get_candidate_positions相同"""
+        cells = candidate_cells(self.cells, self.size, self.stones, self.count).tolist()
+        size = self.size
+        live = [divmod(cell, size) for cell in cells if cell_live[cell] > 0]
+        return live or [divmod(cell, size) for cell in cells]
+
+    def threats(self, mover, exact_black):
+        """与_scan_threats相同的五个列表(各列表内按编号排序)"""
+        found, flags = threat_cells(
+            self.cells, self.size, self.stones, self.count, mover, exact_black
+        )
+        lists = [], [], [], [], []
+        size = self.size
+        for cell, flag in zip(found.tolist(), flags.tolist()):
+            pos = divmod(cell, size)
+            for i, bit in enumerate((FIVE, FOUR, THREE, OPP_FIVE, OPP_FOUR)):
+                if flag & bit:
+                    lists[i].append(pos)
+        return lists
+
+    def evaluate_position(self, row, col, player):
+        return evaluate_position(
+            self.cells, self.size, row, col, player, self.pattern, self.block
+        )
+
+    def evaluate(self, player):
+        return evaluate_board(
+            self.cells,
+            self.size,
+            self.stones,
+            self.count,
+            player,
+            self.pattern,
+            self.block,
+            self.empty_values,
+            self.empty_total,
+            self.attack,
+            self.defense,
+        )
+
+
+def warm_up():
+    """用一个小局面按搜索中的参数类型调用所有核心函数，完成编译(或载入缓存)"""
+    from .ai import PatternAI
+
+    size = 9
+    board = [[0] * size for _ in range(size)]
+    board[4][4], board[4][5] = 1, 2
+    arrays = SearchArrays(board, [40, 41], PatternAI(size))
+    arrays.candidates([1] * (size * size))
+    arrays.threats(1, True)
+    arrays.evaluate_position(3, 3, 1)
+    arrays.evaluate(1)
+    check_win(arrays.cells, size, 4, 4, 1, False)
+
+
+def _python(function):
+    """编译前的Python函数"""
+    return getattr(function, "py_func", function)
+
+
+def _random_positions(count, seed):
+    """对局中的局面和随机填子的局面(含长连)，返回[(大小, 规则, 棋盘), ...]"""
+    import random
+
+    from .bench import make_position
+
+    rng = random.Random(seed)
+    positions = []
+    for i in range(count):
+        size = rng.choice((9, 15, 19))
+        if i % 2:
+            game = make_position(size, rng.randint(1, 40), rng.random())
+            board = [row[:] for row in game.board.board]
+        else:
+            density = rng.uniform(0.1, 0.7)
+            board = [
+                [rng.choice((1, 2)) if rng.random() < density else 0 for _ in range(size)]
+                for _ in range(size)
+            ]
+        positions.append((size, rng.choice(("freestyle", "renju")), board))
+    return positions
+
+
+def check_parity(positions=200, seed=0, tolerance=1e-9):
+    """在随机局面上把这里的函数(编译后和编译前)与纯Python实现逐项对比
+
+    返回{检查项: 不一致的次数}，局面评估允许tolerance的相对误差。
+    """
+    from .ai import EnhancedMinimaxAI, PatternAI
+    from .board import Board
+
+    mismatches = {
+        "check_win": 0,
+        "evaluate_direction": 0,
+        "evaluate_position": 0,
+        "candidate_positions": 0,
+        "evaluate_board": 0,
+        "scan_threats": 0,
+    }
+
+    def versions(function):
+        return (function, _python(function)) if BACKEND == "numba" else (function,)
+
+    def close(a, b):
+        return abs(a - b) <= tolerance * max(1.0, abs(a), abs(b))
+
+    for size, rule, board in _random_positions(positions, seed):
+        cells = np.array(board, np.int8).reshape(-1)
+        reference = Board(size, rule)
+        for row in range(size):
+            for col in range(size):
+                if board[row][col]:
+                    reference.place_stone(row, col, board[row][col])
+        pattern_ai = PatternAI(size)
+        pattern, block = score_tables(pattern_ai)
+
+        for row in range(size):
+            for col in range(size):
+                stone = board[row][col]
+                if stone:
+                    expected = reference.check_win(row, col, stone)
+                    exact = rule == "renju" and stone == 1
+                    for fn in versions(check_win):
+                        mismatches["check_win"] += (
+                            fn(cells, size, row, col, stone, exact) != expected
+                        )
+                    continue
+                for player in (1, 2):
+                    expected = pattern_ai.evaluate_position(board, row, col, player)
+                    for fn in versions(evaluate_position):
+                        mismatches["evaluate_position"] += (
+                            fn(cells, size, row, col, player, pattern, block) != expected
+                        )
+                    for d in range(4):
+                        expected = pattern_ai._evaluate_direction(
+                            board, row, col, _DR[d], _DC[d], player
+                        )
+                        for fn in versions(evaluate_direction):
+                            mismatches["evaluate_direction"] += (
+                                fn(cells, size, row, col, _DR[d], _DC[d], player, pattern)
+                                != expected
+                            )
+
+        if not any(any(row) for row in board):
+            continue
+        ai = EnhancedMinimaxAI(size)
+        ai.use_accel = False  # 纯Python实现
+        ai.rule = rule
+        ai._start_search([row[:] for row in board])
+        arrays = SearchArrays(board, ai._stones, ai.pattern_ai)
+        expected_candidates = set(ai._get_candidate_positions(board))
+        expected_values = [ai._evaluate_board(board, player) for player in (1, 2)]
+        exact = ai._renju is not None
+        for mover in (1, 2):
+            expected = [sorted(found) for found in ai._scan_threats(board, mover)]
+            mismatches["scan_threats"] += list(arrays.threats(mover, exact)) != expected
+            for fn in versions(threat_cells):
+                found, flags = fn(
+                    arrays.cells, size, arrays.stones, arrays.count, mover, exact
+                )
+                lists = [
+                    [divmod(int(cell), size) for cell, flag in zip(found, flags) if flag & bit]
+                    for bit in (FIVE, FOUR, THREE, OPP_FIVE, OPP_FOUR)
+                ]
+                mismatches["scan_threats"] += lists != expected
+        mismatches["candidate_positions"] += (
+            set(arrays.candidates(ai._windows.cell_live)) != expected_candidates
+        )
+        for player, expected in zip((1, 2), expected_values):
+            for fn in versions(evaluate_board):
+                value = fn(
+                    arrays.cells,
+                    size,
+                    arrays.stones,
+                    arrays.count,
+                    player,
+                    arrays.pattern,
+                    arrays.block,
+                    arrays.empty_values,
+                    arrays.empty_total,
+                    arrays.attack,
+                    arrays.defense,
+                )
+                mismatches["evaluate_board"] += not close(value, expected)
+    return mismatches
+
+
+def bench(size=15, stones=(8, 20, 40), depth=3, repeat=3):
+    """比较两种实现: 每次局面评估的微秒数和每步搜索的毫秒数
+
+    返回{(棋子数, "evaluate"或"search"): (纯Python, numba)}。
+    """
+    import time
+
+    from .ai import EnhancedMinimaxAI, load_accel
+    from .bench import make_position
+
+    load_accel()  # 搜索只在编译完成后使用加速
+    results = {}
+    for count in stones:
+        game = make_position(size, count)
+        board = [row[:] for row in game.board.board]
+        ai = EnhancedMinimaxAI(size, depth=depth)
+        ai._start_search(board)
+        arrays = SearchArrays(board, ai._stones, ai.pattern_ai)
+        arrays.evaluate(1)  # 编译或载入缓存
+        ai._arrays = None
+        timings = []
+        for evaluate in (lambda: ai._evaluate_board(board, 1), lambda: arrays.evaluate(1)):
+            start = time.perf_counter()
+            for _ in range(200):
+                evaluate()
+            timings.append((time.perf_counter() - start) / 200 * 1e6)
+        results[(count, "evaluate")] = tuple(timings)
+
+        timings = []
+        for accelerated in (False, True):
+            ai.use_accel = accelerated
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                ai.get_move(game)
+                best = min(best, time.perf_counter() - start)
+            timings.append(best * 1000)
+        results[(count, "search")] = tuple(timings)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="numba加速的一致性检查和性能比较")
+    commands = parser.add_subparsers(dest="command", required=True)
+    check_parser = commands.add_parser("check", help="与纯Python实现逐项对比")
+    check_parser.add_argument("--positions", type=int, default=200)
+    check_parser.add_argument("--seed", type=int, default=0)
+    bench_parser = commands.add_parser("bench", help="比较局面评估和搜索用时")
+    bench_parser.add_argument("--size", type=int, default=15)
+    bench_parser.add_argument("--depth", type=int, default=3)
+    args = parser.parse_args()
+
+    if np is None:
+        sys.exit("需要安装numpy")
+    print(f"后端: {BACKEND}")
+    if args.command == "check":
+        mismatches = check_parity(args.positions, args.seed)
+        for name, count in mismatches.items():
+            print(f"{name}: {'一致' if not count else f'{count}处不一致'}")
+        sys.exit(1 if any(mismatches.values()) else 0)
+    else:
+        if BACKEND != "numba":
+            sys.exit("没有安装numba(或设置了GOMOKU_ACCEL=python)")
+        for (count, kind), (python, fast) in bench(args.size, depth=args.depth).items():
+            unit = "微秒/次" if kind == "evaluate" else "毫秒/步"
+            label = "局面评估" if kind == "evaluate" else f"深度{args.depth}搜索"
+            print(
+                f"{count}子 {label}: 纯Python {python:.1f}{unit} "
+                f"numba {fast:.1f}{unit} 加速{python / fast:.1f}倍"
+            )
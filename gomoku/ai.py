@@ -1,6 +1,102 @@
+import json
+import math
+import os
 import random
 import copy
+import heapq
+import importlib.util
+import threading
 import time
+import warnings
+
+from .board import (
+    RULE_FREESTYLE,
+    RULE_RENJU,
+    LiveWindows,
+    get_neighbor_table,
+    get_zobrist_table,
+)
+from .renju import RenjuDetector
+from .solver import solve_position
+from .timeman import TimeManager
+
+# 置换表条目(深度, 分数, 最佳着手, 分数类型)中的分数类型
+TT_EXACT = 0  # 准确值
+TT_LOWER = 1  # 下界(发生了beta剪枝)
+TT_UPPER = 2  # 上界(所有着手都不超过alpha)
+
+# 安装了numba时搜索使用accel.py中编译的函数，环境变量GOMOKU_ACCEL=python时使用纯Python实现。
+# 第一次需要时在后台线程中导入和编译，完成之前搜索照常使用纯Python实现，编译不占用搜索预算
+USE_ACCEL = (
+    os.environ.get("GOMOKU_ACCEL") != "python"
+    and importlib.util.find_spec("numba") is not None
+)
+_accel = None  # 核心函数已经编译好的accel模块
+_accel_thread = None
+
+
+def load_accel():
+    """在当前线程中导入accel并编译核心函数，返回accel模块(numba不可用时返回None)"""
+    global _accel
+    if _accel is None and USE_ACCEL:
+        from . import accel
+
+        if accel.BACKEND == "numba":
+            accel.warm_up()
+            _accel = accel
+    return _accel
+
+
+def _get_accel():
+    """编译好的accel模块，还没准备好时启动后台编译并返回None"""
+    global _accel_thread
+    if _accel is None and _accel_thread is None:
+        _accel_thread = threading.Thread(
+            target=load_accel, name="gomoku-accel", daemon=True
+        )
+        _accel_thread.start()
+    return _accel
+
+
+# 局面评估的默认参数: 棋形分数和三个权重
+DEFAULT_WEIGHTS = {
+    "patterns": [
+        (5, 0, 100000),  # 五连(胜利)
+        (4, 2, 10000),  # 活四
+        (4, 1, 1000),  # 冲四
+        (3, 2, 1000),  # 活三
+        (3, 1, 100),  # 眠三
+        (2, 2, 100),  # 活二
+        (2, 1, 10),  # 眠二
+        (1, 2, 10),  # 活一
+        (1, 1, 1),  # 眠一
+    ],
+    "block": 0.8,  # 空位上对手威胁棋形的防守权重
+    "attack": 0.8,  # 局面评估中己方分数的权重
+    "defense": 0.84,  # 局面评估中对方分数的权重，高于己方，优先考虑防守
+}
+# 防守分只计对手的这些棋形: 五连、活四、冲四、活三
+THREAT_PATTERNS = {(5, 0), (4, 2), (4, 1), (3, 2)}
+# tuning.py调优得到的权重文件，存在时在导入时载入
+WEIGHTS_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "eval_weights.json"
+)
+
+
+def load_eval_weights(path=WEIGHTS_FILE):
+    """读取评估权重文件，文件不存在或格式不对时使用默认权重"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            weights = json.load(f)
+        return {key: weights[key] for key in DEFAULT_WEIGHTS}
+    except FileNotFoundError:
+        return DEFAULT_WEIGHTS
+    except (ValueError, KeyError, TypeError) as e:
+        warnings.warn(f"评估权重文件无效，使用默认权重: {e}", stacklevel=2)
+        return DEFAULT_WEIGHTS
+
+
+EVAL_WEIGHTS = load_eval_weights()
 
 
 class AI:
@@ -10,6 +106,10 @@ class AI:
         self.board_size = board_size
         self.name = "AI"
 
+    def set_board_size(self, board_size):
+        """切换棋盘大小，get_move会根据当前对局自动调用"""
+        self.board_size = board_size
+
     def get_move(self, game):
         """获取AI的落子位置，由子类实现"""
         pass
@@ -24,10 +124,15 @@ class RandomAI(AI):
 
     def get_move(self, game):
         """随机选择一个空位落子"""
+        self.set_board_size(game.board.size)
+        black = game.current_player == 1
         empty_positions = []
         for row in range(self.board_size):
             for col in range(self.board_size):
                 if game.board.board[row][col] == 0:
+                    # 连珠规则下黑棋跳过禁手
+                    if black and game.board.is_forbidden(row, col):
+                        continue
                     empty_positions.append((row, col))
 
         # 如果有空位，随机选择一个
@@ -39,24 +144,34 @@ class RandomAI(AI):
 class PatternAI(AI):
     """中级AI - 模式匹配"""
 
-    def __init__(self, board_size=15):
+    def __init__(self, board_size=15, weights=None):
         super().__init__(board_size)
         self.name = "中级AI"
+        self._empty_cell_values = {}  # (棋盘大小, 棋形分数) -> 空棋盘上各位置的分数
+        self.set_weights(EVAL_WEIGHTS if weights is None else weights)
 
-        # 定义评分模式
+    def set_weights(self, weights):
+        """设置棋形分数和评估权重，weights的格式与DEFAULT_WEIGHTS相同"""
         # 格式: (连子数, 两端是否开放, 分数)
         # 两端开放: 2表示两端都开放, 1表示一端开放, 0表示两端都不开放
-        self.patterns = [
-            (5, 0, 100000),  # 五连(胜利)
-            (4, 2, 10000),  # 活四
-            (4, 1, 1000),  # 冲四
-            (3, 2, 1000),  # 活三
-            (3, 1, 100),  # 眠三
-            (2, 2, 100),  # 活二
-            (2, 1, 10),  # 眠二
-            (1, 2, 10),  # 活一
-            (1, 1, 1),  # 眠一
-        ]
+        self.patterns = [tuple(pattern) for pattern in weights["patterns"]]
+        self.block_weight = weights["block"]
+        self.attack_weight = weights["attack"]
+        self.defense_weight = weights["defense"]
+
+        # (连子数, 开放端数) -> 分数，取第一个匹配的棋形(开放端数不少于棋形要求)
+        self._pattern_scores = {}
+        self._block_scores = {}  # 对手在该点的威胁棋形 -> 防守分
+        for count in range(1, 6):
+            for open_ends in range(3):
+                for pattern_count, pattern_open_ends, score in self.patterns:
+                    if count == pattern_count and open_ends >= pattern_open_ends:
+                        self._pattern_scores[(count, open_ends)] = score
+                        if (pattern_count, pattern_open_ends) in THREAT_PATTERNS:
+                            self._block_scores[(count, open_ends)] = (
+                                score * self.block_weight
+                            )
+                        break
 
     def evaluate_position(self, board, row, col, player):
         """评估特定位置的分数"""
@@ -66,25 +181,44 @@ class PatternAI(AI):
         # 设置方向: 水平、垂直、两个对角线
         directions = [(0, 1), (1, 0), (1, 1), (1, -1)]
         total_score = 0
+        opponent = 3 - player  # 1->2, 2->1
 
         # 在每个方向上评估棋形
         for dr, dc in directions:
             # 评估我方棋形
-            my_score = self._evaluate_direction(board, row, col, dr, dc, player)
-            total_score += my_score
-
-            # 评估对手棋形(防守分)，给予较高权重
-            opponent = 3 - player  # 1->2, 2->1
-            opponent_score = self._evaluate_direction(board, row, col, dr, dc, opponent)
+            total_score += self._evaluate_direction(board, row, col, dr, dc, player)
 
-            # 如果对手有威胁，增加此位置的防守价值
-            if opponent_score >= 1000:  # 对手有冲四或活三
-                total_score += opponent_score * 0.8  # 防守权重
+            # 如果对手有冲四、活三及以上的威胁，增加此位置的防守价值
+            count, open_ends = self.scan_direction(board, row, col, dr, dc, opponent)
+            total_score += self._block_scores.get((count, open_ends), 0)
 
         return total_score
 
+    def get_empty_cell_values(self):
+        """返回(空棋盘上各位置的分数列表, 分数总和)，按棋盘大小和棋形分数缓存
+
+        八个相邻点都为空的位置在各方向上只能构成活一或眠一，分数只与到边界的距离
+        有关，而且对黑白双方相同，因此可以直接使用空棋盘上的分数。
+        """
+        key = (self.board_size, tuple(self.patterns))
+        if key not in self._empty_cell_values:
+            size = self.board_size
+            board = [[0] * size for _ in range(size)]
+            values = [
+                self.evaluate_position(board, row, col, 1)
+                for row in range(size)
+                for col in range(size)
+            ]
+            self._empty_cell_values[key] = (values, sum(values))
+        return self._empty_cell_values[key]
+
     def _evaluate_direction(self, board, row, col, dr, dc, player):
         """评估某一方向上的棋形"""
+        count, open_ends = self.scan_direction(board, row, col, dr, dc, player)
+        return self._pattern_scores.get((count, open_ends), 0)
+
+    def scan_direction(self, board, row, col, dr, dc, player):
+        """player下在(row, col)后该方向上的(连子数, 开放端数)"""
         count = 1  # 连子数(包括当前位置)
         open_ends = 0  # 开放端数
 
@@ -118,15 +252,11 @@ class PatternAI(AI):
         if 0 <= r < self.board_size and 0 <= c < self.board_size and board[r][c] == 0:
             open_ends += 1
 
-        # 根据模式评分
-        for pattern_count, pattern_open_ends, score in self.patterns:
-            if count == pattern_count and open_ends >= pattern_open_ends:
-                return score
-
-        return 0
+        return count, open_ends
 
     def get_move(self, game):
         """根据棋形评分选择最佳位置"""
+        self.set_board_size(game.board.size)
         best_score = -1
         best_move = None
 
@@ -138,7 +268,10 @@ class PatternAI(AI):
             for col in range(self.board_size):
                 if board[row][col] == 0:
                     score = self.evaluate_position(board, row, col, game.current_player)
-                    if score > best_score:
+                    # 只有可能成为最佳位置时才检查禁手
+                    if score > best_score and not (
+                        game.current_player == 1 and game.board.is_forbidden(row, col)
+                    ):
                         best_score = score
                         best_move = (row, col)
 
@@ -147,7 +280,9 @@ class PatternAI(AI):
             empty_positions = []
             for row in range(self.board_size):
                 for col in range(self.board_size):
-                    if board[row][col] == 0:
+                    if board[row][col] == 0 and not (
+                        game.current_player == 1 and game.board.is_forbidden(row, col)
+                    ):
                         empty_positions.append((row, col))
             if empty_positions:
                 best_move = random.choice(empty_positions)
@@ -158,30 +293,182 @@ class PatternAI(AI):
 class EnhancedMinimaxAI(AI):
     """高级AI - 使用优化的Minimax算法"""
 
-    def __init__(self, board_size=15, depth=2):
+    def __init__(
+        self,
+        board_size=15,
+        depth=2,
+        max_nodes=None,
+        time_limit=None,
+        temperature=0,
+        quiescence_nodes=2000,
+        quiescence_threes=False,
+        solver_nodes=0,
+        evaluator=None,
+        shared_table=None,
+        time_manager=None,
+    ):
         super().__init__(board_size)
         self.name = "高级AI"
         self.depth = depth
+        self.rule = RULE_FREESTYLE
         self.pattern_ai = PatternAI(board_size)
         self.transposition_table = {}  # 置换表，存储已搜索过的状态
+        # 多个进程共用的置换表(如shared_tt.SharedTranspositionTable)，由调用方负责清空；
+        # None时每次搜索使用新的dict
+        self.shared_table = shared_table
+        # 对局计时时按棋钟分配每步用时的timeman.TimeManager，None时不看棋钟
+        self.time_manager = time_manager
+
+        # 搜索预算，超出后剩余节点直接使用静态评估
+        self.max_nodes = max_nodes  # 每次搜索的节点数上限
+        self.time_limit = time_limit  # 每次搜索的时间上限(秒)
+        self.nodes = 0
+        self.deadline = None
+        # 选点温度(分数单位): 大于0时按分数的softmax随机选点，越大越容易下出次优着手
+        self.temperature = temperature
+        self.random = random.Random()
+
+        # 静态搜索: 叶节点上只沿冲四(可选活三)继续搜索，直到局面平静
+        self.quiescence_nodes = quiescence_nodes  # 每次搜索的静态搜索节点上限，0为关闭
+        self.quiescence_threes = quiescence_threes  # 是否也搜索活三及其防守
+        self.quiescence_depth = 8  # 单个叶节点之下的最大层数
+        self.qnodes = 0
+        self.cancel = None  # threading.Event，被设置后搜索尽快结束(用于后台分析)
+        # 走棋前先用df-pn求解连续冲四取胜的节点上限，0为关闭
+        self.solver_nodes = solver_nodes
+        # 可选的批量局面评估器(如neural.NeuralEvaluator)，None时使用手工评估
+        self.evaluator = evaluator
+        self._leaf_values = {}  # 打包评估的叶节点分数，Zobrist哈希 -> player视角的分数
+
+        # 搜索中维护的已落子列表和Zobrist哈希，随落子/撤销增量更新
+        self._stones = []
+        self._hash = 0
+        self._renju = None  # 连珠规则下搜索用的禁手检测器
+        self._windows = None  # 双方的活窗口，用于识别死和局面和无关的空位
+        # 是否在搜索中使用accel.py编译的候选位置、着手排序、威胁扫描和局面评估
+        self.use_accel = USE_ACCEL
+        self._arrays = None  # accel.SearchArrays，与棋盘同步的扁平数组
+
+    def set_board_size(self, board_size):
+        self.board_size = board_size
+        self.pattern_ai.set_board_size(board_size)
+
+    def _start_search(self, board):
+        """开始新的搜索: 重置置换表和预算计数，载入棋盘大小对应的预计算表"""
+        if self.shared_table is None:
+            self.transposition_table = {}
+        else:
+            self.transposition_table = self.shared_table
+        self.nodes = 0
+        self.qnodes = 0
+        self._leaf_values = {}
+        self.deadline = time.time() + self.time_limit if self.time_limit else None
+
+        size = self.board_size
+        self._zobrist = get_zobrist_table(size)
+        self._adjacent = get_neighbor_table(size, 1)
+        self._nearby = get_neighbor_table(size, 2)
+        self._stones = []
+        self._hash = 0
+        self._renju = RenjuDetector(size) if self.rule == RULE_RENJU else None
+        self._windows = LiveWindows(size)
+        for row in range(size):
+            for col in range(size):
+                if board[row][col]:
+                    cell = row * size + col
+                    self._stones.append(cell)
+                    self._hash ^= self._zobrist[cell][board[row][col]]
+                    self._windows.place(row, col, board[row][col])
+                    if self._renju:
+                        self._renju.place(row, col, board[row][col])
+
+        self._arrays = None
+        if self.use_accel and USE_ACCEL:
+            accel = _get_accel()
+            if accel is not None:
+                self._arrays = accel.SearchArrays(board, self._stones, self.pattern_ai)
+
+    def _place(self, board, row, col, player):
+        """搜索中落子"""
+        board[row][col] = player
+        cell = row * self.board_size + col
+        self._stones.append(cell)
+        self._hash ^= self._zobrist[cell][player]
+        self._windows.place(row, col, player)
+        if self._renju:
+            self._renju.place(row, col, player)
+        if self._arrays is not None:
+            self._arrays.place(cell, player)
+
+    def _remove(self, board, row, col):
+        """撤销最后一次_place"""
+        cell = self._stones.pop()
+        player = board[row][col]
+        self._hash ^= self._zobrist[cell][player]
+        self._windows.remove(row, col, player)
+        if self._renju:
+            self._renju.remove(row, col, player)
+        if self._arrays is not None:
+            self._arrays.remove(cell)
+        board[row][col] = 0
+
+    def _is_legal(self, row, col, player):
+        """搜索中的着手是否合法(连珠规则下黑棋不能下禁手)"""
+        return not (self._renju and player == 1 and self._renju.is_forbidden(row, col))
+
+    def _out_of_budget(self):
+        """检查节点数或时间是否已超出预算"""
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            return True
+        if self.cancel is not None and self.cancel.is_set():
+            return True
+        return self.deadline is not None and time.time() >= self.deadline
 
     def get_move(self, game):
         """使用Minimax算法选择最佳位置"""
-        self.transposition_table = {}  # 重置置换表
+        self.set_board_size(game.board.size)
+        self.rule = game.board.rule
+
+        # 只有一个合法候选位置(如空棋盘上的天元)时不必求解或搜索
+        move = self._single_move(game.board.board, game.current_player)
+        if move is not None:
+            return move
+
+        if self.solver_nodes:
+            # 残局预言: 能证明连续冲四取胜时直接走取胜着手，不再搜索
+            result, move = solve_position(
+                game.board.board,
+                game.current_player,
+                self.rule,
+                max_nodes=self.solver_nodes,
+            )
+            if move is not None:
+                return move
+
+        if self.time_manager is not None and game.clock is not None:
+            move = self.time_manager.choose_move(self, game)
+            if move is not None:
+                return move
+
+        if self.temperature > 0:
+            # 需要可比较的分数，每个候选位置都用完整窗口搜索
+            results = self.analyse(
+                game.board.board, game.current_player, rule=self.rule
+            )
+            if results:
+                return self._sample_move(results)
 
         # 复制游戏状态
         board = copy.deepcopy(game.board.board)
         player = game.current_player
+        self._start_search(board)
 
         # 优化: 只考虑棋子周围的空位
         candidates = self._get_candidate_positions(board)
-        if not candidates:
-            # 如果是空棋盘，就下中央位置
-            return (self.board_size // 2, self.board_size // 2)
 
         # 根据启发式评估对候选位置进行排序
         candidates = sorted(
-            candidates,
+            (pos for pos in candidates if self._is_legal(pos[0], pos[1], player)),
             key=lambda pos: self._get_position_heuristic(board, pos[0], pos[1], player),
             reverse=True,
         )
@@ -194,9 +481,9 @@ class EnhancedMinimaxAI(AI):
         # 对每个候选位置应用Minimax
         for row, col in candidates[: min(len(candidates), 10)]:  # 只考虑最佳的10个位置
             if board[row][col] == 0:
-                board[row][col] = player
+                self._place(board, row, col, player)
                 score = self._minimax(board, self.depth - 1, False, player, alpha, beta)
-                board[row][col] = 0  # 撤销移动
+                self._remove(board, row, col)  # 撤销移动
 
                 if score > best_score:
                     best_score = score
@@ -209,13 +496,160 @@ class EnhancedMinimaxAI(AI):
 
         return best_move
 
+    def _single_move(self, board, player):
+        """合法候选位置只有一个时返回它，否则返回None"""
+        if not any(any(row) for row in board):
+            mid = self.board_size // 2
+            return (mid, mid)
+        self._start_search(board)
+        legal = []
+        for row, col in self._get_candidate_positions(board):
+            if self._is_legal(row, col, player):
+                legal.append((row, col))
+                if len(legal) > 1:
+                    return None
+        return legal[0] if legal else None
+
+    def root_moves(self, board, player, max_candidates=10, rule=RULE_FREESTYLE):
+        """按启发式分数排序的前max_candidates个合法候选位置(analyse默认分析的着手)"""
+        board = [row[:] for row in board]
+        self.rule = rule
+        self._start_search(board)
+        candidates = self._get_candidate_positions(board)
+        return sorted(
+            (pos for pos in candidates if self._is_legal(pos[0], pos[1], player)),
+            key=lambda pos: self._get_position_heuristic(board, pos[0], pos[1], player),
+            reverse=True,
+        )[:max_candidates]
+
+    def analyse(
+        self,
+        board,
+        player,
+        max_candidates=10,
+        extra_moves=(),
+        rule=RULE_FREESTYLE,
+        moves=None,
+        top_n=None,
+    ):
+        """分析局面，返回[(分数, (row, col)), ...]，按分数从高到低排列
+
+        与get_move不同，每个候选位置都使用完整窗口搜索，分数可以互相比较。
+        extra_moves中的位置(例如实战着手)即使不在候选列表中也会被评估。
+        moves不为None时只分析这些着手(用于把根节点的着手分给多个进程)。
+        top_n不为None时只返回最好的top_n个着手(multi-PV): 已有top_n个结果后，
+        其余着手以第top_n好的分数为下界搜索，进不了前top_n的着手很快被剪掉。
+        所有着手共用一张置换表。
+        """
+        if moves is None:
+            candidates = self.root_moves(board, player, max_candidates, rule)
+        else:
+            candidates = list(moves)
+        board = [row[:] for row in board]
+        self.rule = rule
+        self._start_search(board)
+        for move in extra_moves:
+            if move not in candidates:
+                candidates.append(move)
+
+        results = []
+        alpha = float("-inf")
+        for row, col in candidates:
+            if board[row][col] != 0:
+                continue
+            self._place(board, row, col, player)
+            score = self._minimax(
+                board, self.depth - 1, False, player, alpha, float("inf")
+            )
+            self._remove(board, row, col)
+            results.append((score, (row, col)))
+            if top_n is not None and len(results) >= top_n:
+                # 不超过alpha的分数只是上界，稳定排序使它们排在同分的准确结果之后
+                alpha = heapq.nlargest(top_n, (score for score, _ in results))[-1]
+
+        results.sort(key=lambda item: item[0], reverse=True)
+        return results if top_n is None else results[:top_n]
+
+    def _sample_move(self, results):
+        """按温度从analyse的结果中随机选点，分数差越大被选中的概率越小"""
+        best = results[0][0]
+        if abs(best) >= 100000:
+            return results[0][1]  # 已经分出胜负时总是下最佳着手
+        weights = [math.exp((score - best) / self.temperature) for score, _ in results]
+        return self.random.choices([move for _, move in results], weights)[0]
+
+    def iter_analyse(
+        self,
+        board,
+        player,
+        max_depth=4,
+        max_candidates=10,
+        rule=RULE_FREESTYLE,
+        cancel=None,
+        top_n=None,
+        time_limit=None,
+    ):
+        """迭代加深分析，每完成一层产生(深度, analyse的结果, 主要变化)
+
+        cancel为threading.Event，被设置后当前这一层的结果不完整，直接结束而不产生结果。
+        top_n为每层只保留的最佳着手数(见analyse)。time_limit为整个分析的时间上限(秒)，
+        超时的那一层同样不完整，直接结束。
+        """
+        saved = self.depth, self.cancel, self.time_limit
+        self.cancel = cancel
+        deadline = time.time() + time_limit if time_limit else None
+        try:
+            for depth in range(1, max_depth + 1):
+                self.depth = depth
+                if deadline is not None:
+                    self.time_limit = max(deadline - time.time(), 1e-3)
+                results = self.analyse(
+                    board, player, max_candidates, rule=rule, top_n=top_n
+                )
+                if cancel is not None and cancel.is_set():
+                    return
+                if deadline is not None and time.time() >= deadline:
+                    return
+                if not results:
+                    return
+                yield depth, results, self._principal_variation(board, player, results)
+                if abs(results[0][0]) >= 100000:
+                    return  # 已经分出胜负，更深的搜索没有意义
+        finally:
+            self.depth, self.cancel, self.time_limit = saved
+
+    def _principal_variation(self, board, player, results):
+        """从最佳着手出发，沿置换表中记录的最佳着手得到主要变化
+
+        必须紧接在analyse之后调用，此时置换表和增量状态都对应分析的局面。
+        """
+        board = [row[:] for row in board]
+        pv = []
+        move = results[0][1]
+        mover = player
+        while move is not None and len(pv) < self.depth:
+            row, col = move
+            if board[row][col] != 0:
+                break
+            self._place(board, row, col, mover)
+            pv.append(move)
+            mover = 3 - mover
+            entry = self.transposition_table.get(self._hash)
+            move = entry[2] if entry else None
+        for row, col in reversed(pv):
+            self._remove(board, row, col)
+        return pv
+
     def _get_position_heuristic(self, board, row, col, player):
         """获取位置的启发式价值，用于排序"""
         if board[row][col] != 0:
             return float("-inf")  # 已经有棋子的位置
 
         # 使用PatternAI的评估函数
-        score = self.pattern_ai.evaluate_position(board, row, col, player)
+        if self._arrays is not None:
+            score = self._arrays.evaluate_position(row, col, player)
+        else:
+            score = self.pattern_ai.evaluate_position(board, row, col, player)
 
         # 增加靠近中心的位置的分数
         center = self.board_size // 2
@@ -225,54 +659,61 @@ class EnhancedMinimaxAI(AI):
         return score + centrality_score
 
     def _get_candidate_positions(self, board):
-        """获取候选位置(棋子周围的空位)"""
-        candidates = set()
-
-        # 寻找已有棋子
-        has_pieces = False
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                if board[row][col] != 0:
-                    has_pieces = True
-                    # 添加周围的空位作为候选
-                    for dr in range(-2, 3):
-                        for dc in range(-2, 3):
-                            r, c = row + dr, col + dc
-                            if (
-                                0 <= r < self.board_size
-                                and 0 <= c < self.board_size
-                                and board[r][c] == 0
-                            ):
-                                candidates.add((r, c))
+        """获取候选位置(棋子周围两格内的空位)
 
+        不在任何一方的活窗口中的空位落子对胜负没有影响，不作为候选；
+        只剩这样的空位时(局面接近死和)仍返回全部空位。
+        """
         # 如果棋盘为空，返回中心位置
-        if not has_pieces:
+        if not self._stones:
             mid = self.board_size // 2
             return [(mid, mid)]
+        if self._arrays is not None:
+            return self._arrays.candidates(self._windows.cell_live)
 
-        return list(candidates)
-
-    def _board_to_key(self, board):
-        """将棋盘转换为可哈希的键值(用于置换表)"""
-        return "".join("".join(str(cell) for cell in row) for row in board)
+        # 只遍历已有棋子的邻点表，与棋盘大小无关
+        candidates = set()
+        for cell in self._stones:
+            for r, c in self._nearby[cell]:
+                if board[r][c] == 0:
+                    candidates.add((r, c))
+        live = [pos for pos in candidates if self._windows.is_live_cell(*pos)]
+        return live or list(candidates)
 
     def _minimax(self, board, depth, is_maximizing, player, alpha, beta):
         """Minimax算法实现，带Alpha-Beta剪枝和置换表"""
         opponent = 3 - player  # 1->2, 2->1
 
-        # 生成棋盘的键
-        board_key = self._board_to_key(board)
-
-        # 查找置换表
-        if board_key in self.transposition_table:
-            stored_depth, stored_value = self.transposition_table[board_key]
-            if stored_depth >= depth:
+        # 增量维护的Zobrist哈希作为置换表的键
+        board_key = self._hash
+
+        # 查找置换表(只读一次，共享置换表中的条目可能随时被其他进程改写)
+        # 窗口外的分数只是上界/下界，只有足以在当前窗口下剪枝时才直接使用
+        entry = self.transposition_table.get(board_key)
+        if entry is not None and entry[0] >= depth:
+            stored_value, bound = entry[1], entry[3]
+            if (
+                bound == TT_EXACT
+                or (bound == TT_LOWER and stored_value >= beta)
+                or (bound == TT_UPPER and stored_value <= alpha)
+            ):
                 return stored_value
 
-        # 判断终止条件
-        if depth == 0:
+        # 双方都不可能再连成五: 死和
+        if self._windows.is_dead():
+            return 0
+
+        # 判断终止条件(预算用完时也直接评估)
+        self.nodes += 1
+        if self._out_of_budget():
             eval_score = self._evaluate_board(board, player)
-            self.transposition_table[board_key] = (depth, eval_score)
+            self.transposition_table[board_key] = (0, eval_score, None, TT_EXACT)
+            return eval_score
+        if depth == 0:
+            eval_score = self._quiescence(
+                board, is_maximizing, player, alpha, beta, self.quiescence_depth
+            )
+            self._store(board_key, 0, eval_score, None, alpha, beta)
             return eval_score
 
         # 获取最佳候选位置
@@ -296,111 +737,287 @@ class EnhancedMinimaxAI(AI):
                 reverse=True,
             )
 
+        if depth == 1 and self.evaluator is not None:
+            self._prefetch_leaves(
+                board, candidates, player if is_maximizing else opponent, player
+            )
+
+        window = alpha, beta  # 子节点搜索会收窄alpha/beta，存入置换表时按原窗口判断
         if is_maximizing:
             max_eval = float("-inf")
+            best_move = None
             for row, col in candidates:
-                if board[row][col] == 0:
-                    board[row][col] = player
+                if board[row][col] == 0 and self._is_legal(row, col, player):
+                    self._place(board, row, col, player)
                     eval_score = self._minimax(
                         board, depth - 1, False, player, alpha, beta
                     )
-                    board[row][col] = 0
-                    max_eval = max(max_eval, eval_score)
+                    self._remove(board, row, col)
+                    if eval_score > max_eval:
+                        max_eval = eval_score
+                        best_move = (row, col)
                     alpha = max(alpha, eval_score)
                     if beta <= alpha:
                         break  # Beta剪枝
 
             # 存储结果到置换表
-            self.transposition_table[board_key] = (depth, max_eval)
+            self._store(board_key, depth, max_eval, best_move, *window)
             return max_eval
         else:
             min_eval = float("inf")
+            best_move = None
             for row, col in candidates:
-                if board[row][col] == 0:
-                    board[row][col] = opponent
+                if board[row][col] == 0 and self._is_legal(row, col, opponent):
+                    self._place(board, row, col, opponent)
                     eval_score = self._minimax(
                         board, depth - 1, True, player, alpha, beta
                     )
-                    board[row][col] = 0
-                    min_eval = min(min_eval, eval_score)
+                    self._remove(board, row, col)
+                    if eval_score < min_eval:
+                        min_eval = eval_score
+                        best_move = (row, col)
                     beta = min(beta, eval_score)
                     if beta <= alpha:
                         break  # Alpha剪枝
 
             # 存储结果到置换表
-            self.transposition_table[board_key] = (depth, min_eval)
+            self._store(board_key, depth, min_eval, best_move, *window)
             return min_eval
 
+    def _store(self, key, depth, value, best_move, alpha, beta):
+        """存入置换表，按搜索窗口记录分数是准确值、上界还是下界"""
+        if value <= alpha:
+            bound = TT_UPPER
+        elif value >= beta:
+            bound = TT_LOWER
+        else:
+            bound = TT_EXACT
+        self.transposition_table[key] = (depth, value, best_move, bound)
+
+    def _prefetch_leaves(self, board, moves, mover, player):
+        """把mover所有着手之后的局面一次交给evaluator评估，分数按子局面的哈希暂存"""
+        size = self.board_size
+        scores = self.evaluator.score_moves(board, moves, mover)
+        sign = 1 if mover != player else -1  # 评估器给出的是下一个走子方视角的分数
+        for (row, col), score in zip(moves, scores):
+            key = self._hash ^ self._zobrist[row * size + col][mover]
+            self._leaf_values[key] = sign * score
+
+    def _scan_threats(self, board, mover):
+        """扫描与棋子相邻的空位，找出双方的威胁点
+
+        返回(走子方成五点, 走子方冲四点, 走子方活三点, 对方成五点, 对方活四点)。
+        与评估函数一致，只识别连续的棋形。连珠规则下黑棋只有恰好五子才算成五。
+        """
+        if self._arrays is not None:
+            return self._arrays.threats(mover, self._renju is not None)
+        scan = self.pattern_ai.scan_direction
+        opponent = 3 - mover
+        exact = {1: self._renju is not None, 2: False}
+        fives, fours, threes, opp_fives, opp_fours = [], [], [], [], []
+
+        near = set()
+        for cell in self._stones:
+            near.update(self._adjacent[cell])
+        for row, col in near:
+            if board[row][col] != 0:
+                continue
+            five = four = three = opp_five = opp_four = False
+            for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                count, open_ends = scan(board, row, col, dr, dc, mover)
+                if count == 5 or (count > 5 and not exact[mover]):
+                    five = True
+                elif count == 4 and open_ends:
+                    four = True
+                elif count == 3 and open_ends == 2:
+                    three = True
+                count, open_ends = scan(board, row, col, dr, dc, opponent)
+                if count == 5 or (count > 5 and not exact[opponent]):
+                    opp_five = True
+                elif count == 4 and open_ends == 2:
+                    opp_four = True
+            if five:
+                fives.append((row, col))
+            elif four:
+                fours.append((row, col))
+            elif three:
+                threes.append((row, col))
+            if opp_five:
+                opp_fives.append((row, col))
+            elif opp_four:
+                opp_fours.append((row, col))
+        return fives, fours, threes, opp_fives, opp_fours
+
+    def _quiescence(self, board, is_maximizing, player, alpha, beta, depth):
+        """静态搜索: 只考虑成五、冲四(可选活三)和必须的防守，局面平静时返回静态评估"""
+        mover = player if is_maximizing else 3 - player
+        win = 100000 if is_maximizing else -100000  # 走子方获胜时的分数(player视角)
+        if self.quiescence_nodes <= 0:
+            return self._evaluate_board(board, player)
+        self.qnodes += 1
+
+        fives, fours, threes, opp_fives, opp_fours = self._scan_threats(board, mover)
+        if any(self._is_legal(row, col, mover) for row, col in fives):
+            return win
+        if opp_fives:
+            # 对方下一手成五，只能防守；两个以上的成五点挡不住
+            if len(opp_fives) > 1 or not self._is_legal(*opp_fives[0], mover):
+                return -win
+            moves = opp_fives
+            stand_pat = None
+        else:
+            moves = [pos for pos in fours if self._is_legal(pos[0], pos[1], mover)]
+            stand_pat = self._evaluate_board(board, player)
+            if self.quiescence_threes:
+                if opp_fours:
+                    # 对方有活三时不能停在这里，要么冲四，要么阻止对方成活四
+                    stand_pat = None
+                    moves += opp_fours
+                else:
+                    moves += threes
+                moves = [pos for pos in moves if self._is_legal(pos[0], pos[1], mover)]
+
+        if (
+            depth == 0
+            or not moves
+            or self.qnodes >= self.quiescence_nodes
+            or self._out_of_budget()
+        ):
+            # 达到上限或没有威胁可走: 直接评估(被迫防守时也只能评估)
+            return (
+                self._evaluate_board(board, player) if stand_pat is None else stand_pat
+            )
+
+        best = stand_pat
+        if best is not None:
+            if is_maximizing:
+                alpha = max(alpha, best)
+            else:
+                beta = min(beta, best)
+            if beta <= alpha:
+                return best
+        for row, col in moves:
+            self._place(board, row, col, mover)
+            score = self._quiescence(
+                board, not is_maximizing, player, alpha, beta, depth - 1
+            )
+            self._remove(board, row, col)
+            if is_maximizing:
+                if best is None or score > best:
+                    best = score
+                alpha = max(alpha, score)
+            else:
+                if best is None or score < best:
+                    best = score
+                beta = min(beta, score)
+            if beta <= alpha:
+                break
+        return best
+
     def _evaluate_board(self, board, player):
-        """评估整个棋盘状态"""
+        """评估整个棋盘状态
+
+        只检查已有棋子是否构成五连，并逐个评估与棋子相邻的空位；
+        其余空位的分数取自按棋盘大小预先计算的空棋盘分数表。
+        """
+        if self._arrays is not None and self.evaluator is None:
+            return self._arrays.evaluate(player)
+        size = self.board_size
+
+        # 检查是否有胜者(按行优先顺序，与逐格扫描的结果一致)
+        stones = sorted(self._stones)
+        for cell in stones:
+            row, col = divmod(cell, size)
+            stone = board[row][col]
+            # 检查水平、垂直、对角线方向是否有五连珠
+            for dr, dc in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+                count = 1
+                for i in range(1, 5):
+                    r, c = row + dr * i, col + dc * i
+                    if 0 <= r < size and 0 <= c < size and board[r][c] == stone:
+                        count += 1
+                    else:
+                        break
+                if count >= 5:
+                    return 100000 if stone == player else -100000  # 胜利/失败
+
+        if self.evaluator is not None:
+            score = self._leaf_values.get(self._hash)
+            if score is None:
+                # 没有打包评估过的局面(如静态搜索中的节点)单独评估
+                mover = 1 if len(stones) % 2 == 0 else 2
+                score = self.evaluator.score_board(board, mover)
+                score = score if mover == player else -score
+            return score
+
+        # 评估双方的形势
         opponent = 3 - player
+        empty_values, far_score = self.pattern_ai.get_empty_cell_values()
+        for cell in stones:
+            far_score -= empty_values[cell]
 
-        # 检查是否有胜者
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                if board[row][col] == player:
-                    # 检查水平、垂直、对角线方向是否有五连珠
-                    for dr, dc in [(0, 1), (1, 0), (1, 1), (1, -1)]:
-                        count = 1
-                        for i in range(1, 5):
-                            r, c = row + dr * i, col + dc * i
-                            if (
-                                0 <= r < self.board_size
-                                and 0 <= c < self.board_size
-                                and board[r][c] == player
-                            ):
-                                count += 1
-                            else:
-                                break
-                        if count >= 5:
-                            return 100000  # 胜利
-                elif board[row][col] == opponent:
-                    # 检查对手是否有五连珠
-                    for dr, dc in [(0, 1), (1, 0), (1, 1), (1, -1)]:
-                        count = 1
-                        for i in range(1, 5):
-                            r, c = row + dr * i, col + dc * i
-                            if (
-                                0 <= r < self.board_size
-                                and 0 <= c < self.board_size
-                                and board[r][c] == opponent
-                            ):
-                                count += 1
-                            else:
-                                break
-                        if count >= 5:
-                            return -100000  # 失败
+        near = set()
+        for cell in stones:
+            near.update(self._adjacent[cell])
 
-        # 评估双方的形势
         my_score = 0
         opp_score = 0
-
-        # 快速模式匹配：统计各种棋形
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                if board[row][col] == 0:  # 空位
-                    # 评估如果我方下在这里
-                    my_score += (
-                        self.pattern_ai.evaluate_position(board, row, col, player) * 0.8
-                    )
-
-                    # 评估如果对手下在这里
-                    opp_score += (
-                        self.pattern_ai.evaluate_position(board, row, col, opponent)
-                        * 0.7
-                    )
-
-        # 返回综合评分，优先考虑防守
-        return my_score - opp_score * 1.2  # 给对手的威胁更高的权重
+        for row, col in near:
+            if board[row][col] == 0:
+                far_score -= empty_values[row * size + col]
+                # 评估如果我方/对手下在这里
+                my_score += self.pattern_ai.evaluate_position(board, row, col, player)
+                opp_score += self.pattern_ai.evaluate_position(
+                    board, row, col, opponent
+                )
+
+        my_score = (my_score + far_score) * self.pattern_ai.attack_weight
+        opp_score = (opp_score + far_score) * self.pattern_ai.defense_weight
+
+        # 返回综合评分，对手的分数权重更高(优先考虑防守)
+        return my_score - opp_score
+
+
+# 难度级别: 同一个搜索引擎，用搜索深度、节点/时间预算和选点温度区分强弱。
+# 对局计时时按棋钟分配用时，迭代加深到该级别的搜索深度为止。
+# 每一级的Elo和平均每步用时由 python -m gomoku.arena --calibrate 测得。
+AI_LEVELS = {
+    1: {
+        "name": "初级AI",
+        "depth": 2,
+        "max_nodes": 150,
+        "time_limit": 0.3,
+        "temperature": 2000,
+    },
+    2: {
+        "name": "中级AI",
+        "depth": 2,
+        "max_nodes": 600,
+        "time_limit": 0.6,
+        "temperature": 400,
+    },
+    3: {
+        "name": "高级AI",
+        "depth": 3,
+        "max_nodes": 3000,
+        "time_limit": 1.5,
+        "temperature": 0,
+        "solver_nodes": 2000,
+    },
+}
 
 
 def get_ai_by_level(level, board_size=15):
-    """根据难度级别获取相应的AI实例"""
-    if level == 1:
-        return RandomAI(board_size)
-    elif level == 2:
-        return PatternAI(board_size)
-    elif level == 3:
-        return EnhancedMinimaxAI(board_size)
-    else:
-        return RandomAI(board_size)  # 默认使用随机AI
+    """根据难度级别获取相应的AI实例(未知级别按初级处理)"""
+    settings = AI_LEVELS.get(level, AI_LEVELS[1])
+    ai = EnhancedMinimaxAI(
+        board_size,
+        depth=settings["depth"],
+        max_nodes=settings["max_nodes"],
+        time_limit=settings["time_limit"],
+        temperature=settings["temperature"],
+        solver_nodes=settings.get("solver_nodes", 0),
+        time_manager=TimeManager(max_depth=settings["depth"]),
+    )
+    ai.name = settings["name"]
+    return ai
@@ -0,0 +1,247 @@
+"""棋谱批量分析
+
+依次读取历史记录中的每一局，用EnhancedMinimaxAI在固定的节点/时间预算下
+分析每一手之前的局面，把局面评估、最佳候选着手和恶手标记作为注释写入原SGF
+主变化的节点中；棋谱的其他属性、已有的注释和变化都原样保留，重新分析时替换上一次的注释。
+局面分析分发到进程池中并行执行；每个局面的结果按Zobrist哈希写入缓存文件，
+中断后重新运行时已分析过的局面会直接跳过。
+"""
+
+import json
+import os
+from collections import deque
+from multiprocessing import Pool
+
+from .ai import EnhancedMinimaxAI
+from .board import RULE_FREESTYLE, get_zobrist_table
+from .sgf import (
+    get_rule,
+    get_sgf_compression,
+    get_sgf_files,
+    insert_move_comments,
+    iter_sgf_games,
+    open_sgf_stream,
+)
+
+ANNOTATION_MARKER = "评估(黑方视角): "  # 分析注释的开头，用于识别上一次写入的注释
+BLUNDER_THRESHOLD = 3000  # 实战着手比最佳着手差这么多分即视为恶手
+WIN_SCORE = 100000
+
+# 工作进程中按参数缓存的AI实例
+_worker_ai = None
+
+
+def position_key(board, player, rule=RULE_FREESTYLE):
+    """局面缓存的键: 棋盘大小 + Zobrist哈希 + 走子方(连珠规则再加上规则名)"""
+    size = len(board)
+    table = get_zobrist_table(size)
+    h = 0
+    for row in range(size):
+        for col in range(size):
+            if board[row][col]:
+                h ^= table[row * size + col][board[row][col]]
+    key = f"{size}:{h:016x}:{player}"
+    return key if rule == RULE_FREESTYLE else f"{key}:{rule}"
+
+
+def format_move(move):
+    """着手转换为"H8"形式的文字(列用字母，行用数字)"""
+    row, col = move
+    return f"{chr(ord('A') + col)}{row + 1}"
+
+
+def _init_worker(depth, max_nodes, time_limit):
+    global _worker_ai
+    _worker_ai = EnhancedMinimaxAI(
+        depth=depth, max_nodes=max_nodes, time_limit=time_limit
+    )
+
+
+def _analyse_position(task):
+    """在工作进程中分析一个局面，返回(键, 候选着手分数列表)"""
+    key, size, rule, stones, player, played = task
+    board = [[0] * size for _ in range(size)]
+    for row, col, stone in stones:
+        board[row][col] = stone
+    _worker_ai.set_board_size(size)
+    results = _worker_ai.analyse(board, player, extra_moves=[played], rule=rule)
+    return key, [[row, col, score] for score, (row, col) in results]
+
+
+class AnalysisCache:
+    """局面分析结果缓存，以JSON Lines格式追加写入，便于中断后恢复"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 中断时写了一半的行
+                    self.entries[record["key"]] = record["moves"]
+        self.file = open(path, "a", encoding="utf-8")
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, moves):
+        self.entries[key] = moves
+        self.file.write(json.dumps({"key": key, "moves": moves}) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def annotate_move(candidates, played, player, top_n=3):
+    """根据候选着手分数生成一手棋的注释，返回(注释文本, 是否恶手)"""
+    scores = {(row, col): score for row, col, score in candidates}
+    best_score = candidates[0][2]
+    played_score = scores.get(played, best_score)
+    sign = 1 if player == 1 else -1  # 注释中的评估统一为黑方视角
+
+    best_moves = " ".join(
+        f"{format_move((row, col))}({score * sign:+.0f})"
+        for row, col, score in candidates[:top_n]
+    )
+    text = f"{ANNOTATION_MARKER}{played_score * sign:+.0f}\n最佳: {best_moves}"
+
+    blunder = best_score - played_score >= BLUNDER_THRESHOLD or (
+        best_score >= WIN_SCORE > played_score
+    )
+    if blunder:
+        text += f"\n恶手! 应走{format_move(tuple(candidates[0][:2]))}"
+    return text, blunder
+
+
+def _iter_positions(info, moves):
+    """产生一局棋中每一手之前的局面: (手序, 键, (棋盘大小, 规则), 已有棋子, 走子方, 实战着手)"""
+    size = int(str(info.get("SZ", "15")).split(":")[0])
+    rule = get_rule(info)
+    board = [[0] * size for _ in range(size)]
+    for i, (row, col, player) in enumerate(moves):
+        key = position_key(board, player, rule)
+        yield i, key, (size, rule), moves[:i], player, (row, col)
+        board[row][col] = player
+
+
+def analyse_history(
+    directory,
+    cache_path=None,
+    workers=None,
+    depth=2,
+    max_nodes=20000,
+    time_limit=None,
+    top_n=3,
+    progress=None,
+):
+    """分析目录中的所有棋谱并把注释写回SGF，返回(分析的对局数, 恶手数)"""
+    if cache_path is None:
+        cache_path = os.path.join(directory, "analysis_cache.jsonl")
+    cache = AnalysisCache(cache_path)
+    pending = deque()  # [(文件, info, moves, 局面列表, 剩余任务数)]
+    submitted = set()  # 已提交的局面，不同对局中的相同局面只分析一次
+
+    def tasks():
+        """按对局顺序产生缓存中没有的局面，同时登记每局需要等待的任务数"""
+        for sgf_file in get_sgf_files(directory):
+            info, moves = next(iter_sgf_games(sgf_file), ({}, []))
+            positions = list(_iter_positions(info, moves))
+            misses = []
+            for _, key, (size, rule), stones, player, played in positions:
+                if key not in cache and key not in submitted:
+                    submitted.add(key)
+                    misses.append((key, size, rule, stones, player, played))
+            pending.append([sgf_file, info, moves, positions, len(misses)])
+            yield from misses
+
+    games = 0
+    blunders = 0
+
+    def finish_ready_games():
+        nonlocal games, blunders
+        while pending and pending[0][4] == 0:
+            sgf_file, info, moves, positions, _ = pending.popleft()
+            blunders += _write_annotations(sgf_file, positions, cache, top_n)
+            games += 1
+            if progress:
+                progress(games, sgf_file)
+
+    with Pool(
+        workers, initializer=_init_worker, initargs=(depth, max_nodes, time_limit)
+    ) as pool:
+        for key, candidates in pool.imap(_analyse_position, tasks(), chunksize=4):
+            finish_ready_games()
+            cache.put(key, candidates)
+            pending[0][4] -= 1
+        finish_ready_games()
+
+    cache.close()
+    return games, blunders
+
+
+def _write_annotations(sgf_file, positions, cache, top_n):
+    """把缓存中的分析结果写入原SGF的注释，原子替换文件并保留修改时间"""
+    comments = {}
+    blunders = 0
+    for i, key, _, _, player, played in positions:
+        candidates = cache.get(key)
+        if not candidates:
+            continue
+        comments[i], blunder = annotate_move(candidates, played, player, top_n)
+        blunders += blunder
+
+    with open_sgf_stream(sgf_file) as f:
+        original = f.read()
+    if "\ufffd" in original:
+        # 不是UTF-8编码的棋谱，写回会损坏原有的文字
+        print(f"{sgf_file}不是UTF-8编码，跳过写入注释")
+        return blunders
+    sgf_content = insert_move_comments(original, comments, ANNOTATION_MARKER)
+    if sgf_content == original:
+        return blunders
+
+    compression = get_sgf_compression(sgf_file)
+    mtime = os.path.getmtime(sgf_file)
+    tmp_path = sgf_file + ".tmp"
+    # 压缩的棋谱按原来的格式写回
+    with open_sgf_stream(tmp_path, "w", compression) as f:
+        f.write(sgf_content)
+    os.replace(tmp_path, sgf_file)
+    # 历史记录按修改时间排序，写回注释不应改变顺序
+    os.utime(sgf_file, (mtime, mtime))
+    return blunders
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="批量分析历史棋谱，标注恶手")
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "history"),
+    )
+    parser.add_argument("--cache", help="分析缓存文件(默认在棋谱目录中)")
+    parser.add_argument("--workers", type=int, help="进程数(默认等于CPU核数)")
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--nodes", type=int, default=20000, help="每个局面的节点上限")
+    parser.add_argument("--time", type=float, help="每个局面的时间上限(秒)")
+    args = parser.parse_args()
+
+    games, blunders = analyse_history(
+        args.directory,
+        cache_path=args.cache,
+        workers=args.workers,
+        depth=args.depth,
+        max_nodes=args.nodes,
+        time_limit=args.time,
+        progress=lambda n, path: print(f"[{n}] {os.path.basename(path)}"),
+    )
+    print(f"共分析{games}局，发现{blunders}个恶手")
@@ -0,0 +1,228 @@
+"""无界面的AI对战
+
+python -m gomoku.arena --black 2 --white 3 --games 10
+python -m gomoku.arena --calibrate --games 10  # 测量每个难度级别的Elo和每步用时
+"""
+
+import math
+import random
+import time
+
+from .ai import AI_LEVELS, get_ai_by_level
+from .board import RULE_FREESTYLE, RULES
+from .clock import TimeControl
+from .game import Game
+
+
+def play_game(
+    black_ai,
+    white_ai,
+    max_moves=None,
+    board_size=15,
+    rule=RULE_FREESTYLE,
+    time_control=None,
+):
+    """让两个AI对弈一局，返回(结束时的Game, {玩家: 思考总秒数})
+
+    AI给出非法着手或无子可下时视为认输；time_control不为None时计时，超时判负。
+    """
+    game = Game(board_size, rule, time_control)
+    ais = {1: black_ai, 2: white_ai}
+    think_time = {1: 0.0, 2: 0.0}
+
+    while not game.game_over:
+        player = game.current_player
+        start = time.perf_counter()
+        move = ais[player].get_move(game)
+        think_time[player] += time.perf_counter() - start
+
+        if move is None or not game.make_move(*move):
+            if not game.game_over:
+                game.resign()
+            break
+        if max_moves is not None and game.move_count >= max_moves:
+            break
+
+    return game, think_time
+
+
+class OpeningAI:
+    """先按给定的开局着手落子，之后交给ai思考"""
+
+    def __init__(self, ai, opening):
+        self.ai = ai
+        self.opening = opening
+
+    def get_move(self, game):
+        if game.move_count < len(self.opening):
+            return self.opening[game.move_count]
+        return self.ai.get_move(game)
+
+
+def random_openings(count, board_size=15, moves=3, seed=None):
+    """生成count个随机开局: 天元之后在中心5×5范围内随机落子"""
+    rng = random.Random(seed)
+    center = board_size // 2
+    openings = []
+    for _ in range(count):
+        opening = [(center, center)]
+        while len(opening) < moves:
+            move = (center + rng.randint(-2, 2), center + rng.randint(-2, 2))
+            if move not in opening:
+                opening.append(move)
+        openings.append(opening)
+    return openings
+
+
+def play_match(
+    ai_a,
+    ai_b,
+    games=2,
+    max_moves=None,
+    board_size=15,
+    rule=RULE_FREESTYLE,
+    openings=None,
+    time_control=None,
+):
+    """交替先后手进行多局对战，返回ai_a视角的统计结果
+
+    openings为开局列表时，每个开局由双方各执黑下一局(第i局使用openings[i // 2])，
+    避免两个确定性的AI反复下出同样的对局。
+    """
+    stats = {"wins": 0, "losses": 0, "draws": 0, "moves": [0, 0], "time": [0.0, 0.0]}
+
+    for i in range(games):
+        a_is_black = i % 2 == 0
+        black, white = (ai_a, ai_b) if a_is_black else (ai_b, ai_a)
+        if openings:
+            opening = openings[i // 2 % len(openings)]
+            black, white = OpeningAI(black, opening), OpeningAI(white, opening)
+        game, think_time = play_game(
+            black, white, max_moves, board_size, rule, time_control
+        )
+
+        a_player = 1 if a_is_black else 2
+        if game.winner == a_player:
+            stats["wins"] += 1
+        elif game.winner is None:
+            stats["draws"] += 1
+        else:
+            stats["losses"] += 1
+
+        a_moves = sum(1 for _, _, p in game.move_history if p == a_player)
+        stats["moves"][0] += a_moves
+        stats["moves"][1] += len(game.move_history) - a_moves
+        stats["time"][0] += think_time[a_player]
+        stats["time"][1] += think_time[3 - a_player]
+
+    return stats
+
+
+def ms_per_move(stats, side=0):
+    """统计结果中某一方的平均每步用时(毫秒)"""
+    moves = stats["moves"][side]
+    return stats["time"][side] * 1000 / moves if moves else 0.0
+
+
+def estimate_elo(results, iterations=200):
+    """由对局结果估计Elo(Bradley-Terry模型的极大似然估计)
+
+    results为{(a, b): [a的得分, 对局数]}，和棋计0.5分。每对选手额外加一局虚拟和棋，
+    避免全胜或全负时分差发散。返回{选手: Elo}，最低的选手为0。
+    """
+    players = sorted({p for pair in results for p in pair})
+    scores = {p: 0.0 for p in players}
+    games = {}
+    for (a, b), (score, n) in results.items():
+        scores[a] += score + 0.5
+        scores[b] += n - score + 0.5
+        games[(a, b)] = games.get((a, b), 0) + n + 1
+        games[(b, a)] = games.get((b, a), 0) + n + 1
+
+    strength = {p: 1.0 for p in players}
+    for _ in range(iterations):
+        for p in players:
+            denominator = sum(
+                n / (strength[p] + strength[q]) for (a, q), n in games.items() if a == p
+            )
+            strength[p] = scores[p] / denominator
+    lowest = min(strength.values())
+    return {p: 400 * math.log10(strength[p] / lowest) for p in players}
+
+
+def calibrate(levels=None, games=4, max_moves=None, board_size=15, rule=RULE_FREESTYLE):
+    """各难度级别两两对战，返回[(级别, 名称, Elo, 平均每步毫秒数), ...]"""
+    levels = sorted(levels or AI_LEVELS)
+    ais = {level: get_ai_by_level(level, board_size) for level in levels}
+    results = {}
+    think = {level: [0.0, 0] for level in levels}  # [总秒数, 总步数]
+
+    for i, a in enumerate(levels):
+        for b in levels[i + 1 :]:
+            stats = play_match(ais[a], ais[b], games, max_moves, board_size, rule)
+            results[(a, b)] = [stats["wins"] + stats["draws"] / 2, games]
+            for level, side in ((a, 0), (b, 1)):
+                think[level][0] += stats["time"][side]
+                think[level][1] += stats["moves"][side]
+            print(
+                f"{ais[a].name} 对 {ais[b].name}: "
+                f"{stats['wins']}胜 {stats['losses']}负 {stats['draws']}和"
+            )
+
+    elo = estimate_elo(results)
+    return [
+        (
+            level,
+            ais[level].name,
+            elo[level],
+            think[level][0] * 1000 / think[level][1] if think[level][1] else 0.0,
+        )
+        for level in levels
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="AI对战")
+    parser.add_argument("--black", type=int, default=2, help="第一个AI的难度级别")
+    parser.add_argument("--white", type=int, default=3, help="第二个AI的难度级别")
+    parser.add_argument("--games", type=int, default=2, help="对局数(交替先后手)")
+    parser.add_argument("--max-moves", type=int)
+    parser.add_argument("--size", type=int, default=15, help="棋盘大小")
+    parser.add_argument("--rule", choices=RULES, default=RULE_FREESTYLE)
+    parser.add_argument(
+        "--time", type=TimeControl.parse, help="对局计时，如60、30+1、20/2x3(秒)"
+    )
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        help="所有难度级别两两对战，测量Elo和每步用时",
+    )
+    args = parser.parse_args()
+
+    if args.calibrate:
+        table = calibrate(None, args.games, args.max_moves, args.size, args.rule)
+        print("级别  名称      Elo   平均每步用时")
+        for level, name, elo, ms in table:
+            print(f"{level:>4}  {name:<6} {elo:>6.0f}  {ms:>8.1f}ms")
+    else:
+        ai_a = get_ai_by_level(args.black)
+        ai_b = get_ai_by_level(args.white)
+        stats = play_match(
+            ai_a,
+            ai_b,
+            args.games,
+            args.max_moves,
+            args.size,
+            args.rule,
+            time_control=args.time,
+        )
+        print(
+            f"{ai_a.name} 对 {ai_b.name}: "
+            f"{stats['wins']}胜 {stats['losses']}负 {stats['draws']}和"
+        )
+        print(
+            f"平均每步用时: {ai_a.name} {ms_per_move(stats, 0):.1f}ms, "
+            f"{ai_b.name} {ms_per_move(stats, 1):.1f}ms"
+        )
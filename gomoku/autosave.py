@@ -0,0 +1,194 @@
+"""对局自动保存
+
+界面线程只把事件放进队列，由后台线程追加写入日志文件(每行一个JSON)，
+并按批次或时间间隔调用fsync。对局结束时在后台写出完整的SGF文件，
+先写临时文件再原子重命名，然后删除日志。程序崩溃或被关闭时日志仍然保留，
+下次启动时可以用load_journal()恢复未完成的对局。
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+from .board import RULE_FREESTYLE
+from .sgf import create_sgf, generate_sgf_filename
+
+JOURNAL_NAME = "autosave.journal"
+NETWORK_JOURNAL_NAME = "network.journal"  # 网络对战使用单独的日志，不影响本地对局的恢复
+
+
+def load_journal(journal_path):
+    """读取未完成对局的日志，返回{"black", "white", "ai_level", "size", "rule", "moves"}或None
+
+    崩溃时最后一行可能只写了一半，忽略无法解析的行。
+    """
+    if not os.path.exists(journal_path):
+        return None
+
+    record = None
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event["type"] == "start":
+                record = {
+                    "black": event["black"],
+                    "white": event["white"],
+                    "ai_level": event.get("ai_level"),
+                    "size": event.get("size", 15),
+                    "rule": event.get("rule", RULE_FREESTYLE),
+                    "moves": [],
+                }
+            elif record is None:
+                continue
+            elif event["type"] == "move":
+                record["moves"].append((event["row"], event["col"], event["player"]))
+            elif event["type"] == "undo" and record["moves"]:
+                record["moves"].pop()
+
+    if record is None or not record["moves"]:
+        return None
+    return record
+
+
+class AutosaveWriter:
+    """后台自动保存线程，所有公开方法都只入队，不会阻塞调用者"""
+
+    def __init__(
+        self, directory, fsync_batch=8, fsync_interval=1.0, journal_name=JOURNAL_NAME
+    ):
+        self.directory = directory
+        self.journal_path = os.path.join(directory, journal_name)
+        self.fsync_batch = fsync_batch  # 累计多少条未同步的记录后fsync
+        self.fsync_interval = fsync_interval  # 有未同步记录时最长等待秒数
+
+        self._queue = queue.Queue()
+        self._journal = None
+        self._unsynced = 0
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._thread.start()
+
+    # 以下方法在界面线程中调用
+
+    def start_game(self, game, black_name, white_name, ai_level=None):
+        """开始记录game(新对局，或恢复后已有着手的对局)"""
+        self._queue.put(
+            (
+                "start",
+                (
+                    black_name,
+                    white_name,
+                    ai_level,
+                    list(game.move_history),
+                    game.board.size,
+                    game.board.rule,
+                ),
+            )
+        )
+
+    def record_move(self, row, col, player):
+        self._queue.put(("move", (row, col, player)))
+
+    def record_undo(self):
+        self._queue.put(("undo", None))
+
+    def finish(self, game, black_name, white_name, result):
+        """对局结束: 在后台保存SGF并删除日志"""
+        sgf_content = create_sgf(game, black_name, white_name, result)
+        self._queue.put(("finish", (sgf_content, black_name, white_name)))
+
+    def close(self, timeout=2.0):
+        """把队列中剩余的记录写完并停止后台线程"""
+        self._queue.put(("close", None))
+        self._thread.join(timeout)
+
+    # 以下方法只在后台线程中运行
+
+    def _run(self):
+        while True:
+            try:
+                timeout = self.fsync_interval if self._unsynced else None
+                kind, args = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._sync()
+                continue
+
+            try:
+                if kind == "close":
+                    self._sync()
+                    if self._journal:
+                        self._journal.close()
+                    return
+                getattr(self, f"_handle_{kind}")(args)
+            except OSError as e:
+                print(f"自动保存出错: {e}")
+
+    def _write_event(self, event):
+        self._journal.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._journal.flush()  # 进程崩溃时数据已在操作系统缓冲区中
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_batch:
+            self._sync()
+
+    def _sync(self):
+        if self._journal and self._unsynced:
+            os.fsync(self._journal.fileno())
+        self._unsynced = 0
+
+    def _handle_start(self, args):
+        black_name, white_name, ai_level, moves, size, rule = args
+        if self._journal:
+            self._journal.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self._journal = open(self.journal_path, "w", encoding="utf-8")
+        self._unsynced = 0
+        self._write_event(
+            {
+                "type": "start",
+                "black": black_name,
+                "white": white_name,
+                "ai_level": ai_level,
+                "size": size,
+                "rule": rule,
+                "time": time.time(),
+            }
+        )
+        for row, col, player in moves:
+            self._handle_move((row, col, player))
+        self._sync()
+
+    def _handle_move(self, args):
+        if self._journal is None:
+            return
+        row, col, player = args
+        self._write_event({"type": "move", "row": row, "col": col, "player": player})
+
+    def _handle_undo(self, args):
+        if self._journal is None:
+            return
+        self._write_event({"type": "undo"})
+
+    def _handle_finish(self, args):
+        sgf_content, black_name, white_name = args
+        os.makedirs(self.directory, exist_ok=True)
+        filename = generate_sgf_filename(self.directory, black_name, white_name)
+
+        # 先完整写入临时文件，再原子替换，不会留下写了一半的棋谱
+        tmp_path = filename + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(sgf_content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filename)
+
+        # 棋谱已安全保存，删除日志
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+        self._unsynced = 0
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
@@ -0,0 +1,243 @@
+"""批量选点: 一次为一批棋盘计算PatternAI的着手(可选功能，需要安装numpy)
+
+棋盘叠成(N, size, size)的数组，四周加一圈边界后展平。每个方向上用偏移下标同时取出
+所有棋盘所有交叉点的相邻点，逐步延伸得到双方在每个空位上的连子数和开放端数，
+再查分数表求和，每个棋盘取分数最高的位置。分数的计算和加法顺序与PatternAI.get_move
+完全相同，同分时同样取行优先的第一个，结果逐步一致。
+
+NumPy调用的次数只与棋形长度有关，与棋盘数无关，自我对弈时把很多局放在一批里一起走，
+吞吐量随批大小增长。
+
+python -m gomoku.batch --games 256 --batch 64   # 比较逐局和批量自我对弈的速度，并检查着手一致
+"""
+
+import numpy as np
+
+from .ai import EVAL_WEIGHTS, PatternAI
+from .board import RULE_FREESTYLE, RULE_RENJU
+from .game import Game
+
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+_BORDER = 3  # 边界格的值，不等于任何一方的棋子，也不算开放端
+_MAX_COUNT = 6  # 分数表的行数上限，六连及以上与PatternAI一样不计分
+
+
+class BatchPatternAI:
+    """向量化的PatternAI，get_moves一次为N个棋盘选点
+
+    weights的格式与DEFAULT_WEIGHTS相同，默认使用EVAL_WEIGHTS。
+    """
+
+    def __init__(self, board_size=15, weights=None):
+        self.name = "批量中级AI"
+        self.pattern_ai = PatternAI(board_size, weights)
+        self.set_board_size(board_size)
+        self.set_weights(EVAL_WEIGHTS if weights is None else weights)
+
+    def set_board_size(self, board_size):
+        """切换棋盘大小，重新生成展平后的下标"""
+        self.board_size = board_size
+        width = board_size + 2
+        rows, cols = np.divmod(np.arange(board_size * board_size), board_size)
+        self._width = width
+        self._cells = (rows + 1) * width + cols + 1  # 各交叉点在加边界后的棋盘上的下标
+        self._steps = [dr * width + dc for dr, dc in DIRECTIONS]
+
+    def set_weights(self, weights):
+        """由PatternAI的棋形分数生成(连子数, 开放端数)的分数表"""
+        self.pattern_ai.set_weights(weights)
+        self._pattern_table = np.zeros((_MAX_COUNT + 1, 3))
+        self._block_table = np.zeros((_MAX_COUNT + 1, 3))
+        for (count, open_ends), score in self.pattern_ai._pattern_scores.items():
+            self._pattern_table[count, open_ends] = score
+        for (count, open_ends), score in self.pattern_ai._block_scores.items():
+            self._block_table[count, open_ends] = score
+
+    def _pad(self, boards):
+        """(N, size, size)的棋盘加一圈边界后展平为(N, (size+2)^2)"""
+        boards = np.asarray(boards, dtype=np.int8)
+        if boards.ndim == 2:
+            boards = boards[None]
+        if boards.shape[1:] != (self.board_size, self.board_size):
+            self.set_board_size(boards.shape[1])
+        padded = np.full((len(boards), self._width, self._width), _BORDER, np.int8)
+        padded[:, 1:-1, 1:-1] = boards
+        return padded.reshape(len(boards), -1)
+
+    def _run(self, padded, who, step):
+        """who下在每个交叉点后沿step方向的连子数(不含该点)和端点是否开放"""
+        last = padded.shape[1] - 1
+        count = np.zeros((len(padded), len(self._cells)), np.int32)
+        alive = np.ones(count.shape, bool)
+        for k in range(1, self.board_size):
+            # 延伸到边界就会停下，超出数组的下标只出现在已经停下的位置上
+            index = np.minimum(self._cells + k * step, last)
+            alive &= padded[:, index] == who
+            if not alive.any():
+                break
+            count += alive
+        end = np.take_along_axis(padded, self._cells + (count + 1) * step, axis=1)
+        return count, end == 0
+
+    def _scan(self, padded, who, step):
+        """与PatternAI.scan_direction相同的(连子数, 开放端数)，连子数最多取_MAX_COUNT"""
+        forward, forward_open = self._run(padded, who, step)
+        backward, backward_open = self._run(padded, who, -step)
+        count = np.minimum(forward + backward + 1, _MAX_COUNT)
+        return count, forward_open.astype(np.int32) + backward_open
+
+    def score_cells(self, boards, players):
+        """每个棋盘上每个交叉点的分数，(N, size*size)的数组，有子的位置为-inf
+
+        players为各棋盘的走子方(1或2)，也可以是一个数。
+        """
+        padded = self._pad(boards)
+        players = np.broadcast_to(np.asarray(players, np.int8), (len(padded),))
+        me = players[:, None]
+        opponent = 3 - me
+        total = np.zeros((len(padded), len(self._cells)))
+        for step in self._steps:
+            # 加法顺序与PatternAI.evaluate_position相同，浮点结果完全一致
+            count, open_ends = self._scan(padded, me, step)
+            total += self._pattern_table[count, open_ends]
+            count, open_ends = self._scan(padded, opponent, step)
+            total += self._block_table[count, open_ends]
+        total[padded[:, self._cells] != 0] = -np.inf
+        return total
+
+    def get_moves(self, boards, players, rule=RULE_FREESTYLE, forbidden=None):
+        """为每个棋盘选择分数最高的空位，返回(N, 2)的数组，没有空位的棋盘为(-1, -1)
+
+        连珠规则下黑棋跳过禁手: forbidden可以给出每个棋盘的禁手判断函数
+        (如Board.is_forbidden，不需要判断的棋盘为None)，省略时按棋盘临时建立禁手检测器。
+        """
+        scores = self.score_cells(boards, players)
+        best = np.argmax(scores, axis=1)
+        moves = np.stack(np.divmod(best, self.board_size), axis=1)
+        moves[np.isneginf(scores[np.arange(len(scores)), best])] = -1
+
+        if forbidden is None and rule == RULE_RENJU:
+            players = np.broadcast_to(np.asarray(players), (len(scores),))
+            boards = np.asarray(boards).reshape(len(scores), -1)
+            forbidden = [
+                _renju_checker(board, self.board_size) if player == 1 else None
+                for board, player in zip(boards, players)
+            ]
+        if forbidden is not None:
+            for i, is_forbidden in enumerate(forbidden):
+                if is_forbidden is not None and moves[i, 0] >= 0:
+                    moves[i] = self._first_allowed(scores[i], is_forbidden)
+        return moves
+
+    def _first_allowed(self, scores, is_forbidden):
+        """按分数从高到低(同分时行优先)找第一个不是禁手的位置"""
+        for cell in np.argsort(-scores, kind="stable"):
+            if np.isneginf(scores[cell]):
+                break
+            row, col = divmod(int(cell), self.board_size)
+            if not is_forbidden(row, col):
+                return row, col
+        return -1, -1
+
+
+def _renju_checker(board, size):
+    """由展平的棋盘建立禁手检测器，返回判断函数"""
+    from .renju import RenjuDetector
+
+    detector = RenjuDetector(size)
+    for cell in np.flatnonzero(board):
+        detector.place(*divmod(int(cell), size), int(board[cell]))
+    return detector.is_forbidden
+
+
+def play_games(openings, board_size=15, rule=RULE_FREESTYLE, max_moves=None, ai=None):
+    """从每个开局出发，所有对局一起用BatchPatternAI自我对弈，返回结束时的Game列表
+
+    每一步把还没结束的对局打包选点，胜负、和棋和禁手仍由Game判断；
+    没有可走的位置时走子方认输。
+    """
+    ai = ai or BatchPatternAI(board_size)
+    ai.set_board_size(board_size)
+    games = []
+    for opening in openings:
+        game = Game(board_size, rule)
+        for row, col in opening:
+            if game.game_over or not game.make_move(row, col):
+                break
+        games.append(game)
+    stack = np.array([game.board.board for game in games], np.int8).reshape(
+        len(games), board_size, board_size
+    )
+
+    def finished(game):
+        return game.game_over or (max_moves is not None and game.move_count >= max_moves)
+
+    active = [i for i, game in enumerate(games) if not finished(game)]
+    while active:
+        players = np.array([games[i].current_player for i in active], np.int8)
+        forbidden = None
+        if rule == RULE_RENJU:
+            forbidden = [
+                games[i].board.is_forbidden if player == 1 else None
+                for i, player in zip(active, players)
+            ]
+        moves = ai.get_moves(stack[active], players, rule, forbidden)
+        for i, player, (row, col) in zip(active, players, moves.tolist()):
+            game = games[i]
+            if row < 0 or not game.make_move(row, col):
+                if not game.game_over:
+                    game.resign()
+                continue
+            stack[i, row, col] = player
+        active = [i for i in active if not finished(games[i])]
+    return games
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from .arena import OpeningAI, play_game, random_openings
+    from .board import RULES
+
+    parser = argparse.ArgumentParser(description="批量PatternAI自我对弈的吞吐量")
+    parser.add_argument("--games", type=int, default=256)
+    parser.add_argument("--batch", type=int, default=64, help="每批同时进行的对局数")
+    parser.add_argument("--size", type=int, default=15)
+    parser.add_argument("--rule", choices=RULES, default=RULE_FREESTYLE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--serial-games", type=int, default=16, help="用PatternAI逐局对照的对局数"
+    )
+    args = parser.parse_args()
+
+    openings = random_openings(args.games, args.size, seed=args.seed)
+    start = time.perf_counter()
+    games = []
+    batch_ai = BatchPatternAI(args.size)
+    for i in range(0, len(openings), args.batch):
+        games += play_games(openings[i : i + args.batch], args.size, args.rule, ai=batch_ai)
+    batch_seconds = time.perf_counter() - start
+    batch_moves = sum(game.move_count for game in games)
+    print(
+        f"批量: {len(games)}局 {batch_moves}步 {batch_seconds:.2f}秒 "
+        f"{len(games) / batch_seconds:.1f}局/秒 {batch_moves / batch_seconds:.0f}步/秒"
+    )
+
+    pattern_ai = PatternAI(args.size)
+    serial = openings[: args.serial_games]
+    start = time.perf_counter()
+    mismatches = 0
+    serial_moves = 0
+    for opening, batch_game in zip(serial, games):
+        player = OpeningAI(pattern_ai, opening)
+        game, _ = play_game(player, player, None, args.size, args.rule)
+        serial_moves += game.move_count
+        mismatches += game.move_history != batch_game.move_history
+    serial_seconds = time.perf_counter() - start
+    if serial:
+        print(
+            f"逐局: {len(serial)}局 {serial_moves}步 {serial_seconds:.2f}秒 "
+            f"{len(serial) / serial_seconds:.1f}局/秒 {serial_moves / serial_seconds:.0f}步/秒"
+        )
+        print(f"着手不一致的对局: {mismatches}/{len(serial)}")
@@ -0,0 +1,104 @@
+"""性能测试
+
+python -m gomoku.bench startup    # 冷启动时间
+python -m gomoku.bench search     # 不同棋盘大小下高级AI每步的搜索用时
+"""
+
+import os
+import random
+import subprocess
+import sys
+import time
+
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 冷启动测试项: 名称 -> 在新进程中执行的代码
+STARTUP_TARGETS = {
+    "核心包": "import gomoku",
+    "无界面引擎(第一步)": (
+        "from gomoku.ai import get_ai_by_level\n"
+        "from gomoku.game import Game\n"
+        "get_ai_by_level(3).get_move(Game())"
+    ),
+    "AI对战": "import gomoku.arena",
+}
+STARTUP_BUDGET_MS = 100
+
+
+def measure_startup(code, repeat=5):
+    """在新的解释器进程中执行code，返回多次运行中最短的耗时(毫秒)"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=PACKAGE_PARENT, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench_startup(repeat=5):
+    """测量各入口的冷启动时间，返回{名称: 毫秒}"""
+    results = {"解释器本身": measure_startup("pass", repeat)}
+    for name, code in STARTUP_TARGETS.items():
+        results[name] = measure_startup(code, repeat)
+    return results
+
+
+def make_position(size, stones, seed=0):
+    """在size路棋盘中央附近随机落stones个子，返回未分胜负的Game"""
+    from .game import Game
+
+    rng = random.Random(seed)
+    center = size // 2
+    spread = 2
+    while True:
+        game = Game(size)
+        while game.move_count < stones and not game.game_over:
+            if not game.make_move(
+                center + rng.randint(-spread, spread),
+                center + rng.randint(-spread, spread),
+            ):
+                spread = min(spread + 1, center)  # 中央已经下满时扩大范围
+        if not game.game_over:
+            return game
+        seed += 1
+        rng.seed(seed)
+
+
+def bench_search(sizes=(15, 19), stone_counts=(4, 12, 24), repeat=3):
+    """测量高级AI在不同棋盘大小和棋子数下每步的搜索用时，返回{(大小, 棋子数): 毫秒}"""
+    from .ai import EnhancedMinimaxAI
+
+    results = {}
+    for size in sizes:
+        for stones in stone_counts:
+            game = make_position(size, stones)
+            ai = EnhancedMinimaxAI(size)
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                ai.get_move(game)
+                best = min(best, time.perf_counter() - start)
+            results[(size, stones)] = best * 1000
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="五子棋性能测试")
+    parser.add_argument("benchmark", choices=["startup", "search"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[15, 19], help="search测试的棋盘大小"
+    )
+    args = parser.parse_args()
+
+    if args.benchmark == "startup":
+        results = bench_startup(args.repeat)
+        for name, ms in results.items():
+            flag = "" if ms <= STARTUP_BUDGET_MS else " (超过预算)"
+            print(f"{name}: {ms:.1f}ms{flag}")
+    elif args.benchmark == "search":
+        results = bench_search(args.sizes, repeat=args.repeat)
+        for (size, stones), ms in results.items():
+            print(f"{size}路 {stones}子: {ms:.1f}ms/步")
@@ -1,16 +1,171 @@
+import random
+from functools import lru_cache
+
+RULE_FREESTYLE = "freestyle"  # 无禁手，五子及以上连珠获胜
+RULE_RENJU = "renju"  # 连珠规则，黑棋有禁手且必须恰好五连
+RULES = (RULE_FREESTYLE, RULE_RENJU)
+
+
+@lru_cache(maxsize=None)
+def get_zobrist_table(size):
+    """获取指定棋盘大小的Zobrist随机数表，table[row * size + col][player]
+
+    使用固定种子生成，保证不同进程、不同次运行得到的哈希值一致，可以持久化。
+    """
+    rng = random.Random(f"gomoku-zobrist-{size}")
+    return tuple(
+        (0, rng.getrandbits(64), rng.getrandbits(64)) for _ in range(size * size)
+    )
+
+
+@lru_cache(maxsize=None)
+def get_neighbor_table(size, distance):
+    """每个交叉点周围distance范围内的交叉点(不含自身)，table[row * size + col] -> ((r, c), ...)"""
+    table = []
+    for row in range(size):
+        for col in range(size):
+            table.append(
+                tuple(
+                    (r, c)
+                    for r in range(
+                        max(0, row - distance), min(size, row + distance + 1)
+                    )
+                    for c in range(
+                        max(0, col - distance), min(size, col + distance + 1)
+                    )
+                    if (r, c) != (row, col)
+                )
+            )
+    return tuple(table)
+
+
+@lru_cache(maxsize=None)
+def get_window_table(size):
+    """四个方向上所有五格窗口，返回(windows, cell_windows)
+
+    windows[w]为窗口包含的交叉点编号，cell_windows[row * size + col]为经过该点的窗口编号。
+    """
+    windows = []
+    cell_windows = [[] for _ in range(size * size)]
+    for row in range(size):
+        for col in range(size):
+            for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                end_row, end_col = row + 4 * dr, col + 4 * dc
+                if not (0 <= end_row < size and 0 <= end_col < size):
+                    continue
+                cells = tuple((row + i * dr) * size + col + i * dc for i in range(5))
+                for cell in cells:
+                    cell_windows[cell].append(len(windows))
+                windows.append(cells)
+    return tuple(windows), tuple(tuple(w) for w in cell_windows)
+
+
+class LiveWindows:
+    """增量维护每一方的"活窗口"数: 没有对方棋子的五格窗口，这一方还可能在其中连成五
+
+    一方没有活窗口时已经不可能获胜；双方都没有时局面是死和，不必下满棋盘。
+    同时记录每个交叉点经过的、对至少一方是活的窗口数，为0的点落子对胜负没有影响。
+    连珠规则下黑棋的长连不算胜，这里仍按五格窗口计算，只会少判死和，不会误判。
+    """
+
+    def __init__(self, size):
+        self.windows, self.cell_windows = get_window_table(size)
+        self.stones = [[0, 0, 0] for _ in self.windows]  # 窗口中[未用, 黑子数, 白子数]
+        self.live = [0, len(self.windows), len(self.windows)]
+        self.cell_live = [len(windows) for windows in self.cell_windows]
+        self.size = size
+
+    def _update(self, row, col, player, delta):
+        opponent = 3 - player
+        for w in self.cell_windows[row * self.size + col]:
+            counts = self.stones[w]
+            was_live = not counts[1] or not counts[2]
+            if counts[player] == (0 if delta > 0 else 1):
+                self.live[opponent] -= delta  # 窗口中第一个(或最后一个)player的棋子
+            counts[player] += delta
+            if was_live != (not counts[1] or not counts[2]):
+                step = -1 if was_live else 1
+                for cell in self.windows[w]:
+                    self.cell_live[cell] += step
+
+    def place(self, row, col, player):
+        self._update(row, col, player, 1)
+
+    def remove(self, row, col, player):
+        self._update(row, col, player, -1)
+
+    def can_win(self, player):
+        """player是否还有可能连成五"""
+        return self.live[player] > 0
+
+    def is_dead(self):
+        """双方都不可能再连成五"""
+        return not self.live[1] and not self.live[2]
+
+    def is_live_cell(self, row, col):
+        """(row, col)是否在某个对至少一方是活的窗口中"""
+        return self.cell_live[row * self.size + col] > 0
+
+
+def get_star_points(size):
+    """星位: 四个角上的星和天元"""
+    edge = 3 if size >= 13 else 2
+    far = size - 1 - edge
+    points = [(edge, edge), (edge, far), (far, edge), (far, far)]
+    if size % 2 == 1:
+        points.append((size // 2, size // 2))
+    return points
+
+
 class Board:
-    def __init__(self, size=15):
+    def __init__(self, size=15, rule=RULE_FREESTYLE):
         self.size = size
+        self.rule = rule
         self.board = [[0 for _ in range(size)] for _ in range(size)]
         # 0表示空，1表示黑子，2表示白子
+        self.stone_count = 0
+        self.windows = LiveWindows(size)  # 双方还能连成五的窗口，用于提前判断和棋
+
+        # 连珠规则下增量维护禁手检测器
+        self.renju = None
+        if rule == RULE_RENJU:
+            from .renju import RenjuDetector
+
+            self.renju = RenjuDetector(size)
 
     def place_stone(self, row, col, stone_type):
         """在指定位置放置棋子"""
         if 0 <= row < self.size and 0 <= col < self.size and self.board[row][col] == 0:
             self.board[row][col] = stone_type
+            self.stone_count += 1
+            self.windows.place(row, col, stone_type)
+            if self.renju:
+                self.renju.place(row, col, stone_type)
             return True
         return False
 
+    def remove_stone(self, row, col):
+        """移除指定位置的棋子(悔棋、回放后退时使用)"""
+        stone_type = self.board[row][col]
+        if stone_type != 0:
+            self.board[row][col] = 0
+            self.stone_count -= 1
+            self.windows.remove(row, col, stone_type)
+            if self.renju:
+                self.renju.remove(row, col, stone_type)
+            return True
+        return False
+
+    def is_forbidden(self, row, col):
+        """黑棋下在(row, col)是否为禁手(只有连珠规则下的空点才可能是禁手)"""
+        return (
+            self.renju is not None
+            and 0 <= row < self.size
+            and 0 <= col < self.size
+            and self.board[row][col] == 0
+            and self.renju.is_forbidden(row, col)
+        )
+
     def check_win(self, row, col, stone_type):
         """检查是否有五子连珠"""
         directions = [(1, 0), (0, 1), (1, 1), (1, -1)]  # 横、竖、右斜、左斜
@@ -40,15 +195,16 @@ class Board:
                 r -= dr
                 c -= dc
 
-            if count >= 5:
+            # 连珠规则下黑棋必须恰好五连(长连是禁手)
+            if count == 5 or (count > 5 and not (self.renju and stone_type == 1)):
                 return True
 
         return False
 
     def is_full(self):
         """检查棋盘是否已满"""
-        for row in range(self.size):
-            for col in range(self.size):
-                if self.board[row][col] == 0:
-                    return False
-        return True
+        return self.stone_count >= self.size * self.size
+
+    def is_dead(self):
+        """双方都已不可能连成五(死和)，棋盘下满时也成立"""
+        return self.windows.is_dead()
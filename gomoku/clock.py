@@ -0,0 +1,168 @@
+"""对局计时: 包干(绝对时间)、费舍尔加秒和读秒三种用时制度
+
+用时写成"主时间[+加秒][/读秒x次数]"(秒)，例如:
+    300        每方5分钟包干
+    180+2      每方3分钟，每走一步加2秒(费舍尔)
+    600/30x3   每方10分钟，用完后每步30秒，可以超时3次(读秒)
+"""
+
+import re
+import time
+
+_SPEC = re.compile(
+    r"^\s*(\d+(?:\.\d+)?)(?:\s*\+\s*(\d+(?:\.\d+)?))?"
+    r"(?:\s*/\s*(\d+(?:\.\d+)?)(?:\s*[xX×]\s*(\d+))?)?\s*$"
+)
+
+
+class TimeControl:
+    """用时制度: 主时间、每步加秒、读秒时长和读秒次数(秒)"""
+
+    def __init__(self, main_time, increment=0, byoyomi=0, periods=0):
+        if main_time < 0 or increment < 0 or byoyomi < 0 or periods < 0:
+            raise ValueError("用时不能为负数")
+        if byoyomi and increment:
+            raise ValueError("加秒和读秒不能同时使用")
+        self.main_time = main_time
+        self.increment = increment
+        self.byoyomi = byoyomi
+        self.periods = max(periods, 1) if byoyomi else 0
+
+    @classmethod
+    def parse(cls, text):
+        """从"主时间[+加秒][/读秒x次数]"解析，格式不对时抛出ValueError"""
+        match = _SPEC.match(text)
+        if not match:
+            raise ValueError(f"无法识别的用时: {text}")
+        main_time, increment, byoyomi, periods = match.groups()
+        return cls(
+            float(main_time),
+            float(increment or 0),
+            float(byoyomi or 0),
+            int(periods or 1) if byoyomi else 0,
+        )
+
+    def __str__(self):
+        text = f"{self.main_time:g}"
+        if self.increment:
+            text += f"+{self.increment:g}"
+        if self.byoyomi:
+            text += f"/{self.byoyomi:g}x{self.periods}"
+        return text
+
+    def describe(self):
+        """界面和棋谱中显示的说明"""
+        text = format_seconds(self.main_time)
+        if self.increment:
+            text += f" 每步加{self.increment:g}秒"
+        if self.byoyomi:
+            text += f" 读秒{self.byoyomi:g}秒×{self.periods}"
+        return text
+
+
+def format_seconds(seconds):
+    """秒数显示为"分:秒"，不足10秒时显示一位小数"""
+    seconds = max(seconds, 0)
+    if seconds < 10:
+        return f"{seconds:.1f}"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+class GameClock:
+    """双方的棋钟，时间由time.monotonic()计算，now参数可以传入其他时刻(用于测试和回放)
+
+    同一时间只有一方在走时；press(player)结束player的回合并开始对方的回合。
+    一方的时间用完(读秒用完所有次数)后flagged(player)为True。
+    """
+
+    def __init__(self, control, now=None):
+        self.control = control
+        self.remaining = {1: control.main_time, 2: control.main_time}  # 剩余主时间
+        self.periods = {1: control.periods, 2: control.periods}  # 剩余读秒次数
+        self.running = None  # 正在走时的一方
+        self.turn_start = None
+        self.start(1, now)
+
+    def copy(self):
+        clock = GameClock.__new__(GameClock)
+        clock.control = self.control
+        clock.remaining = dict(self.remaining)
+        clock.periods = dict(self.periods)
+        clock.running = self.running
+        clock.turn_start = self.turn_start
+        return clock
+
+    def start(self, player, now=None):
+        """开始player的回合(之前走时的一方本回合用掉的时间照常扣除，但不加秒)"""
+        now = time.monotonic() if now is None else now
+        if self.running is not None:
+            self._charge(self.running, now)
+        self.running = player
+        self.turn_start = now
+
+    def stop(self, now=None):
+        """对局结束时停钟"""
+        if self.running is not None:
+            self._charge(self.running, time.monotonic() if now is None else now)
+        self.running = None
+
+    def press(self, player, now=None):
+        """player走完一步: 扣除用时、费舍尔加秒，开始对方的回合。超时返回False"""
+        now = time.monotonic() if now is None else now
+        self._charge(player, now)
+        if self.flagged(player, now):
+            self.running = None
+            return False
+        self.remaining[player] += self.control.increment
+        self.running = 3 - player
+        self.turn_start = now
+        return True
+
+    def _charge(self, player, now):
+        """扣除player本回合用掉的时间，主时间用完后每用满一次读秒时长扣掉一次读秒"""
+        self.remaining[player], self.periods[player] = self._state(player, now)
+        self.turn_start = now
+        if self.control.byoyomi and self.remaining[player] < 0:
+            self.remaining[player] = 0  # 下一步重新开始一次完整的读秒
+
+    def _state(self, player, now=None):
+        """(剩余主时间, 剩余读秒次数)，走时的一方算到now为止，主时间用完后为负数"""
+        remaining, periods = self.remaining[player], self.periods[player]
+        if player != self.running:
+            return remaining, periods
+        now = time.monotonic() if now is None else now
+        remaining -= now - self.turn_start
+        if remaining < 0 and self.control.byoyomi:
+            periods -= int(-remaining // self.control.byoyomi)
+        return remaining, periods
+
+    def time_left(self, player, now=None):
+        """player这一步在超时之前最多还能用的秒数(包括所有剩余的读秒)"""
+        remaining, periods = self._state(player, now)
+        byoyomi = self.control.byoyomi
+        if not byoyomi:
+            return max(remaining, 0)
+        if periods <= 0:
+            return 0
+        if remaining >= 0:
+            return remaining + periods * byoyomi
+        return periods * byoyomi - (-remaining % byoyomi)
+
+    def flagged(self, player, now=None):
+        """player的时间是否已经用完"""
+        remaining, periods = self._state(player, now)
+        if self.control.byoyomi:
+            return periods <= 0
+        return remaining < 0
+
+    def display(self, player, now=None):
+        """信息栏中显示的剩余时间"""
+        remaining, periods = self._state(player, now)
+        byoyomi = self.control.byoyomi
+        if not byoyomi:
+            return format_seconds(remaining)
+        if remaining > 0:
+            return f"{format_seconds(remaining)} (读秒{periods}次)"
+        period_left = byoyomi - (-remaining % byoyomi) if periods > 0 else 0
+        return f"读秒 {format_seconds(period_left)} ({max(periods, 0)}次)"
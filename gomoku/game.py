@@ -1,9 +1,18 @@
-from board import Board
+import time
+
+from .board import RULE_FREESTYLE, Board
+from .clock import GameClock
+
+UNDO_NOTICE_SECONDS = 2.0  # 悔棋提示的显示时间
 
 
 class Game:
-    def __init__(self):
-        self.board = Board()
+    def __init__(self, board_size=15, rule=RULE_FREESTYLE, time_control=None):
+        self.board = Board(board_size, rule)
+        # 用时制度(clock.TimeControl)，None为不计时；棋钟从创建对局时开始走
+        self.time_control = time_control
+        self.clock = GameClock(time_control) if time_control else None
+        self.timeout_player = None  # 超时判负的一方
         self.current_player = 1  # 1表示黑子，2表示白棋
         self.game_over = False
         self.winner = None
@@ -11,11 +20,12 @@ class Game:
         self.move_history = []
         self.resigned_player = None
         self.last_undo_player = None
-        self.undo_count = 0
+        self.undo_notice_until = 0  # 悔棋提示在此时刻(time.monotonic())之后消失
         self.move_numbers = [
             [0 for _ in range(self.board.size)] for _ in range(self.board.size)
         ]
         self.move_count = 0
+        self.forbidden_move = None  # 最近一次被拒绝的黑棋禁手位置
 
         # 回放模式相关
         self.replay_mode = False
@@ -27,11 +37,19 @@ class Game:
         """玩家在指定位置落子"""
         if self.game_over or self.replay_mode:
             return False
+        if self.check_timeout():
+            return False
+
+        # 连珠规则下黑棋不能下禁手
+        if self.current_player == 1 and self.board.is_forbidden(row, col):
+            self.forbidden_move = (row, col)
+            return False
 
         if self.board.place_stone(row, col, self.current_player):
+            self.forbidden_move = None
             # 每次有效落子时重置悔棋信息
             self.last_undo_player = None
-            self.undo_count = 0
+            self.undo_notice_until = 0
 
             # 棋子序号递增
             self.move_count += 1
@@ -44,10 +62,16 @@ class Game:
             if self.board.check_win(row, col, self.current_player):
                 self.game_over = True
                 self.winner = self.current_player
-            # 检查是否平局
-            elif self.board.is_full():
+            # 检查是否平局: 棋盘已满，或双方都不可能再连成五
+            elif self.board.is_full() or self.board.is_dead():
                 self.game_over = True
-            else:
+            if self.clock:
+                if self.game_over:
+                    self.clock.stop()
+                elif not self.clock.press(self.current_player):
+                    # 时间在开始落子之后、按钟之前用完: 着手保留，仍判超时负
+                    self.check_timeout()
+            if not self.game_over:
                 # 切换玩家
                 self.current_player = 3 - self.current_player  # 1->2, 2->1
                 # 黑棋回合时增加回合计数
@@ -70,15 +94,17 @@ class Game:
 
         # 记录悔棋玩家
         self.last_undo_player = last_player
-        self.undo_count = 60  # 显示约2秒
+        self.undo_notice_until = time.monotonic() + UNDO_NOTICE_SECONDS
 
         # 清除该位置的棋子序号和棋子
         self.move_numbers[last_row][last_col] = 0
-        self.board.board[last_row][last_col] = 0
+        self.board.remove_stone(last_row, last_col)
         self.move_count -= 1
 
         # 切换回上一个玩家
         self.current_player = last_player
+        if self.clock:
+            self.clock.start(last_player)
 
         # 如果是白棋悔棋到黑棋，需要减少回合计数
         if last_player == 1 and len(self.move_history) > 0:
@@ -86,18 +112,34 @@ class Game:
 
         return True
 
-    def resign(self):
-        """当前玩家认输"""
+    def resign(self, player=None):
+        """player认输，默认为当前玩家(网络对战中可以在对方回合认输)"""
         if not self.game_over and not self.replay_mode:
-            self.resigned_player = self.current_player
+            self.resigned_player = player or self.current_player
             self.game_over = True
-            self.winner = 3 - self.current_player  # 另一方获胜
+            self.winner = 3 - self.resigned_player  # 另一方获胜
+            if self.clock:
+                self.clock.stop()
             return True
         return False
 
+    def check_timeout(self):
+        """当前走子方的时间用完时判负，返回是否超时"""
+        if self.game_over or not self.clock:
+            return False
+        if not self.clock.flagged(self.current_player):
+            return False
+        self.clock.stop()
+        self.timeout_player = self.current_player
+        self.game_over = True
+        self.winner = 3 - self.current_player
+        return True
+
     def reset(self):
         """重置游戏"""
-        self.board = Board()
+        self.board = Board(self.board.size, self.board.rule)
+        self.clock = GameClock(self.time_control) if self.time_control else None
+        self.timeout_player = None
         self.current_player = 1
         self.game_over = False
         self.winner = None
@@ -105,11 +147,12 @@ class Game:
         self.move_history = []
         self.resigned_player = None
         self.last_undo_player = None
-        self.undo_count = 0
+        self.undo_notice_until = 0
         self.move_numbers = [
             [0 for _ in range(self.board.size)] for _ in range(self.board.size)
         ]
         self.move_count = 0
+        self.forbidden_move = None
 
         # 退出回放模式
         self.replay_mode = False
@@ -118,12 +161,16 @@ class Game:
         self.replay_info = {}
 
     def update(self):
-        """每帧更新游戏状态"""
-        # 更新悔棋计数器
-        if self.undo_count > 0:
-            self.undo_count -= 1
-            if self.undo_count == 0:
-                self.last_undo_player = None
+        """更新随时间变化的状态，有变化时返回True"""
+        # 悔棋提示到时间后消失
+        if (
+            self.last_undo_player is not None
+            and time.monotonic() >= self.undo_notice_until
+        ):
+            self.last_undo_player = None
+            return True
+        # 走子方超时
+        return self.check_timeout()
 
     def start_replay(self, moves, info=None):
         """开始回放模式"""
@@ -140,7 +187,7 @@ class Game:
             return False
 
         row, col, player = self.replay_moves[self.replay_index]
-        self.board.board[row][col] = player
+        self.board.place_stone(row, col, player)
         self.move_count += 1
         self.move_numbers[row][col] = self.move_count
         self.replay_index += 1
@@ -172,7 +219,7 @@ class Game:
 
         self.replay_index -= 1
         row, col, _ = self.replay_moves[self.replay_index]
-        self.board.board[row][col] = 0
+        self.board.remove_stone(row, col)
         self.move_numbers[row][col] = 0
         self.move_count -= 1
 
@@ -214,8 +261,12 @@ class Game:
             return ""
 
         if self.winner == 1:
+            if self.timeout_player == 2:
+                return "B+T"
             return "B+R" if self.resigned_player == 2 else "B+"
         elif self.winner == 2:
+            if self.timeout_player == 1:
+                return "W+T"
             return "W+R" if self.resigned_player == 1 else "W+"
         else:
             return "Draw"  # 平局
@@ -0,0 +1,276 @@
+"""紧凑的二进制棋谱存储
+
+文件格式(小端序):
+    对局记录 * N
+    索引: N个u64，每局记录的起始偏移
+    文件尾: 索引偏移(u64) + 对局数(u32) + 魔数 b"GMKS"
+
+每局记录由固定长度的头部和着手数据组成，着手按顺序交替由黑白双方落下，
+每步用一个字节表示 row * size + col(棋盘超过255个交叉点时每步两个字节)。
+读取时通过mmap映射整个文件，随机访问和遍历着手都不需要复制数据。
+
+只保存棋盘大小、规则、日期、结果、对局双方和主变化的着手，SGF中的评注、变化分支和
+其他属性不会保存；日期、结果和对局者名称超过字段长度时截断。
+"""
+
+import mmap
+import os
+import struct
+import warnings
+from array import array
+
+from .board import RULE_RENJU
+from .game import Game
+from .sgf import create_sgf, get_rule, iter_sgf_games
+
+STORE_MAGIC = b"GMKS"
+
+# 头部: 棋盘大小, 标志位, 着手数, 日期, 结果, 黑方, 白方
+_RECORD_HEADER = struct.Struct("<BBH10s8s32s32s")
+_FOOTER = struct.Struct("<QI4s")
+
+FLAG_WHITE_FIRST = 0x01  # 第一手为白棋
+FLAG_WIDE_MOVES = 0x02  # 每步使用两个字节
+FLAG_RENJU = 0x04  # 连珠规则
+
+
+def _encode_text(text, length, field):
+    """将字符串编码为定长字段，超长时在完整字符处截断并给出警告"""
+    data = text.encode("utf-8")
+    if len(data) > length:
+        data = data[:length].decode("utf-8", "ignore").encode("utf-8")
+        warnings.warn(f"{field}过长，截断后写入二进制棋谱: {text!r}", stacklevel=3)
+    return data
+
+
+def _decode_text(data):
+    return data.rstrip(b"\0").decode("utf-8")
+
+
+class GameStoreWriter:
+    """二进制棋谱写入器，支持追加到已有文件"""
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.offsets = array("Q")
+
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            with GameStore(path) as store:
+                self.offsets.extend(store.offsets)
+                index_offset = store.index_offset
+            self.file = open(path, "r+b")
+            # 覆盖旧的索引，新的索引在关闭时重新写入
+            self.file.seek(index_offset)
+            self.file.truncate()
+        else:
+            self.file = open(path, "wb")
+
+    def add_game(self, info, moves):
+        """写入一局棋，info使用SGF属性名(SZ/DT/PB/PW/RE/RU)"""
+        size = int(str(info.get("SZ", "15")).split(":")[0])
+        wide = size * size > 255
+        flags = FLAG_WIDE_MOVES if wide else 0
+        if moves and moves[0][2] == 2:
+            flags |= FLAG_WHITE_FIRST
+        if get_rule(info) == RULE_RENJU:
+            flags |= FLAG_RENJU
+
+        data = array("H" if wide else "B")
+        for i, (row, col, player) in enumerate(moves):
+            expected = moves[0][2] if i % 2 == 0 else 3 - moves[0][2]
+            if player != expected:
+                raise ValueError("二进制棋谱只支持黑白交替落子的对局")
+            data.append(row * size + col)
+
+        header = _RECORD_HEADER.pack(
+            size,
+            flags,
+            len(moves),
+            _encode_text(info.get("DT", ""), 10, "日期"),
+            _encode_text(info.get("RE", ""), 8, "结果"),
+            _encode_text(info.get("PB", ""), 32, "黑方名称"),
+            _encode_text(info.get("PW", ""), 32, "白方名称"),
+        )
+        self.offsets.append(self.file.tell())
+        self.file.write(header)
+        self.file.write(data.tobytes())
+        return len(self.offsets) - 1
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        self.file.write(self.offsets.tobytes())
+        self.file.write(_FOOTER.pack(index_offset, len(self.offsets), STORE_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GameStore:
+    """通过mmap只读访问二进制棋谱"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        if len(self._view) < _FOOTER.size:
+            self.close()
+            raise ValueError(f"不是有效的二进制棋谱文件: {path}")
+        self.index_offset, count, magic = _FOOTER.unpack_from(
+            self._view, len(self._view) - _FOOTER.size
+        )
+        if magic != STORE_MAGIC:
+            self.close()
+            raise ValueError(f"不是有效的二进制棋谱文件: {path}")
+        self.offsets = self._view[self.index_offset : self.index_offset + count * 8]
+        self.offsets = self.offsets.cast("Q")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_header(self, index):
+        """读取第index局的头部信息，返回SGF属性名形式的字典"""
+        size, flags, count, date, result, black, white = _RECORD_HEADER.unpack_from(
+            self._view, self.offsets[index]
+        )
+        return {
+            "SZ": str(size),
+            "DT": _decode_text(date),
+            "RE": _decode_text(result),
+            "PB": _decode_text(black),
+            "PW": _decode_text(white),
+            "flags": flags,
+            "move_count": count,
+        }
+
+    def get_move_view(self, index):
+        """返回第index局着手数据的memoryview(不复制)
+
+        view引用着映射的内存，用完后应调用view.release()；close()时仍未释放的view
+        会使映射推迟到这些view被回收后才关闭。
+        """
+        offset = self.offsets[index]
+        size, flags, count = struct.unpack_from("<BBH", self._view, offset)
+        start = offset + _RECORD_HEADER.size
+        if flags & FLAG_WIDE_MOVES:
+            return self._view[start : start + count * 2].cast("H")
+        return self._view[start : start + count]
+
+    def get_moves(self, index):
+        """解码第index局的着手序列[(row, col, player), ...]"""
+        offset = self.offsets[index]
+        size, flags, _ = struct.unpack_from("<BBH", self._view, offset)
+        player = 2 if flags & FLAG_WHITE_FIRST else 1
+        moves = []
+        for cell in self.get_move_view(index):
+            moves.append((cell // size, cell % size, player))
+            player = 3 - player
+        return moves
+
+    def __getitem__(self, index):
+        header = self.get_header(index)
+        info = {k: v for k, v in header.items() if k in ("SZ", "DT", "PB", "PW")}
+        if header["RE"]:
+            info["RE"] = header["RE"]
+        if header["flags"] & FLAG_RENJU:
+            info["RU"] = "Renju"
+        return info, self.get_moves(index)
+
+    def iter_move_views(self):
+        """依次产生每局的(头部, 着手memoryview)
+
+        每个view只在取下一局之前有效: 迭代继续或结束时自动释放，
+        需要保留着手时先用bytes(view)或get_moves复制。
+        """
+        for index in range(len(self)):
+            view = self.get_move_view(index)
+            try:
+                yield self.get_header(index), view
+            finally:
+                view.release()
+
+    def close(self):
+        if self._mmap is None:
+            return
+        # 释放所有memoryview后才能关闭mmap
+        try:
+            if hasattr(self, "offsets"):
+                self.offsets.release()
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            # 调用方还持有get_move_view返回的view: 只放弃引用，映射在view回收后关闭
+            pass
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def sgf_to_store(sgf_files, store_path, append=False):
+    """将SGF文件(可以是棋谱集合)转换为二进制棋谱，返回写入的对局数"""
+    count = 0
+    with GameStoreWriter(store_path, append=append) as writer:
+        for sgf_file in sgf_files:
+            for info, moves in iter_sgf_games(sgf_file):
+                try:
+                    writer.add_game(info, moves)
+                except ValueError as e:
+                    warnings.warn(f"跳过{sgf_file}中的一局: {e}", stacklevel=2)
+                    continue
+                count += 1
+    return count
+
+
+def store_to_sgf(store, index):
+    """将二进制棋谱中的第index局转换回SGF文本"""
+    info, moves = store[index]
+    game = Game(int(info["SZ"]), get_rule(info))
+    game.move_history = moves
+    return create_sgf(
+        game,
+        info["PB"],
+        info["PW"],
+        info.get("RE", ""),
+        date=info["DT"],
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .sgf import save_sgf
+
+    parser = argparse.ArgumentParser(description="SGF与二进制棋谱互相转换")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pack = sub.add_parser("pack", help="SGF转换为二进制棋谱")
+    pack.add_argument("store")
+    pack.add_argument("sgf_files", nargs="+")
+    pack.add_argument("--append", action="store_true")
+    unpack = sub.add_parser("unpack", help="二进制棋谱转换为SGF")
+    unpack.add_argument("store")
+    unpack.add_argument("directory")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        count = sgf_to_store(args.sgf_files, args.store, args.append)
+        print(f"已写入{count}局")
+    else:
+        os.makedirs(args.directory, exist_ok=True)
+        with GameStore(args.store) as store:
+            for i in range(len(store)):
+                save_sgf(
+                    store_to_sgf(store, i),
+                    os.path.join(args.directory, f"{i:08d}.sgf"),
+                )
+        print(f"已导出{len(store)}局")
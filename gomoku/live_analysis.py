@@ -0,0 +1,158 @@
+"""实时局面分析(回放界面的分析和对局中的提示)
+
+后台线程用EnhancedMinimaxAI对当前显示的局面做迭代加深的multi-PV分析，
+每一层只求出最好的top_n个着手，共用一张置换表。每完成一层就更新结果，
+并调用on_update通知界面重绘。切换局面时取消正在进行的搜索(没完成的一层直接丢弃)。
+设置time_limit时每个局面最多分析这么长时间，超时的一层同样丢弃。
+结果按局面缓存，来回切换已分析过的局面时立即显示，不会重新搜索。
+连第一层都没有在时间内完成的局面标记为timed_out，不算分析完成，
+离开后再次切换到该局面时重新分析。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from .ai import EnhancedMinimaxAI
+from .analysis import position_key
+from .board import RULE_FREESTYLE
+
+
+class LiveAnalysis:
+    """后台局面分析，request()和get()在界面线程中调用，不会阻塞"""
+
+    def __init__(
+        self, max_depth=4, top_n=5, cache_size=256, on_update=None, time_limit=None
+    ):
+        self.max_depth = max_depth
+        self.top_n = top_n
+        self.time_limit = time_limit  # 每个局面的分析时间上限(秒)，None为不限
+        self.cache_size = cache_size
+        self.on_update = on_update  # 结果更新时在后台线程中调用
+        self.engine = EnhancedMinimaxAI()
+
+        # 局面键 -> {"depth", "candidates": [(分数, (row, col)), ...], "pv",
+        #            "done", "timed_out"}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = None  # 等待分析的(键, 棋盘, 走子方, 规则)
+        self._running_key = None
+        self._last_key = None  # 上一次request的局面，用于判断是否切换过局面
+        self._cancel = threading.Event()
+
+        self._thread = threading.Thread(
+            target=self._run, name="live-analysis", daemon=True
+        )
+        self._thread.start()
+
+    def request(self, board, player, rule=RULE_FREESTYLE):
+        """要求分析局面(二维列表)，返回局面键，用get(键)读取结果"""
+        key = position_key(board, player, rule)
+        with self._lock:
+            revisit = key != self._last_key
+            self._last_key = key
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                # 超时的局面停留在该局面期间不反复重试，切换回来时再分析
+                if entry["done"] or (entry["timed_out"] and not revisit):
+                    return key
+            if self._pending and self._pending[0] == key:
+                return key
+            if key == self._running_key and not self._cancel.is_set():
+                return key
+            self._cancel.set()  # 取消正在分析的其他局面
+            self._pending = (key, [row[:] for row in board], player, rule)
+            self._wakeup.notify()
+        return key
+
+    def get(self, key):
+        """局面的最新分析结果，还没有完成任何一层时返回None"""
+        with self._lock:
+            return self._cache.get(key)
+
+    def cancel(self):
+        """取消正在进行和等待中的分析(离开回放界面时调用)"""
+        with self._lock:
+            self._pending = None
+            self._last_key = None
+            self._cancel.set()
+
+    def _store(self, key, entry):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self._pending is None:
+                    self._wakeup.wait()
+                key, board, player, rule = self._pending
+                self._pending = None
+                self._running_key = key
+                self._cancel.clear()
+
+            self._analyse(key, board, player, rule)
+            with self._lock:
+                self._running_key = None
+
+    def _analyse(self, key, board, player, rule):
+        self.engine.set_board_size(len(board))
+        start = time.time()
+        for depth, results, pv in self.engine.iter_analyse(
+            board,
+            player,
+            self.max_depth,
+            rule=rule,
+            cancel=self._cancel,
+            top_n=self.top_n,
+            time_limit=self.time_limit,
+        ):
+            with self._lock:
+                entry = self._cache.get(key)
+                # 上次被取消时已完成的较浅几层不覆盖缓存中更深的结果
+                if entry is None or depth > entry["depth"]:
+                    self._store(
+                        key,
+                        {
+                            "depth": depth,
+                            "candidates": results,
+                            "pv": pv,
+                            "done": False,
+                            "timed_out": False,
+                        },
+                    )
+            self._notify()
+
+        with self._lock:
+            if self._cancel.is_set():
+                return
+            entry = self._cache.get(key)
+            timed_out = (
+                self.time_limit is not None and time.time() - start >= self.time_limit
+            )
+            if (entry is None or entry["timed_out"]) and timed_out:
+                # 第一层也没有完成，没有任何结果，不能当作没有可下的位置
+                self._store(
+                    key,
+                    {
+                        "depth": 0,
+                        "candidates": [],
+                        "pv": [],
+                        "done": False,
+                        "timed_out": True,
+                    },
+                )
+            else:
+                # 搜索到最大深度、超时、提前分出胜负或没有可下的位置，该局面不再需要分析
+                if entry is None:
+                    entry = {"depth": 0, "candidates": [], "pv": [], "timed_out": False}
+                self._store(key, dict(entry, done=True))
+        self._notify()
+
+    def _notify(self):
+        if self.on_update:
+            self.on_update()
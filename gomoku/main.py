@@ -1,29 +1,48 @@
-import pygame
-import sys
-from game import Game
 import os
-from sgf import get_sgf_files, parse_sgf, get_game_summary, create_history_record
-from ai import get_ai_by_level
+import queue
+import sys
+import threading
+import time
 
-# 初始化pygame
-pygame.init()
+if __package__ in (None, ""):
+    # 直接运行 python main.py 时，以gomoku包的形式导入其他模块
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "gomoku"
+
+import pygame
+
+from .board import RULE_FREESTYLE, RULE_RENJU, RULES, get_star_points
+from .clock import TimeControl
+from .game import Game
+from .sgf import HistoryStore, get_rule, parse_sgf
+from .ai import get_ai_by_level
+from .autosave import NETWORK_JOURNAL_NAME, AutosaveWriter, load_journal
 
 # 游戏常量
 SCREEN_SIZE = 800
-BOARD_SIZE = 15
-GRID_SIZE = SCREEN_SIZE // (BOARD_SIZE + 1)
-STONE_RADIUS = GRID_SIZE // 2 - 2
+BOARD_SIZE = 15  # 默认棋盘大小，可用 --size 修改
 FONT_SIZE = 18
 BUTTON_HEIGHT = 40
 INFO_BAR_HEIGHT = 100  # 增加底部信息栏高度，容纳多个按钮
+MAX_FPS = 60  # 连续重绘时的最高帧率，空闲时不重绘
+AI_MIN_THINKING_TIME = 800  # AI最少"思考"的毫秒数，增强游戏体验(计时对局中不等待)
+AUTO_PLAY_INTERVAL = 1000  # 自动播放每一步的间隔(毫秒)
+HINT_TOP_N = 3  # 提示显示的候选着手数
+HINT_MAX_DEPTH = 4  # 提示搜索的最大深度
+HINT_TIME_LIMIT = 3.0  # 提示在每个局面上最多计算的秒数
+
+# 后台线程完成计算后发给界面的事件
+AI_MOVE_EVENT = pygame.USEREVENT + 1
+ANALYSIS_EVENT = pygame.USEREVENT + 2
+POSITION_SEARCH_EVENT = pygame.USEREVENT + 3
+NETPLAY_EVENT = pygame.USEREVENT + 4  # 网络对战的套接字就绪，只用于唤醒主循环
 
 # 历史记录常量 - 使用相对路径
 HISTORY_DIR = os.path.join(
     os.path.dirname(os.path.abspath(__file__)), "history"
 )  # 相对于当前文件的history目录
-if not os.path.exists(HISTORY_DIR):
-    os.makedirs(HISTORY_DIR)  # 确保历史记录目录存在
-LIST_ITEM_HEIGHT = 60  # 历史记录列表项高度
+LIST_ITEM_SPACING = 5  # 历史记录列表项间距
+LIST_OVERSCAN = 2  # 可见区域外额外创建的列表项数
 
 # 界面状态
 GAME_SCREEN = 0  # 游戏主界面
@@ -40,34 +59,126 @@ INFO_COLOR = (50, 50, 50)
 BUTTON_COLOR = (180, 180, 180)
 BUTTON_HOVER_COLOR = (150, 150, 150)
 BUTTON_TEXT_COLOR = (0, 0, 0)
+HEAT_LOW_COLOR = (60, 90, 220)  # 分析热力图中分数较低的候选点
+HEAT_HIGH_COLOR = (230, 40, 40)  # 分析热力图中分数最高的候选点
+
+# 游戏窗口和字体，在init_display()中创建
+screen = None
+font = None
+
+# 中文字体候选路径
+FONT_PATHS = [
+    "C:/Windows/Fonts/simhei.ttf",  # Windows黑体
+    "C:/Windows/Fonts/msyh.ttc",  # Windows微软雅黑
+    "/System/Library/Fonts/PingFang.ttc",  # macOS
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",  # Linux
+]
+
+
+def load_font():
+    """加载中文字体，找不到时使用默认字体"""
+    try:
+        # 尝试加载系统中文字体
+        for path in FONT_PATHS:
+            if os.path.exists(path):
+                return pygame.font.Font(path, FONT_SIZE)
+
+        # 如果没有找到中文字体，使用默认字体
+        print("警告：未找到中文字体，可能无法正确显示中文")
+        return pygame.font.SysFont(None, FONT_SIZE)
+    except Exception as e:
+        print(f"加载字体出错: {e}")
+        return pygame.font.SysFont(None, FONT_SIZE)
+
+
+def init_display():
+    """初始化pygame、创建游戏窗口并加载字体(只在启动界面时调用)"""
+    global screen, font
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_SIZE, SCREEN_SIZE + INFO_BAR_HEIGHT))
+    pygame.display.set_caption("五子棋")
+    font = load_font()
+
+
+def wait_for_events(timeout):
+    """等待事件，timeout为最长等待毫秒数(None为一直等待，0为不等待)"""
+    if timeout == 0:
+        return pygame.event.get()
+    event = pygame.event.wait(timeout or 0)
+    if event.type == pygame.NOEVENT:
+        return pygame.event.get()
+    return [event] + pygame.event.get()
+
+
+class AIWorker:
+    """在后台线程中计算AI着手，算完后发送AI_MOVE_EVENT，界面在等待期间不会卡住
+
+    同一时间只运行一个搜索。start()开始新的搜索时取消正在进行的搜索，
+    事件中带有search_id，界面只接受最新一次搜索的结果。
+    """
+
+    def __init__(self):
+        self.search_id = 0
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="ai", daemon=True)
+        self._thread.start()
+
+    def start(self, ai, game):
+        """开始为game计算AI着手，返回本次搜索的search_id"""
+        # 在对局的副本上搜索，界面线程可以继续读取原对局
+        snapshot = Game(game.board.size, game.board.rule)
+        for row, col, _ in game.move_history:
+            snapshot.make_move(row, col)
+        if game.clock:
+            # AI按棋钟的剩余时间分配用时
+            snapshot.time_control = game.time_control
+            snapshot.clock = game.clock.copy()
+        with self._lock:
+            self.search_id += 1
+            self._cancel.set()
+            self._queue.put((self.search_id, ai, snapshot))
+        return self.search_id
+
+    def cancel(self):
+        """取消正在进行的搜索，之后到达的结果都会被忽略"""
+        with self._lock:
+            self.search_id += 1
+            self._cancel.set()
+
+    def _run(self):
+        while True:
+            search_id, ai, game = self._queue.get()
+            with self._lock:
+                if search_id != self.search_id:
+                    continue  # 已被取消或有更新的搜索
+                self._cancel.clear()
+            ai.cancel = self._cancel  # 取消时搜索尽快结束
+            try:
+                move = ai.get_move(game)
+            finally:
+                ai.cancel = None
+            pygame.event.post(
+                pygame.event.Event(AI_MOVE_EVENT, search_id=search_id, move=move)
+            )
 
-# 创建游戏窗口
-screen = pygame.display.set_mode((SCREEN_SIZE, SCREEN_SIZE + INFO_BAR_HEIGHT))
-pygame.display.set_caption("五子棋")
-
-# 加载中文字体
-try:
-    # 尝试加载系统中文字体
-    font_paths = [
-        "C:/Windows/Fonts/simhei.ttf",  # Windows黑体
-        "C:/Windows/Fonts/msyh.ttc",  # Windows微软雅黑
-        "/System/Library/Fonts/PingFang.ttc",  # macOS
-        "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",  # Linux
-    ]
 
-    font = None
-    for path in font_paths:
-        if os.path.exists(path):
-            font = pygame.font.Font(path, FONT_SIZE)
-            break
+# 文字渲染缓存: (文本, 颜色) -> Surface
+_text_cache = {}
+TEXT_CACHE_SIZE = 512
 
-    # 如果没有找到中文字体，使用默认字体
-    if font is None:
-        font = pygame.font.SysFont(None, FONT_SIZE)
-        print("警告：未找到中文字体，可能无法正确显示中文")
-except Exception as e:
-    print(f"加载字体出错: {e}")
-    font = pygame.font.SysFont(None, FONT_SIZE)
+
+def render_text(text, color):
+    """渲染文字，相同的文本和颜色直接复用之前渲染的Surface"""
+    key = (text, color)
+    surface = _text_cache.get(key)
+    if surface is None:
+        if len(_text_cache) >= TEXT_CACHE_SIZE:
+            _text_cache.clear()
+        surface = font.render(text, True, color)
+        _text_cache[key] = surface
+    return surface
 
 
 # 按钮类
@@ -82,7 +193,7 @@ class Button:
         pygame.draw.rect(screen, color, self.rect)
         pygame.draw.rect(screen, BLACK, self.rect, 2)  # 边框
 
-        text_surface = font.render(self.text, True, BUTTON_TEXT_COLOR)
+        text_surface = render_text(self.text, BUTTON_TEXT_COLOR)
         text_rect = text_surface.get_rect(center=self.rect.center)
         screen.blit(text_surface, text_rect)
 
@@ -113,7 +224,13 @@ class HistoryListItem:
             f"{self.game_info['black']} VS {self.game_info['white']}"
         )
         self.text_lines.append(f"结果: {self.game_info['result']}")
-        self.text_lines.append(f"总步数: {self.game_info['total_moves']}")
+        if "match_move" in self.game_info:
+            self.text_lines.append(
+                f"总步数: {self.game_info['total_moves']}"
+                f" (第{self.game_info['match_move']}手出现该局面)"
+            )
+        else:
+            self.text_lines.append(f"总步数: {self.game_info['total_moves']}")
 
         # 计算文本行高度
         line_height = 20  # 每行文本的基本高度
@@ -144,7 +261,7 @@ class HistoryListItem:
             y_offset = (
                 self.rect.y + self.padding + i * (self.line_height + self.line_spacing)
             )
-            text_surface = font.render(line, True, BLACK)
+            text_surface = render_text(line, BLACK)
             screen.blit(text_surface, (self.rect.x + 10, y_offset))
 
     def is_hover(self, pos):
@@ -155,83 +272,270 @@ class HistoryListItem:
         return self.rect.collidepoint(pos)
 
 
-def draw_board():
-    """绘制棋盘"""
-    screen.fill(BOARD_COLOR)
+# 虚拟化历史记录列表类
+class HistoryListView:
+    """只为可见行(加少量预留行)创建列表项，摘要按页从HistoryStore获取"""
+
+    def __init__(self, store, rect, overscan=LIST_OVERSCAN):
+        self.store = store
+        self.rect = rect
+        self.overscan = overscan
+        self.scroll_offset = 0
+        self.items = {}  # 索引 -> HistoryListItem，只保存当前可见的行
+
+        # 所有列表项高度相同，用一个样本项计算行距
+        sample = HistoryListItem(
+            0,
+            0,
+            0,
+            0,
+            {"date": "", "black": "", "white": "", "result": "", "total_moves": 0},
+        )
+        self.row_height = sample.rect.height + LIST_ITEM_SPACING
+
+    def scroll(self, dy):
+        """滚动列表，限制在内容范围内"""
+        content_height = len(self.store) * self.row_height
+        min_offset = min(0, self.rect.height - content_height)
+        self.scroll_offset = max(min_offset, min(0, self.scroll_offset + dy))
+
+    def visible_range(self):
+        """返回需要创建的列表项索引范围[first, last)"""
+        first = -self.scroll_offset // self.row_height - self.overscan
+        last = (
+            (self.rect.height - self.scroll_offset) // self.row_height
+            + 1
+            + self.overscan
+        )
+        return max(0, first), min(len(self.store), last)
+
+    def layout(self):
+        """创建新进入可见范围的列表项，回收离开的列表项"""
+        first, last = self.visible_range()
+        for index in list(self.items):
+            if not first <= index < last:
+                del self.items[index]
+
+        for index in range(first, last):
+            y_pos = self.rect.y + self.scroll_offset + index * self.row_height
+            item = self.items.get(index)
+            if item is None:
+                item = HistoryListItem(
+                    self.rect.x,
+                    y_pos,
+                    self.rect.width,
+                    0,
+                    self.store.get_summary(index),
+                )
+                self.items[index] = item
+            item.rect.y = y_pos
+
+    def draw(self):
+        self.layout()
+        for item in self.items.values():
+            if item.rect.colliderect(self.rect):
+                item.draw()
+
+    def is_hover(self, pos):
+        for item in self.items.values():
+            item.is_hover(pos)
+
+    def item_at(self, pos):
+        """返回点击位置对应的列表项，不在列表区域内时返回None"""
+        if not self.rect.collidepoint(pos):
+            return None
+        for item in self.items.values():
+            if item.is_clicked(pos):
+                return item
+        return None
+
+
+def draw_board(surface, size, grid):
+    """在surface上绘制size路的空棋盘，grid为格子间距"""
+    surface.fill(BOARD_COLOR)
+    end = size * grid
 
     # 绘制网格线
-    for i in range(BOARD_SIZE):
+    for i in range(size):
         # 横线
         pygame.draw.line(
-            screen,
+            surface,
             GRID_COLOR,
-            (GRID_SIZE, (i + 1) * GRID_SIZE),
-            (SCREEN_SIZE - GRID_SIZE, (i + 1) * GRID_SIZE),
+            (grid, (i + 1) * grid),
+            (end, (i + 1) * grid),
         )
         # 竖线
         pygame.draw.line(
-            screen,
+            surface,
             GRID_COLOR,
-            ((i + 1) * GRID_SIZE, GRID_SIZE),
-            ((i + 1) * GRID_SIZE, SCREEN_SIZE - GRID_SIZE),
+            ((i + 1) * grid, grid),
+            ((i + 1) * grid, end),
         )
 
-    # 绘制五个小黑点（天元和四星）
-    dots = [(3, 3), (3, 11), (11, 3), (11, 11), (7, 7)]
-    for col, row in dots:
-        pygame.draw.circle(
-            screen, BLACK, ((col + 1) * GRID_SIZE, (row + 1) * GRID_SIZE), 5
+    # 绘制星位小黑点（天元和四星）
+    for row, col in get_star_points(size):
+        pygame.draw.circle(surface, BLACK, ((col + 1) * grid, (row + 1) * grid), 5)
+
+
+# 棋盘渲染类
+class BoardRenderer:
+    """缓存棋盘渲染结果，每帧只重绘发生变化的交叉点
+
+    空棋盘、两种棋子和每个序号的文字都只渲染一次，
+    draw()返回本帧需要更新到屏幕上的矩形列表，没有变化时为空列表。
+    格子间距和棋子大小由棋盘大小决定，每种大小使用一个渲染器。
+    """
+
+    def __init__(self, size=BOARD_SIZE):
+        self.size = size
+        self.grid = SCREEN_SIZE // (size + 1)
+        self.board_rect = pygame.Rect(0, 0, SCREEN_SIZE, SCREEN_SIZE)
+        self.background = pygame.Surface(self.board_rect.size).convert()
+        draw_board(self.background, size, self.grid)
+
+        # 预先渲染黑白棋子(带透明通道)
+        radius = self.grid // 2 - 2
+        self.stone_surfaces = {}
+        for stone in (1, 2):
+            surface = pygame.Surface((self.grid, self.grid), pygame.SRCALPHA)
+            center = (self.grid // 2, self.grid // 2)
+            color = BLACK if stone == 1 else WHITE
+            pygame.draw.circle(surface, color, center, radius)
+            # 绘制白棋边框
+            if stone == 2:
+                pygame.draw.circle(surface, BLACK, center, radius, 1)
+            self.stone_surfaces[stone] = surface
+
+        self.glyphs = {}  # (序号, 棋子颜色) -> 文字Surface
+        self.marks = {}  # 分析标记 -> Surface
+        self.drawn = None  # 屏幕上当前显示的[(棋子, 序号, 分析标记), ...]，按行优先排列
+
+    def invalidate(self):
+        """下次绘制时重绘整个棋盘(切换界面后调用)"""
+        self.drawn = None
+
+    def cell_rect(self, row, col):
+        grid = self.grid
+        return pygame.Rect(
+            (col + 1) * grid - grid // 2, (row + 1) * grid - grid // 2, grid, grid
         )
 
-
-def draw_stones(game):
-    """绘制棋子"""
-    for row in range(BOARD_SIZE):
-        for col in range(BOARD_SIZE):
-            stone = game.board.board[row][col]
-            if stone != 0:
-                # 绘制棋子
-                color = BLACK if stone == 1 else WHITE
+    def cell_at(self, pos):
+        """屏幕坐标对应的交叉点(row, col)，不在棋盘上时返回None"""
+        x, y = pos
+        col = round((x - self.grid) / self.grid)
+        row = round((y - self.grid) / self.grid)
+        if 0 <= row < self.size and 0 <= col < self.size:
+            return row, col
+        return None
+
+    def _get_glyph(self, move_number, stone):
+        glyph = self.glyphs.get((move_number, stone))
+        if glyph is None:
+            # 根据棋子颜色选择对比色
+            text_color = WHITE if stone == 1 else BLACK
+            glyph = font.render(str(move_number), True, text_color)
+            self.glyphs[(move_number, stone)] = glyph
+        return glyph
+
+    def _get_mark(self, mark):
+        """分析标记(热度, 主要变化序号, 该手的棋子颜色)对应的半透明Surface"""
+        surface = self.marks.get(mark)
+        if surface is None:
+            heat, pv_index, stone = mark
+            surface = pygame.Surface((self.grid, self.grid), pygame.SRCALPHA)
+            center = (self.grid // 2, self.grid // 2)
+            radius = self.grid // 2 - 2
+            if heat is not None:
+                color = [
+                    round(low + (high - low) * heat)
+                    for low, high in zip(HEAT_LOW_COLOR, HEAT_HIGH_COLOR)
+                ]
                 pygame.draw.circle(
-                    screen,
-                    color,
-                    ((col + 1) * GRID_SIZE, (row + 1) * GRID_SIZE),
-                    STONE_RADIUS,
+                    surface, (*color, 90 + round(110 * heat)), center, radius
                 )
-                # 绘制白棋边框
-                if stone == 2:
-                    pygame.draw.circle(
-                        screen,
-                        BLACK,
-                        ((col + 1) * GRID_SIZE, (row + 1) * GRID_SIZE),
-                        STONE_RADIUS,
-                        1,
-                    )
-
-                # 显示棋子序号
-                move_number = game.move_numbers[row][col]
-                if move_number > 0:
-                    # 根据棋子颜色选择对比色
-                    text_color = WHITE if stone == 1 else BLACK
-                    # 创建序号文本
-                    number_text = font.render(str(move_number), True, text_color)
-                    # 计算文本位置(居中)
-                    text_rect = number_text.get_rect(
-                        center=((col + 1) * GRID_SIZE, (row + 1) * GRID_SIZE)
-                    )
-                    # 绘制序号
-                    screen.blit(number_text, text_rect)
-
-
-def draw_game_info(game, is_ai_mode=False, ai_player=None, ai_thinking=False):
-    """绘制游戏信息"""
-    info_bar = pygame.Rect(0, SCREEN_SIZE, SCREEN_SIZE, INFO_BAR_HEIGHT)
-    pygame.draw.rect(screen, WHITE, info_bar)
+            if pv_index is not None:
+                # 主要变化画成半透明的棋子，标上第几手
+                stone_color = BLACK if stone == 1 else WHITE
+                pygame.draw.circle(
+                    surface, (*stone_color, 150), center, radius * 3 // 4
+                )
+                text_color = WHITE if stone == 1 else BLACK
+                glyph = font.render(str(pv_index), True, text_color)
+                surface.blit(glyph, glyph.get_rect(center=center))
+            self.marks[mark] = surface
+        return surface
+
+    def _draw_cell(self, row, col, stone, move_number, mark=None):
+        rect = self.cell_rect(row, col)
+        # 先用空棋盘覆盖该交叉点，再绘制棋子和序号
+        screen.blit(self.background, rect, rect)
+        if stone != 0:
+            screen.blit(self.stone_surfaces[stone], rect)
+            if move_number > 0:
+                glyph = self._get_glyph(move_number, stone)
+                screen.blit(glyph, glyph.get_rect(center=rect.center))
+        elif mark is not None:
+            screen.blit(self._get_mark(mark), rect)
+        return rect
+
+    def draw(self, game, overlay=None):
+        """把game的棋盘绘制到屏幕，返回需要更新的矩形列表
+
+        overlay为{(row, col): 分析标记}，绘制在空交叉点上。
+        """
+        board = game.board.board
+        move_numbers = game.move_numbers
+        size = self.size
+        overlay = overlay or {}
+        state = [
+            (board[row][col], move_numbers[row][col], overlay.get((row, col)))
+            for row in range(size)
+            for col in range(size)
+        ]
+
+        if self.drawn is None:
+            screen.blit(self.background, self.board_rect)
+            for i, cell in enumerate(state):
+                if cell[0] != 0 or cell[2] is not None:
+                    self._draw_cell(i // size, i % size, *cell)
+            self.drawn = state
+            return [self.board_rect]
+
+        dirty_rects = []
+        if state != self.drawn:
+            for i, (cell, old_cell) in enumerate(zip(state, self.drawn)):
+                if cell != old_cell:
+                    dirty_rects.append(self._draw_cell(i // size, i % size, *cell))
+            self.drawn = state
+        return dirty_rects
+
+
+_board_renderers = {}  # 棋盘大小 -> BoardRenderer
+
+
+def get_board_renderer(size):
+    """获取(并缓存)size路棋盘的渲染器"""
+    if size not in _board_renderers:
+        _board_renderers[size] = BoardRenderer(size)
+    return _board_renderers[size]
+
+
+def get_game_info_texts(
+    game, is_ai_mode=False, ai_player=None, ai_thinking=False, netplay=None, hint=None
+):
+    """生成信息栏中的文字，返回[(文本, 位置), ...]
 
-    # 绘制当前状态信息
+    hint为提示文字(见get_hint_text)，与悔棋信息、AI名称共用第三行，悔棋信息优先。
+    """
+    # 当前状态信息
     if game.game_over:
         if game.winner:
-            if game.resigned_player:
+            if game.timeout_player:
+                player_str = "黑棋" if game.timeout_player == 1 else "白棋"
+                winner_str = "白棋" if game.timeout_player == 1 else "黑棋"
+                status_text = f"游戏结束！{player_str}超时，{winner_str}获胜！"
+            elif game.resigned_player:
                 # 显示认输信息
                 player_str = "黑棋" if game.resigned_player == 1 else "白棋"
                 winner_str = "白棋" if game.resigned_player == 1 else "黑棋"
@@ -248,57 +552,81 @@ def draw_game_info(game, is_ai_mode=False, ai_player=None, ai_thinking=False):
         # 如果AI正在思考，显示思考状态
         if is_ai_mode and ai_thinking and game.current_player == 2:
             status_text += " (AI思考中...)"
+        elif netplay:
+            status_text += (
+                " (本方)" if game.current_player == netplay.local_player else " (对方)"
+            )
 
     # 添加回合数显示
     turn_text = f"回合数：{game.turn_count}"
+    if game.board.rule == RULE_RENJU:
+        turn_text += "  连珠规则"
+        if game.forbidden_move and not game.game_over:
+            turn_text += "  (黑棋禁手，不能落子)"
+    if netplay:
+        turn_text += "  网络对战: " + netplay.status_text()
+    if game.clock:
+        turn_text += f"  黑 {game.clock.display(1)}  白 {game.clock.display(2)}"
 
     # 添加悔棋信息显示
     undo_text = ""
     if game.last_undo_player is not None:
         undo_text = ("黑棋" if game.last_undo_player == 1 else "白棋") + "悔棋"
 
-    # 渲染文本
-    status_surface = font.render(status_text, True, INFO_COLOR)
-    turn_surface = font.render(turn_text, True, INFO_COLOR)
-
     # 放置文本 - 将文本放在左侧
-    screen.blit(status_surface, (20, SCREEN_SIZE + 20))
-    screen.blit(turn_surface, (20, SCREEN_SIZE + 50))
+    texts = [
+        (status_text, (20, SCREEN_SIZE + 20)),
+        (turn_text, (20, SCREEN_SIZE + 50)),
+    ]
 
     # 显示悔棋信息
     if undo_text:
-        undo_surface = font.render(undo_text, True, INFO_COLOR)
-        screen.blit(undo_surface, (20, SCREEN_SIZE + 80))
-
+        texts.append((undo_text, (20, SCREEN_SIZE + 80)))
+    elif hint:
+        texts.append((hint, (20, SCREEN_SIZE + 80)))
     # 如果是人机对战模式，显示AI名称
-    if is_ai_mode and ai_player:
-        ai_text = font.render(f"对战: {ai_player.name}", True, INFO_COLOR)
-        screen.blit(ai_text, (20, SCREEN_SIZE + 80))
+    elif is_ai_mode and ai_player:
+        texts.append((f"对战: {ai_player.name}", (20, SCREEN_SIZE + 80)))
 
+    return texts
+
+
+def draw_info_panel(texts, buttons):
+    """绘制底部信息栏(文字和按钮)，返回信息栏矩形"""
+    info_bar = pygame.Rect(0, SCREEN_SIZE, SCREEN_SIZE, INFO_BAR_HEIGHT)
+    pygame.draw.rect(screen, WHITE, info_bar)
 
-def draw_history_screen(history_items, back_button, scroll_offset=0):
+    for text, pos in texts:
+        screen.blit(render_text(text, INFO_COLOR), pos)
+
+    for button in buttons:
+        button.draw()
+    return info_bar
+
+
+def get_panel_key(texts, buttons):
+    """信息栏的显示状态，状态不变时不需要重绘信息栏"""
+    return tuple(texts), tuple((b.text, b.hovered) for b in buttons)
+
+
+def draw_history_screen(history_view, back_button, title_text="历史对局记录"):
     """绘制历史记录界面"""
     screen.fill(WHITE)
 
     # 绘制标题
-    title = font.render("历史对局记录", True, BLACK)
+    title = render_text(title_text, BLACK)
     screen.blit(title, (SCREEN_SIZE // 2 - title.get_width() // 2, 20))
 
     # 绘制历史记录列表
-    list_area = pygame.Rect(50, 60, SCREEN_SIZE - 100, SCREEN_SIZE - 100)
+    list_area = history_view.rect
     pygame.draw.rect(screen, (240, 240, 240), list_area)
     pygame.draw.rect(screen, BLACK, list_area, 1)
 
     # 裁剪列表区域，防止项目绘制超出
     screen.set_clip(list_area)
 
-    # 绘制列表项
-    y_pos = 60 + scroll_offset
-    for item in history_items:
-        if list_area.y - LIST_ITEM_HEIGHT < y_pos < list_area.bottom:
-            item.rect.y = y_pos
-            item.draw()
-        y_pos += item.rect.height + 5
+    # 只绘制可见的列表项
+    history_view.draw()
 
     # 重置裁剪区域
     screen.set_clip(None)
@@ -307,32 +635,165 @@ def draw_history_screen(history_items, back_button, scroll_offset=0):
     back_button.draw()
 
 
-def draw_replay_screen(
-    game, replay_info, back_button, step_prev_button, step_next_button, auto_play_button
-):
-    """绘制回放界面"""
-    draw_board()
-    draw_stones(game)
-
-    # 绘制回放信息
-    info_bar = pygame.Rect(0, SCREEN_SIZE, SCREEN_SIZE, INFO_BAR_HEIGHT)
-    pygame.draw.rect(screen, WHITE, info_bar)
-
+def get_replay_info_texts(replay_info, analysis_on=False, analysis=None, player=1):
+    """生成回放界面信息栏中的文字，analysis为LiveAnalysis的分析结果"""
     # 显示当前回放信息
     info_text = f"回放: {replay_info['black']} VS {replay_info['white']} | 步数: {replay_info['current_step']}/{replay_info['total_moves']}"
-    info_surface = font.render(info_text, True, INFO_COLOR)
-    screen.blit(info_surface, (20, SCREEN_SIZE + 20))
 
     # 显示对局结果
     result_text = f"对局结果: {replay_info['result']}"
-    result_surface = font.render(result_text, True, INFO_COLOR)
-    screen.blit(result_surface, (20, SCREEN_SIZE + 50))
 
-    # 绘制控制按钮
-    back_button.draw()
-    step_prev_button.draw()
-    step_next_button.draw()
-    auto_play_button.draw()
+    # 显示分析结果: 分数统一换算为黑方视角
+    if not analysis_on:
+        analysis_text = "按A键分析当前局面"
+    elif analysis is None:
+        analysis_text = "分析中..."
+    elif analysis["timed_out"]:
+        analysis_text = "分析: 超时，未能完成第一层搜索"
+    elif not analysis["candidates"]:
+        analysis_text = "分析: 没有可下的位置"
+    else:
+        from .analysis import format_move
+
+        score = analysis["candidates"][0][0]
+        if player == 2:
+            score = -score
+        if abs(score) >= 100000:
+            score_text = "黑方必胜" if score > 0 else "白方必胜"
+        else:
+            score_text = f"黑方{score:+.0f}"
+        depth_text = f"{analysis['depth']}" + ("" if analysis["done"] else "...")
+        pv_text = " ".join(format_move(move) for move in analysis["pv"])
+        analysis_text = f"分析(深度{depth_text}): {score_text} | 变化: {pv_text}"
+
+    return [
+        (info_text, (20, SCREEN_SIZE + 20)),
+        (result_text, (20, SCREEN_SIZE + 50)),
+        (analysis_text, (20, SCREEN_SIZE + 75)),
+    ]
+
+
+def get_clock_refresh(game):
+    """距离棋钟显示下一次变化(或走子方超时)的毫秒数"""
+    left = game.clock.time_left(game.current_player)
+    if left < 10:
+        return max(1, min(100, int(left * 1000) + 1))
+    return max(1, int((left % 1) * 1000) + 1)
+
+
+def get_hint_text(hint):
+    """提示的文字: 最佳的几个着手及其分数(走子方视角)，hint为LiveAnalysis的分析结果"""
+    if hint is None:
+        return "提示: 计算中..."
+    if hint["timed_out"]:
+        return "提示: 计算超时"
+    if not hint["candidates"]:
+        return "提示: 没有可下的位置"
+    from .analysis import format_move
+
+    moves = []
+    for score, move in hint["candidates"]:
+        if abs(score) >= 100000:
+            score_text = "必胜" if score > 0 else "必败"
+        else:
+            score_text = f"{score:+.0f}"
+        moves.append(f"{format_move(move)}({score_text})")
+    depth_text = f"{hint['depth']}" + ("" if hint["done"] else "...")
+    return f"提示(深度{depth_text}): " + " ".join(moves)
+
+
+def is_human_turn(game, is_ai_mode, ai_thinking, netplay):
+    """当前是否轮到本地的人类玩家落子(可以显示提示)"""
+    if game.game_over or ai_thinking:
+        return False
+    if is_ai_mode and game.current_player == 2:
+        return False
+    return not netplay or game.current_player == netplay.local_player
+
+
+def get_analysis_overlay(analysis, player):
+    """把分析结果转换为棋盘上的标记{(row, col): (热度, 主要变化序号, 棋子颜色)}
+
+    候选点按与最佳着手的分差着色(热度0.2~1，取一位小数以便缓存标记)，
+    主要变化的着手画成标有序号的半透明棋子。
+    """
+    if analysis is None or not analysis["candidates"]:
+        return {}
+    candidates = analysis["candidates"]
+    best = candidates[0][0]
+    spread = best - candidates[-1][0]
+    overlay = {}
+    for score, move in candidates:
+        heat = 1.0 if spread <= 0 else 1 - 0.8 * (best - score) / spread
+        overlay[move] = (round(heat, 1), None, None)
+
+    stone = player
+    for i, move in enumerate(analysis["pv"], 1):
+        heat = overlay.get(move, (None,))[0]
+        overlay[move] = (heat, i, stone)
+        stone = 3 - stone
+    return overlay
+
+
+def find_same_positions(board):
+    """在历史记录中查找出现过该局面的对局，返回{文件路径: 最早出现的手数}
+
+    会先增量更新局面索引，棋谱多时可能较慢，界面中通过PositionSearchWorker在后台调用。
+    """
+    from .position_index import PositionIndex, ensure_history_index
+
+    index_path = ensure_history_index(HISTORY_DIR)
+    matches = {}
+    with PositionIndex(index_path) as index:
+        for filepath, _, move_no in index.find(board):
+            if not os.path.exists(filepath):
+                continue  # 索引建立后被删除的棋谱
+            if filepath not in matches or move_no < matches[filepath]:
+                matches[filepath] = move_no
+    return matches
+
+
+class PositionSearchWorker:
+    """在后台线程中更新局面索引并查找相同局面，完成后发送POSITION_SEARCH_EVENT
+
+    与AIWorker一样，事件中带有search_id，界面只接受最新一次查找的结果。
+    查找按顺序在同一个线程中进行，不会同时写索引文件。
+    """
+
+    def __init__(self):
+        self.search_id = 0
+        self.busy = False
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="position-search", daemon=True
+        )
+        self._thread.start()
+
+    def start(self, board):
+        """开始查找board(二维列表)的相同局面，返回本次查找的search_id"""
+        self.search_id += 1
+        self.busy = True
+        self._queue.put((self.search_id, [row[:] for row in board]))
+        return self.search_id
+
+    def cancel(self):
+        """放弃正在进行的查找，之后到达的结果都会被忽略"""
+        self.search_id += 1
+        self.busy = False
+
+    def _run(self):
+        while True:
+            search_id, board = self._queue.get()
+            try:
+                matches = find_same_positions(board)
+            except (OSError, ValueError) as e:
+                print(f"查找相同局面失败: {e}")
+                matches = {}
+            pygame.event.post(
+                pygame.event.Event(
+                    POSITION_SEARCH_EVENT, search_id=search_id, matches=matches
+                )
+            )
 
 
 def draw_ai_select_screen(ai_buttons, back_button):
@@ -340,7 +801,7 @@ def draw_ai_select_screen(ai_buttons, back_button):
     screen.fill(WHITE)
 
     # 绘制标题
-    title = font.render("选择AI难度", True, BLACK)
+    title = render_text("选择AI难度", BLACK)
     screen.blit(title, (SCREEN_SIZE // 2 - title.get_width() // 2, 100))
 
     # 绘制AI难度按钮
@@ -354,8 +815,7 @@ def draw_ai_select_screen(ai_buttons, back_button):
 def load_replay_game(sgf_filepath, step=None):
     """加载回放游戏"""
     info, moves = parse_sgf(sgf_filepath)
-    game = Game()
-    game.reset()
+    game = Game(int(str(info.get("SZ", BOARD_SIZE)).split(":")[0]), get_rule(info))
 
     # 如果指定了步数，则加载到该步
     max_step = len(moves) if step is None else min(step, len(moves))
@@ -363,7 +823,7 @@ def load_replay_game(sgf_filepath, step=None):
     # 加载指定步数的棋子
     for i in range(max_step):
         row, col, player = moves[i]
-        game.board.board[row][col] = player
+        game.board.place_stone(row, col, player)
         game.move_numbers[row][col] = i + 1
         game.move_history.append((row, col, player))
         game.turn_count = i + 1
@@ -375,29 +835,95 @@ def load_replay_game(sgf_filepath, step=None):
     return game, info, moves
 
 
-def main():
-    game = Game()
+def get_player_names(is_ai_mode, ai_player):
+    """对局双方在棋谱中的名称"""
+    if is_ai_mode:
+        return "玩家", ai_player.name if ai_player else "AI"
+    return "黑棋", "白棋"
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    init_display()
+    os.makedirs(HISTORY_DIR, exist_ok=True)  # 确保历史记录目录存在
+
+    # 网络对战的对局状态由主机同步，不计时
+    netplay_mode = args.host_game or args.join
+    time_control = None if netplay_mode else args.time
+    game = Game(args.size, args.rule, time_control)
     current_screen = GAME_SCREEN
-    history_scroll_offset = 0
+    history_view = None
+    history_title = "历史对局记录"
+    replay_filepath = None
     replay_info = None
     replay_game = None
     replay_moves = None
     replay_step = 0
     auto_play = False
-    auto_play_timer = 0
+    auto_play_next = 0  # 自动播放下一步的时间
+    position_search = PositionSearchWorker()  # 回放界面的相同局面查找
+    live_analysis = None  # 回放界面的后台分析，第一次按A键时创建
+    analysis_on = False
+    hint_analysis = None  # 对局中的提示，第一次点击提示按钮时创建
+    hint_on = False
 
     # AI相关变量
     ai_player = None  # 当前AI实例
     is_ai_mode = False  # 是否为人机对战模式
     ai_thinking = False  # AI是否在思考中
-    ai_thinking_time = 0  # AI思考时间计时器
+    ai_worker = AIWorker()
+    ai_search = None  # 正在进行的后台搜索的search_id
     ai_move = None  # AI的落子位置
     ai_thinking_start_time = 0  # AI开始思考的时间
+    ai_level = None  # 当前AI难度级别
+
+    # 网络对战: 主机执黑，加入的一方执白，对局状态以主机为准
+    netplay = None
+    netplay_watcher = None
+    if args.host_game or args.join:
+        from .netplay import NetPlay, NetPlayWatcher
+
+        if args.host_game:
+            netplay = NetPlay(game, "0.0.0.0", args.host_game, listen=True)
+        else:
+            host, _, port = args.join.partition(":")
+            netplay = NetPlay(game, host, int(port or 9888))
+        # 空闲时在后台等待套接字，有消息(或需要重连)时唤醒主循环
+        netplay_watcher = NetPlayWatcher(
+            netplay,
+            on_ready=lambda: pygame.event.post(pygame.event.Event(NETPLAY_EVENT)),
+        )
+
+    # 自动保存: 每一步都在后台写入日志，启动时恢复上次未完成的对局
+    if netplay:
+        autosave = AutosaveWriter(HISTORY_DIR, journal_name=NETWORK_JOURNAL_NAME)
+        recovered = None
+    else:
+        autosave = AutosaveWriter(HISTORY_DIR)
+        recovered = load_journal(autosave.journal_path)
+    if recovered:
+        game = Game(recovered["size"], recovered["rule"], time_control)
+        ai_level = recovered["ai_level"]
+        if ai_level:
+            ai_player = get_ai_by_level(ai_level)
+            is_ai_mode = True
+        for row, col, _ in recovered["moves"]:
+            game.make_move(row, col)
+        autosave.start_game(game, recovered["black"], recovered["white"], ai_level)
+        if game.game_over:
+            # 上次在保存棋谱之前中断
+            autosave.finish(
+                game, recovered["black"], recovered["white"], game.get_result_string()
+            )
+        elif is_ai_mode and game.current_player == 2:
+            ai_thinking = True
+    else:
+        autosave.start_game(game, "黑棋", "白棋")
 
     # 创建按钮 - 调整按钮位置到右侧
-    button_width = 80
-    button_spacing = 15
-    buttons_start_x = SCREEN_SIZE - (button_width * 5 + button_spacing * 4) - 20
+    button_width = 76
+    button_spacing = 8
+    buttons_start_x = SCREEN_SIZE - (button_width * 6 + button_spacing * 5) - 20
     buttons_y = SCREEN_SIZE + 30
 
     restart_button = Button(
@@ -424,11 +950,19 @@ def main():
         "悔棋",
     )
 
-    history_button = Button(
+    hint_button = Button(
         buttons_start_x + (button_width + button_spacing) * 4,
         buttons_y,
         button_width,
         BUTTON_HEIGHT,
+        "提示",
+    )
+
+    history_button = Button(
+        buttons_start_x + (button_width + button_spacing) * 5,
+        buttons_y,
+        button_width,
+        BUTTON_HEIGHT,
         "历史记录",
     )
 
@@ -467,6 +1001,14 @@ def main():
         "自动播放",
     )
 
+    position_search_button = Button(
+        buttons_start_x + (button_width + button_spacing) * 3,
+        buttons_y,
+        button_width,
+        BUTTON_HEIGHT,
+        "相同局面",
+    )
+
     # AI难度选择按钮
     ai_easy_button = Button(
         SCREEN_SIZE // 2 - button_width // 2, 200, button_width, BUTTON_HEIGHT, "初级"
@@ -495,80 +1037,211 @@ def main():
         restart_button,
         resign_button,
         undo_button,
+        hint_button,
         history_button,
         ai_button,
     ]
 
+    # 回放按钮组
+    replay_buttons = [
+        back_button,
+        step_prev_button,
+        step_next_button,
+        auto_play_button,
+        position_search_button,
+    ]
+
+    # 渲染状态: 只有界面切换时才整屏刷新，否则只更新变化的区域
+    board_renderer = get_board_renderer(game.board.size)
+    drawn_screen = None
+    panel_key = None
+    clock = pygame.time.Clock()
+    redraw_pending = True  # 启动后先绘制一次
+
     while True:
+        # 计算下一个定时器到期的时间，没有事件时一直睡眠到那时
+        current_time = pygame.time.get_ticks()
+        min_thinking_time = 0 if game.clock else AI_MIN_THINKING_TIME
+        deadlines = []
+        if current_screen == GAME_SCREEN and ai_thinking and ai_move is not None:
+            deadlines.append(ai_thinking_start_time + min_thinking_time)
+        if current_screen == GAME_SCREEN and game.clock and not game.game_over:
+            # 棋钟显示变化或走子方超时的时刻
+            deadlines.append(current_time + get_clock_refresh(game))
+        if (
+            current_screen == REPLAY_SCREEN
+            and auto_play
+            and replay_step < replay_info["total_moves"]
+        ):
+            deadlines.append(auto_play_next)
+        if current_screen == GAME_SCREEN and game.last_undo_player is not None:
+            remaining = game.undo_notice_until - time.monotonic()
+            deadlines.append(current_time + max(0, int(remaining * 1000) + 1))
+        timeout = max(1, min(deadlines) - current_time) if deadlines else None
+        if redraw_pending:
+            timeout = 0
+        if netplay_watcher:
+            # 本轮可能连接、断开或留下未发完的数据，按当前的套接字重新等待
+            netplay_watcher.rearm()
+        events = wait_for_events(timeout)
+
         mouse_pos = pygame.mouse.get_pos()
         current_time = pygame.time.get_ticks()
+        changed = redraw_pending or bool(events)
+        redraw_pending = False
+
+        # 网络对战: 处理对方的着手、悔棋、认输以及重新同步
+        if netplay:
+            for kind, data in netplay.poll():
+                changed = True
+                game = netplay.game
+                if kind == "move":
+                    autosave.record_move(*data)
+                elif kind == "undo":
+                    for _ in range(data):
+                        autosave.record_undo()
+                elif kind in ("sync", "restart"):
+                    autosave.start_game(game, "黑棋", "白棋")
+                if kind in ("move", "resign") and game.game_over:
+                    autosave.finish(game, "黑棋", "白棋", game.get_result_string())
 
         # 事件处理
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
+                if netplay:
+                    netplay_watcher.close()
+                    netplay.close()
+                autosave.close()
                 pygame.quit()
                 sys.exit()
+            elif event.type == AI_MOVE_EVENT:
+                # 只接受当前这次思考的结果
+                if ai_thinking and event.search_id == ai_search:
+                    ai_move = event.move or (None, None)
+            elif event.type == POSITION_SEARCH_EVENT:
+                # 离开回放界面时查找已被取消，过期的结果直接忽略
+                if event.search_id == position_search.search_id:
+                    position_search.busy = False
+                    position_search_button.text = "相同局面"
+                    matches = event.matches
+                    history_title = f"相同局面: 共{len(matches)}局"
+                    history_view = HistoryListView(
+                        HistoryStore(
+                            HISTORY_DIR,
+                            files=sorted(matches, reverse=True),
+                            match_moves=matches,
+                        ),
+                        pygame.Rect(50, 60, SCREEN_SIZE - 100, SCREEN_SIZE - 100),
+                    )
+                    current_screen = HISTORY_SCREEN
+                    auto_play = False
+                    auto_play_button.text = "自动播放"
+                    if live_analysis:
+                        live_analysis.cancel()
+            elif event.type == pygame.KEYDOWN:
+                if current_screen == REPLAY_SCREEN and event.key == pygame.K_a:
+                    # 开关回放局面分析
+                    analysis_on = not analysis_on
+                    if analysis_on and live_analysis is None:
+                        from .live_analysis import LiveAnalysis
+
+                        live_analysis = LiveAnalysis(
+                            on_update=lambda: pygame.event.post(
+                                pygame.event.Event(ANALYSIS_EVENT)
+                            )
+                        )
+                    elif not analysis_on:
+                        live_analysis.cancel()
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:  # 左键点击
                     if current_screen == GAME_SCREEN:
                         # 游戏界面按钮点击
-                        if restart_button.is_clicked(event.pos):
+                        if restart_button.is_clicked(event.pos) and netplay:
+                            if netplay.restart():
+                                autosave.start_game(game, "黑棋", "白棋")
+                        elif resign_button.is_clicked(event.pos) and netplay:
+                            if not game.game_over and netplay.resign():
+                                autosave.finish(
+                                    game, "黑棋", "白棋", game.get_result_string()
+                                )
+                        elif undo_button.is_clicked(event.pos) and netplay:
+                            for _ in range(netplay.undo()):
+                                autosave.record_undo()
+                        elif restart_button.is_clicked(event.pos):
                             game.reset()
                             is_ai_mode = False  # 重置AI模式
                             ai_thinking = False
+                            autosave.start_game(game, "黑棋", "白棋")
                         elif resign_button.is_clicked(event.pos) and not game.game_over:
                             game.resign()
                             ai_thinking = False
-                            if is_ai_mode and game.game_over:
-                                # 保存AI对战棋谱
+                            if game.game_over:
+                                # 保存棋谱
                                 result = "B+R" if game.winner == 1 else "W+R"
-                                ai_name = ai_player.name if ai_player else "AI"
-                                create_history_record(
-                                    game, HISTORY_DIR, "玩家", ai_name, result
+                                autosave.finish(
+                                    game,
+                                    *get_player_names(is_ai_mode, ai_player),
+                                    result,
                                 )
                         elif undo_button.is_clicked(event.pos) and not game.game_over:
                             if is_ai_mode:
                                 # 在AI模式下，需要悔两步棋（玩家和AI的各一步）
-                                game.undo()  # 撤销AI的一步
-                                game.undo()  # 撤销玩家的一步
+                                # AI还在思考时只撤销玩家刚下的一步
+                                for _ in range(1 if ai_thinking else 2):
+                                    if game.undo():
+                                        autosave.record_undo()
                                 ai_thinking = False
-                            else:
-                                game.undo()
+                            elif game.undo():
+                                autosave.record_undo()
+                        elif hint_button.is_clicked(event.pos):
+                            # 开关提示: 轮到本方时在后台计算最佳的几个着手
+                            hint_on = not hint_on
+                            hint_button.text = "关闭提示" if hint_on else "提示"
+                            if hint_on and hint_analysis is None:
+                                from .live_analysis import LiveAnalysis
+
+                                hint_analysis = LiveAnalysis(
+                                    max_depth=HINT_MAX_DEPTH,
+                                    top_n=HINT_TOP_N,
+                                    time_limit=HINT_TIME_LIMIT,
+                                    on_update=lambda: pygame.event.post(
+                                        pygame.event.Event(ANALYSIS_EVENT)
+                                    ),
+                                )
                         elif history_button.is_clicked(event.pos):
                             # 切换到历史记录界面
                             current_screen = HISTORY_SCREEN
-                            # 加载历史记录
-                            sgf_files = get_sgf_files(HISTORY_DIR)
-                            history_items = []
-
-                            # 使用动态位置创建历史记录项
-                            y_pos = 60  # 起始Y位置
-                            for file in sgf_files:
-                                summary = get_game_summary(file)
-                                item = HistoryListItem(
-                                    50, y_pos, SCREEN_SIZE - 100, 0, summary
-                                )
-                                history_items.append(item)
-                                # 更新下一个项目的位置
-                                y_pos += item.rect.height + 10
+                            if hint_analysis:
+                                hint_analysis.cancel()
+                            # 加载历史记录(摘要在显示时按页读取)
+                            history_title = "历史对局记录"
+                            history_view = HistoryListView(
+                                HistoryStore(HISTORY_DIR),
+                                pygame.Rect(
+                                    50, 60, SCREEN_SIZE - 100, SCREEN_SIZE - 100
+                                ),
+                            )
                         elif ai_button.is_clicked(event.pos):
-                            # 切换到AI选择界面
-                            current_screen = AI_SELECT_SCREEN
+                            # 切换到AI选择界面(网络对战中不可用)
+                            if not netplay:
+                                current_screen = AI_SELECT_SCREEN
                         elif not game.game_over and not ai_thinking:
                             # 棋盘下棋
-                            x, y = event.pos
-                            if (
-                                GRID_SIZE // 2 <= x <= SCREEN_SIZE - GRID_SIZE // 2
-                                and GRID_SIZE // 2 <= y <= SCREEN_SIZE - GRID_SIZE // 2
-                            ):
-                                col = round((x - GRID_SIZE) / GRID_SIZE)
-                                row = round((y - GRID_SIZE) / GRID_SIZE)
+                            cell = board_renderer.cell_at(event.pos)
+                            if cell is not None:
+                                row, col = cell
 
                                 if is_ai_mode and game.current_player == 2:
                                     # 如果是AI回合，不允许玩家下棋
                                     continue
 
-                                if game.make_move(row, col):
+                                if netplay:
+                                    moved = netplay.play(row, col)
+                                else:
+                                    moved = game.make_move(row, col)
+                                if moved:
+                                    autosave.record_move(*game.move_history[-1])
+
                                     # 如果是人机模式且游戏未结束，准备AI下棋
                                     if (
                                         is_ai_mode
@@ -587,25 +1260,18 @@ def main():
                                             if game.winner == 1
                                             else "W+R" if game.winner == 2 else "Draw"
                                         )
-                                        if is_ai_mode:
-                                            ai_name = (
-                                                ai_player.name if ai_player else "AI"
-                                            )
-                                            create_history_record(
-                                                game,
-                                                HISTORY_DIR,
-                                                "玩家",
-                                                ai_name,
-                                                result,
-                                            )
-                                        else:
-                                            create_history_record(
-                                                game,
-                                                HISTORY_DIR,
-                                                "黑棋",
-                                                "白棋",
-                                                result,
-                                            )
+                                        autosave.finish(
+                                            game,
+                                            *get_player_names(is_ai_mode, ai_player),
+                                            result,
+                                        )
+                                elif game.timeout_player:
+                                    # 落子时已经超时
+                                    autosave.finish(
+                                        game,
+                                        *get_player_names(is_ai_mode, ai_player),
+                                        game.get_result_string(),
+                                    )
 
                     elif current_screen == AI_SELECT_SCREEN:
                         # AI选择界面
@@ -613,21 +1279,27 @@ def main():
                             current_screen = GAME_SCREEN
                         elif ai_easy_button.is_clicked(event.pos):
                             # 选择初级AI
-                            ai_player = get_ai_by_level(1)
+                            ai_level = 1
+                            ai_player = get_ai_by_level(ai_level)
                             is_ai_mode = True
                             game.reset()
+                            autosave.start_game(game, "玩家", ai_player.name, ai_level)
                             current_screen = GAME_SCREEN
                         elif ai_medium_button.is_clicked(event.pos):
                             # 选择中级AI
-                            ai_player = get_ai_by_level(2)
+                            ai_level = 2
+                            ai_player = get_ai_by_level(ai_level)
                             is_ai_mode = True
                             game.reset()
+                            autosave.start_game(game, "玩家", ai_player.name, ai_level)
                             current_screen = GAME_SCREEN
                         elif ai_hard_button.is_clicked(event.pos):
                             # 选择高级AI
-                            ai_player = get_ai_by_level(3)
+                            ai_level = 3
+                            ai_player = get_ai_by_level(ai_level)
                             is_ai_mode = True
                             game.reset()
+                            autosave.start_game(game, "玩家", ai_player.name, ai_level)
                             current_screen = GAME_SCREEN
 
                     elif current_screen == HISTORY_SCREEN:
@@ -636,33 +1308,40 @@ def main():
                             current_screen = GAME_SCREEN
                         else:
                             # 检查是否点击了历史记录项
-                            for item in history_items:
-                                if item.is_clicked(event.pos):
-                                    # 加载所选棋谱
-                                    replay_game, info, moves = load_replay_game(
-                                        item.game_info["filepath"]
-                                    )
-                                    replay_info = {
-                                        "black": info.get("PB", "黑棋"),
-                                        "white": info.get("PW", "白棋"),
-                                        "result": info.get("RE", "未知"),
-                                        "total_moves": len(moves),
-                                        "current_step": len(moves),
-                                    }
-                                    replay_moves = moves
-                                    replay_step = len(moves)
-                                    current_screen = REPLAY_SCREEN
-                                    auto_play = False
-                                    break
+                            item = history_view.item_at(event.pos)
+                            if item is not None:
+                                # 加载所选棋谱，局面搜索结果直接跳到局面出现的手数
+                                replay_filepath = item.game_info["filepath"]
+                                replay_game, info, moves = load_replay_game(
+                                    replay_filepath, item.game_info.get("match_move")
+                                )
+                                replay_step = item.game_info.get(
+                                    "match_move", len(moves)
+                                )
+                                replay_info = {
+                                    "black": info.get("PB", "黑棋"),
+                                    "white": info.get("PW", "白棋"),
+                                    "result": info.get("RE", "未知"),
+                                    "total_moves": len(moves),
+                                    "current_step": replay_step,
+                                }
+                                replay_moves = moves
+                                current_screen = REPLAY_SCREEN
+                                auto_play = False
 
                     elif current_screen == REPLAY_SCREEN:
                         # 回放界面
                         if back_button.is_clicked(event.pos):
                             current_screen = HISTORY_SCREEN
+                            if live_analysis:
+                                live_analysis.cancel()
+                            if position_search.busy:
+                                position_search.cancel()
+                                position_search_button.text = "相同局面"
                         elif step_prev_button.is_clicked(event.pos) and replay_step > 0:
                             replay_step -= 1
                             replay_game, _, _ = load_replay_game(
-                                item.game_info["filepath"], replay_step
+                                replay_filepath, replay_step
                             )
                             replay_info["current_step"] = replay_step
                             auto_play = False
@@ -672,7 +1351,7 @@ def main():
                         ):
                             replay_step += 1
                             replay_game, _, _ = load_replay_game(
-                                item.game_info["filepath"], replay_step
+                                replay_filepath, replay_step
                             )
                             replay_info["current_step"] = replay_step
                             auto_play = False
@@ -680,57 +1359,65 @@ def main():
                             auto_play = not auto_play
                             if auto_play:
                                 auto_play_button.text = "暂停播放"
+                                auto_play_next = current_time + AUTO_PLAY_INTERVAL
                             else:
                                 auto_play_button.text = "自动播放"
+                        elif (
+                            position_search_button.is_clicked(event.pos)
+                            and not position_search.busy
+                        ):
+                            # 在后台查找历史记录中出现过当前局面(含对称局面)的对局，
+                            # 结果通过POSITION_SEARCH_EVENT返回
+                            position_search.start(replay_game.board.board)
+                            position_search_button.text = "查找中..."
 
                 # 鼠标滚轮事件
                 elif event.button == 4:  # 向上滚动
                     if current_screen == HISTORY_SCREEN:
-                        history_scroll_offset += 20
+                        history_view.scroll(20)
                 elif event.button == 5:  # 向下滚动
                     if current_screen == HISTORY_SCREEN:
-                        history_scroll_offset -= 20
+                        history_view.scroll(-20)
 
         # 处理AI思考和落子
-        if (
-            current_screen == GAME_SCREEN
-            and is_ai_mode
-            and ai_thinking
-            and not game.game_over
-        ):
-            # 如果AI尚未计算落子位置
-            if ai_move is None:
-                # 计算AI落子，可能需要一些时间
-                ai_move = ai_player.get_move(game)
+        if not (is_ai_mode and ai_thinking and not game.game_over):
+            # 重新开始、悔棋、认输等操作打断了AI思考
+            if ai_search is not None:
+                ai_worker.cancel()
+                ai_search = None
+                ai_move = None
+        elif current_screen == GAME_SCREEN:
+            # 在后台线程中计算AI落子，算完后收到AI_MOVE_EVENT
+            if ai_search is None:
+                ai_search = ai_worker.start(ai_player, game)
 
             # 确保AI至少"思考"一段时间，即使计算很快
             thinking_time = current_time - ai_thinking_start_time
-            min_thinking_time = 800  # 最少思考800毫秒，增强游戏体验
 
             if thinking_time >= min_thinking_time and ai_move is not None:
+                changed = True
                 # AI完成思考，执行落子
                 row, col = ai_move
                 if row is not None and col is not None:
-                    game.make_move(row, col)
+                    if game.make_move(row, col):
+                        autosave.record_move(*game.move_history[-1])
 
                 # 重置AI状态
                 ai_thinking = False
+                ai_search = None
                 ai_move = None
 
                 # 如果游戏结束，保存棋谱
                 if game.game_over:
                     result = (
-                        "B+R"
+                        game.get_result_string()
+                        if game.timeout_player
+                        else "B+R"
                         if game.winner == 1
                         else "W+R" if game.winner == 2 else "Draw"
                     )
-                    ai_name = ai_player.name if ai_player else "AI"
-                    create_history_record(
-                        game,
-                        HISTORY_DIR,
-                        "玩家",
-                        ai_name,
-                        result,
+                    autosave.finish(
+                        game, *get_player_names(is_ai_mode, ai_player), result
                     )
 
         # 更新按钮悬停状态
@@ -743,64 +1430,154 @@ def main():
                 button.is_hover(mouse_pos)
         elif current_screen == HISTORY_SCREEN:
             back_button.is_hover(mouse_pos)
-            for item in history_items:
-                item.is_hover(mouse_pos)
+            history_view.is_hover(mouse_pos)
         elif current_screen == REPLAY_SCREEN:
             back_button.is_hover(mouse_pos)
             step_prev_button.is_hover(mouse_pos)
             step_next_button.is_hover(mouse_pos)
             auto_play_button.is_hover(mouse_pos)
+            position_search_button.is_hover(mouse_pos)
 
             # 处理自动播放
             if auto_play and replay_step < replay_info["total_moves"]:
-                auto_play_timer += 1
-                if auto_play_timer >= 30:  # 大约1秒播放一步
+                if current_time >= auto_play_next:
                     replay_step += 1
-                    replay_game, _, _ = load_replay_game(
-                        item.game_info["filepath"], replay_step
-                    )
+                    replay_game, _, _ = load_replay_game(replay_filepath, replay_step)
                     replay_info["current_step"] = replay_step
-                    auto_play_timer = 0
+                    auto_play_next = current_time + AUTO_PLAY_INTERVAL
+                    changed = True
 
                     # 播放完毕时停止自动播放
                     if replay_step >= replay_info["total_moves"]:
                         auto_play = False
                         auto_play_button.text = "自动播放"
 
-        # 更新游戏状态
-        if current_screen == GAME_SCREEN:
-            game.update()
+        # 更新游戏状态(棋钟走时时每次唤醒都要重绘剩余时间)
+        if current_screen == GAME_SCREEN and game.clock and not game.game_over:
+            changed = True
+        if current_screen == GAME_SCREEN and game.update():
+            changed = True
+            if game.timeout_player:
+                # 走子方超时判负，保存棋谱
+                ai_thinking = False
+                autosave.finish(
+                    game,
+                    *get_player_names(is_ai_mode, ai_player),
+                    game.get_result_string(),
+                )
+
+        # 没有任何变化时不重绘
+        if not changed:
+            continue
 
         # 绘制界面
-        if current_screen == GAME_SCREEN:
-            draw_board()
-            draw_stones(game)
-            draw_game_info(game, is_ai_mode, ai_player, ai_thinking)
+        full_update = current_screen != drawn_screen
+        if full_update:
+            board_renderer.invalidate()
+            panel_key = None
+            drawn_screen = current_screen
+        dirty_rects = []
+
+        if current_screen in (GAME_SCREEN, REPLAY_SCREEN):
+            overlay = None
+            if current_screen == GAME_SCREEN:
+                board_game = game
+                hint_text = None
+                if hint_on and is_human_turn(game, is_ai_mode, ai_thinking, netplay):
+                    # 局面已计算过时直接使用缓存，否则在后台开始计算
+                    hint = hint_analysis.get(
+                        hint_analysis.request(
+                            game.board.board, game.current_player, game.board.rule
+                        )
+                    )
+                    overlay = get_analysis_overlay(hint, game.current_player)
+                    hint_text = get_hint_text(hint)
+                elif hint_analysis:
+                    hint_analysis.cancel()  # 不是本方回合时不再计算
+                texts = get_game_info_texts(
+                    game, is_ai_mode, ai_player, ai_thinking, netplay, hint_text
+                )
+                buttons = game_buttons
+            else:
+                board_game = replay_game
+                player = replay_game.current_player
+                analysis = None
+                if analysis_on:
+                    # 局面已分析过时直接使用缓存，否则在后台开始分析
+                    analysis = live_analysis.get(
+                        live_analysis.request(
+                            replay_game.board.board, player, replay_game.board.rule
+                        )
+                    )
+                    overlay = get_analysis_overlay(analysis, player)
+                texts = get_replay_info_texts(
+                    replay_info, analysis_on, analysis, player
+                )
+                buttons = replay_buttons
 
-            # 绘制按钮
-            for button in game_buttons:
-                button.draw()
+            # 回放的棋谱可能与当前对局的棋盘大小不同
+            if board_renderer.size != board_game.board.size:
+                board_renderer = get_board_renderer(board_game.board.size)
+                board_renderer.invalidate()
+            dirty_rects.extend(board_renderer.draw(board_game, overlay))
+
+            # 信息栏内容或按钮状态变化时才重绘信息栏
+            new_panel_key = get_panel_key(texts, buttons)
+            if new_panel_key != panel_key:
+                dirty_rects.append(draw_info_panel(texts, buttons))
+                panel_key = new_panel_key
 
         elif current_screen == AI_SELECT_SCREEN:
             draw_ai_select_screen(ai_buttons, back_button)
+            full_update = True
 
         elif current_screen == HISTORY_SCREEN:
-            draw_history_screen(history_items, back_button, history_scroll_offset)
+            draw_history_screen(history_view, back_button, history_title)
+            full_update = True
 
-        elif current_screen == REPLAY_SCREEN:
-            draw_replay_screen(
-                replay_game,
-                replay_info,
-                back_button,
-                step_prev_button,
-                step_next_button,
-                auto_play_button,
-            )
+        if full_update:
+            pygame.display.flip()
+        elif dirty_rects:
+            pygame.display.update(dirty_rects)
+
+        # 限制连续重绘(例如拖动鼠标)时的帧率，空闲时在wait_for_events中睡眠
+        clock.tick(MAX_FPS)
 
-        pygame.display.flip()
 
-        # 控制帧率
-        pygame.time.Clock().tick(30)
+def parse_args(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="五子棋")
+    parser.add_argument(
+        "--size", type=int, default=BOARD_SIZE, help=f"棋盘大小(默认{BOARD_SIZE})"
+    )
+    parser.add_argument(
+        "--rule",
+        choices=RULES,
+        default=RULE_FREESTYLE,
+        help="规则: freestyle无禁手(默认)，renju连珠(黑棋禁手)",
+    )
+    parser.add_argument(
+        "--time",
+        type=TimeControl.parse,
+        metavar="SPEC",
+        help="对局计时: 主时间[+每步加秒][/读秒x次数]，单位为秒，如300、180+2、600/30x3",
+    )
+    parser.add_argument(
+        "--host-game",
+        type=int,
+        nargs="?",
+        const=9888,
+        metavar="PORT",
+        help="作为主机开始网络对战(执黑)，默认端口9888",
+    )
+    parser.add_argument(
+        "--join", metavar="HOST[:PORT]", help="加入主机的网络对战(执白)"
+    )
+    args = parser.parse_args(argv)
+    if not 5 <= args.size <= 26:
+        parser.error("棋盘大小必须在5到26之间")
+    return args
 
 
 if __name__ == "__main__":
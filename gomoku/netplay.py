@@ -0,0 +1,496 @@
+"""网络对战: 两个界面通过TCP对弈
+
+一方作为主机监听端口并执黑，另一方连接主机并执白。两边都使用非阻塞套接字，
+由调用方调用poll()收发消息，不会阻塞界面。界面空闲时由NetPlayWatcher在后台线程中
+等待套接字就绪，就绪后通知界面调用poll()，不需要定时轮询。
+
+消息为每行一个JSON对象，只传递着手等增量，不传递整个棋盘:
+    {"type": "hello"}                                 客户端连接(或重连)后发送
+    {"type": "sync", "size", "rule", "moves", "resigned"}  主机发送完整对局，用于重新同步
+    {"type": "sync_request"}                          客户端发现不同步时请求sync
+    {"type": "move", "seq", "row", "col", "sent"}     落子
+    {"type": "ack", "seq", "sent"}                    确认落子，原样返回sent用于计算往返延迟
+    {"type": "undo", "seq", "count"}                  悔棋count步
+    {"type": "resign", "seq", "player"}               认输
+    {"type": "restart", "seq"}                        重新开始
+
+seq为发送方执行该操作之前的着手数。接收方的着手数与seq不一致时说明双方状态已经
+分叉(例如同时悔棋和落子)，以主机为准: 主机直接发送sync，客户端发送sync_request。
+断线后客户端每秒尝试重连，重连后通过sync恢复对局。
+
+python -m gomoku.netplay bench --moves 60   # 在本机启动两个进程测量每步往返延迟
+"""
+
+import errno
+import json
+import select
+import socket
+import threading
+import time
+
+from .game import Game
+
+RECONNECT_INTERVAL = 1.0  # 断线后重连间隔(秒)
+
+
+def _now_ms():
+    return time.perf_counter() * 1000
+
+
+class LineConnection:
+    """非阻塞套接字上按行收发JSON消息"""
+
+    def __init__(self, sock):
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # 小消息立即发送
+        self.sock = sock
+        self._inbuf = b""
+        self._outbuf = b""
+
+    @property
+    def pending(self):
+        """是否还有没发出去的数据"""
+        return bool(self._outbuf)
+
+    def send(self, message):
+        self._outbuf += json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+        self.flush()
+
+    def flush(self):
+        """尽量发送缓冲区中的数据，发不完的留到下次"""
+        while self._outbuf:
+            try:
+                sent = self.sock.send(self._outbuf)
+            except BlockingIOError:
+                return
+            self._outbuf = self._outbuf[sent:]
+
+    def receive(self):
+        """读取已到达的完整消息，连接关闭时抛出ConnectionError"""
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                break
+            if not data:
+                raise ConnectionError("对方已断开")
+            self._inbuf += data
+
+        *lines, self._inbuf = self._inbuf.split(b"\n")
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def close(self):
+        self.sock.close()
+
+
+class NetPlay:
+    """联网对局的状态同步，与界面无关
+
+    poll()返回本次处理的事件列表[(类型, 数据)]，类型为connected、disconnected、
+    move、undo、resign、restart、sync、rtt，调用方据此更新界面和自动保存。
+    """
+
+    def __init__(self, game, host="127.0.0.1", port=9888, listen=False):
+        self.game = game
+        self.listen = listen
+        self.local_player = 1 if listen else 2  # 主机执黑
+        self.address = (host, port)
+        self.conn = None
+        self.rtts = []  # [(手数, 往返延迟毫秒)]
+
+        self._server = None
+        self._connecting = None  # 正在进行非阻塞连接的套接字
+        self._next_retry = 0
+        if listen:
+            self._server = socket.create_server(self.address)
+            self._server.setblocking(False)
+
+    @property
+    def connected(self):
+        return self.conn is not None
+
+    @property
+    def last_rtt(self):
+        return self.rtts[-1][1] if self.rtts else None
+
+    def status_text(self):
+        if self.connected:
+            rtt = self.last_rtt
+            return "已连接" + (f" 延迟{rtt:.0f}ms" if rtt is not None else "")
+        if self.listen:
+            return f"等待对方连接(端口{self.address[1]})"
+        return "正在连接主机..."
+
+    # 网络收发
+
+    def select_sets(self):
+        """返回(读套接字列表, 写套接字列表, 最长等待秒数)，供poll()和NetPlayWatcher等待
+
+        客户端断线后没有套接字可等，最长等待时间为到下次重连的时间，否则为None。
+        """
+        readers = [s for s in (self._server,) if s is not None]
+        writers = [self._connecting] if self._connecting else []
+        if self.conn:
+            readers.append(self.conn.sock)
+            if self.conn.pending:
+                writers.append(self.conn.sock)
+        timeout = None
+        if not self.listen and not self.conn and not self._connecting:
+            timeout = max(0, self._next_retry - time.monotonic())
+        return readers, writers, timeout
+
+    def poll(self, timeout=0):
+        """处理网络事件，timeout为最长等待秒数(界面中为0，不等待)"""
+        events = []
+        if not self.listen and not self.conn and not self._connecting:
+            self._start_connect()
+        readers, writers, _ = self.select_sets()
+
+        if readers or writers:
+            readable, writable, _ = select.select(readers, writers, [], timeout)
+        else:
+            readable, writable = [], []
+
+        if self._server in readable:
+            self._accept(events)
+        if self._connecting and self._connecting in writable:
+            self._finish_connect(events)
+        if self.conn and self.conn.sock in readable:
+            try:
+                messages = self.conn.receive()
+            except (ConnectionError, OSError, ValueError):
+                self._disconnect(events)
+                return events
+            for message in messages:
+                self._handle(message, events)
+        if self.conn:
+            try:
+                self.conn.flush()
+            except OSError:
+                self._disconnect(events)
+        return events
+
+    def _accept(self, events):
+        try:
+            sock, _ = self._server.accept()
+        except BlockingIOError:
+            return
+        # 新的连接(例如对方重连)替换旧连接
+        if self.conn:
+            self.conn.close()
+        self.conn = LineConnection(sock)
+        events.append(("connected", None))
+
+    def _start_connect(self):
+        if time.monotonic() < self._next_retry:
+            return
+        self._next_retry = time.monotonic() + RECONNECT_INTERVAL
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        err = sock.connect_ex(self.address)
+        if err in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self._connecting = sock
+        else:
+            sock.close()
+
+    def _finish_connect(self, events):
+        sock, self._connecting = self._connecting, None
+        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) != 0:
+            sock.close()
+            return
+        self.conn = LineConnection(sock)
+        self.conn.send({"type": "hello"})
+        events.append(("connected", None))
+
+    def _disconnect(self, events):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+            events.append(("disconnected", None))
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+        if self._connecting:
+            self._connecting.close()
+            self._connecting = None
+        if self._server:
+            self._server.close()
+            self._server = None
+
+    def _send(self, message):
+        if self.conn:
+            try:
+                self.conn.send(message)
+            except OSError:
+                self.conn.close()
+                self.conn = None
+
+    def _send_sync(self):
+        game = self.game
+        self._send(
+            {
+                "type": "sync",
+                "size": game.board.size,
+                "rule": game.board.rule,
+                "moves": game.move_history,
+                "resigned": game.resigned_player,
+            }
+        )
+
+    def _out_of_sync(self):
+        """状态分叉时以主机为准重新同步"""
+        if self.listen:
+            self._send_sync()
+        else:
+            self._send({"type": "sync_request"})
+
+    # 处理对方的消息
+
+    def _handle(self, message, events):
+        kind = message.get("type")
+        game = self.game
+
+        if kind in ("hello", "sync_request"):
+            if self.listen:
+                self._send_sync()
+            return
+        if kind == "sync":
+            if not self.listen:
+                self._apply_sync(message)
+                events.append(("sync", None))
+            return
+        if kind == "ack":
+            rtt = _now_ms() - message["sent"]
+            self.rtts.append((message["seq"] + 1, rtt))
+            events.append(("rtt", rtt))
+            return
+
+        if message.get("seq") != game.move_count:
+            self._out_of_sync()
+            return
+
+        if kind == "move":
+            if game.current_player == self.local_player or not game.make_move(
+                message["row"], message["col"]
+            ):
+                self._out_of_sync()
+                return
+            self._send({"type": "ack", "seq": message["seq"], "sent": message["sent"]})
+            events.append(("move", game.move_history[-1]))
+        elif kind == "undo":
+            for _ in range(message["count"]):
+                game.undo()
+            events.append(("undo", message["count"]))
+        elif kind == "resign":
+            game.resign(message["player"])
+            events.append(("resign", None))
+        elif kind == "restart":
+            game.reset()
+            events.append(("restart", None))
+
+    def _apply_sync(self, message):
+        game = self.game
+        if (game.board.size, game.board.rule) != (message["size"], message["rule"]):
+            game = self.game = Game(message["size"], message["rule"])
+        else:
+            game.reset()
+        for row, col, _ in message["moves"]:
+            game.make_move(row, col)
+        if message["resigned"]:
+            game.resign(message["resigned"])
+
+    # 本方操作，成功后把增量发送给对方
+
+    def play(self, row, col):
+        """本方落子"""
+        game = self.game
+        if not self.connected or game.current_player != self.local_player:
+            return False
+        seq = game.move_count
+        if not game.make_move(row, col):
+            return False
+        self._send(
+            {"type": "move", "seq": seq, "row": row, "col": col, "sent": _now_ms()}
+        )
+        return True
+
+    def undo(self):
+        """悔棋: 轮到本方时撤销对方和本方各一步，否则撤销本方刚下的一步，返回撤销的步数"""
+        game = self.game
+        if not self.connected or game.game_over:
+            return 0
+        seq = game.move_count
+        count = 2 if game.current_player == self.local_player else 1
+        count = min(count, len(game.move_history))
+        for _ in range(count):
+            game.undo()
+        if count:
+            self._send({"type": "undo", "seq": seq, "count": count})
+        return count
+
+    def resign(self):
+        if not self.connected or not self.game.resign(self.local_player):
+            return False
+        self._send(
+            {"type": "resign", "seq": self.game.move_count, "player": self.local_player}
+        )
+        return True
+
+    def restart(self):
+        if not self.connected:
+            return False
+        seq = self.game.move_count
+        self.game.reset()
+        self._send({"type": "restart", "seq": seq})
+        return True
+
+
+class NetPlayWatcher:
+    """在后台线程中等待NetPlay的套接字就绪(或到了重连时间)，然后调用on_ready
+
+    只负责唤醒，不收发数据，NetPlay的状态仍只在界面线程中修改: on_ready通知界面调用
+    poll()，界面在下一次进入等待之前调用rearm()，监视线程再按当前的套接字继续等待。
+    """
+
+    def __init__(self, netplay, on_ready):
+        self.netplay = netplay
+        self.on_ready = on_ready
+        self._armed = threading.Event()
+        self._armed.set()
+        self._closed = False
+        # 界面线程通过这对套接字打断正在进行的select，让监视线程重新取套接字列表
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._thread = threading.Thread(target=self._run, name="netplay", daemon=True)
+        self._thread.start()
+
+    def rearm(self):
+        """界面处理完poll()后调用，监视线程按当前的套接字重新开始等待"""
+        self._armed.set()
+        self._wakeup()
+
+    def close(self):
+        self._closed = True
+        self._armed.set()
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_writer.send(b"\0")
+        except OSError:
+            pass  # 缓冲区已满时监视线程本来就会被唤醒
+
+    def _run(self):
+        while True:
+            self._armed.wait()
+            if self._closed:
+                break
+            self._armed.clear()
+            readers, writers, timeout = self.netplay.select_sets()
+            try:
+                readable, writable, _ = select.select(
+                    readers + [self._wakeup_reader], writers, [], timeout
+                )
+            except (OSError, ValueError):
+                # 套接字在等待期间被界面线程关闭，交给poll()处理
+                readable, writable = [], []
+            if self._closed:
+                break
+            if self._wakeup_reader in readable:
+                try:
+                    while self._wakeup_reader.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                readable.remove(self._wakeup_reader)
+                if not readable and not writable:
+                    self._armed.set()  # 只是被rearm()打断，重新取套接字列表
+                    continue
+            self.on_ready()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+
+
+def _auto_play(netplay, moves, rng, drop_at=None, timeout=60):
+    """无界面对局: 轮到本方时在中央附近随机落子，直到双方共下moves手
+
+    drop_at为客户端主动断线的手数，用于测试重连后的重新同步。
+    """
+    deadline = time.monotonic() + timeout
+    dropped = False
+    finished_at = None
+    while time.monotonic() < deadline:
+        netplay.poll(timeout=0.01)
+        game = netplay.game
+        if game.move_count >= moves or game.game_over:
+            # 主机等客户端断开后结束，客户端稍等片刻以收到最后一步的确认
+            if netplay.listen:
+                if not netplay.connected:
+                    break
+            else:
+                finished_at = finished_at or time.monotonic()
+                if time.monotonic() - finished_at > 0.2:
+                    break
+            continue
+
+        if drop_at is not None and not dropped and game.move_count >= drop_at:
+            dropped = True
+            netplay._disconnect([])
+        elif netplay.connected and game.current_player == netplay.local_player:
+            center = game.board.size // 2
+            while not netplay.play(
+                center + rng.randint(-5, 5), center + rng.randint(-5, 5)
+            ):
+                pass
+    return netplay.game
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import subprocess
+    import sys
+
+    parser = argparse.ArgumentParser(description="网络对战测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+    host = sub.add_parser("host", help="无界面主机，自动落子")
+    host.add_argument("--port", type=int, default=9888)
+    host.add_argument("--moves", type=int, default=60)
+    bench = sub.add_parser("bench", help="启动主机进程并作为客户端对局，测量往返延迟")
+    bench.add_argument("--port", type=int, default=9888)
+    bench.add_argument("--moves", type=int, default=60)
+    bench.add_argument("--drop-at", type=int, default=20, help="在第几手时断线重连")
+    args = parser.parse_args()
+
+    if args.command == "host":
+        netplay = NetPlay(Game(19), port=args.port, listen=True)
+        print("ready", flush=True)
+        game = _auto_play(netplay, args.moves, random.Random(1))
+        print(json.dumps(game.move_history), flush=True)
+        netplay.close()
+    else:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gomoku.netplay", "host"]
+            + ["--port", str(args.port), "--moves", str(args.moves)],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        proc.stdout.readline()  # 等待主机开始监听
+        netplay = NetPlay(Game(), port=args.port)
+        game = _auto_play(netplay, args.moves, random.Random(2), args.drop_at)
+        netplay.close()
+        host_moves = json.loads(proc.stdout.readline())
+        proc.wait()
+
+        rtts = sorted(rtt for _, rtt in netplay.rtts)
+        same = [list(move) for move in game.move_history] == host_moves
+        print(
+            f"共{game.move_count}手，客户端{len(rtts)}手收到确认，双方棋谱一致: {same}"
+        )
+        if rtts:
+            print(
+                f"往返延迟(毫秒): 平均{sum(rtts) / len(rtts):.2f} "
+                f"中位数{rtts[len(rtts) // 2]:.2f} 最大{rtts[-1]:.2f}"
+            )
@@ -0,0 +1,403 @@
+"""NumPy实现的小型神经网络局面评估(可选功能，需要安装numpy)
+
+输入是棋形特征: 四个方向上所有五格窗口中只有一方棋子时按棋子数(1~4)计数，
+两端为空的六格窗口中间四格只有一方棋子时按棋子数(2~4)计数，走子方和对方分开统计，
+共14个特征，取log1p后标准化。网络为一个tanh隐藏层，输出走子方视角的局面价值(-1~1)。
+
+特征提取和推理都按批次向量化: 一次调用可以评估一个节点下的所有叶节点，
+分摊NumPy的调用开销。EnhancedMinimaxAI(evaluator=...)在深度为1的节点上
+把所有子局面打包评估。
+
+python -m gomoku.neural selfplay selfplay/ --games 200   # 自我对弈生成棋谱
+python -m gomoku.neural train selfplay/ gomoku/history/ --out neural.npz
+python -m gomoku.neural match neural.npz --games 10 --time 0.5  # 与手工评估在同样时间下对战
+"""
+
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from .ai import EnhancedMinimaxAI
+from .renju import get_line_table
+from .sgf import get_sgf_files, iter_sgf_games
+
+FEATURE_NAMES = (
+    [f"own{k}" for k in range(1, 5)]
+    + [f"opp{k}" for k in range(1, 5)]
+    + [f"own_open{k}" for k in range(2, 5)]
+    + [f"opp_open{k}" for k in range(2, 5)]
+)
+EVAL_SCALE = 50000  # 网络输出换算为搜索分数的倍数，小于胜负分数100000
+
+
+@lru_cache(maxsize=None)
+def _window_index(size, length):
+    """四个方向上所有length格窗口包含的交叉点编号，(窗口数, length)的数组"""
+    windows = []
+    for direction_lines in get_line_table(size)[0]:
+        for line in direction_lines:
+            cells = [row * size + col for row, col in line]
+            for start in range(len(cells) - length + 1):
+                windows.append(cells[start : start + length])
+    return np.array(windows, dtype=np.intp).reshape(-1, length)
+
+
+def _histogram(values, bins):
+    """values为(N, W)的非负整数，返回每行的计数(N, bins)"""
+    n = len(values)
+    offsets = values + bins * np.arange(n)[:, None]
+    return np.bincount(offsets.ravel(), minlength=n * bins).reshape(n, bins)
+
+
+def extract_features(boards, movers):
+    """批量提取棋形特征
+
+    boards为(N, size, size)的整数数组(0空 1黑 2白)，movers为每个局面的走子方。
+    返回(N, 14)的计数(未经log1p和标准化)。
+    """
+    boards = np.asarray(boards, dtype=np.int8)
+    n, size = boards.shape[:2]
+    movers = np.asarray(movers, dtype=np.int8).reshape(-1, 1)
+    flat = boards.reshape(n, -1)
+    # 己方记1、对方记6，窗口内求和即为 己方数 + 6 * 对方数
+    codes = np.where(flat == movers, 1, np.where(flat == 0, 0, 6)).astype(np.int16)
+
+    # 五格窗口: 只保留单方的1~4子
+    counts = _histogram(codes[:, _window_index(size, 5)].sum(axis=2), 36)
+    features = [counts[:, 1:5], counts[:, [6 * k for k in range(1, 5)]]]
+
+    # 两端为空的六格窗口: 中间四格只有单方的2~4子
+    windows = codes[:, _window_index(size, 6)]
+    inner = windows[:, :, 1:5].sum(axis=2)
+    inner[(windows[:, :, 0] | windows[:, :, 5]) != 0] = 0
+    counts = _histogram(inner, 36)
+    features += [counts[:, 2:5], counts[:, [6 * k for k in range(2, 5)]]]
+    return np.concatenate(features, axis=1).astype(np.float32)
+
+
+class NeuralEvaluator:
+    """两层全连接网络，权重保存在npz文件中"""
+
+    def __init__(self, hidden=32, seed=0):
+        rng = np.random.default_rng(seed)
+        inputs = len(FEATURE_NAMES)
+        self.mean = np.zeros(inputs, dtype=np.float32)
+        self.std = np.ones(inputs, dtype=np.float32)
+        self.w1 = (rng.standard_normal((inputs, hidden)) / np.sqrt(inputs)).astype(
+            np.float32
+        )
+        self.b1 = np.zeros(hidden, dtype=np.float32)
+        self.w2 = (rng.standard_normal(hidden) / np.sqrt(hidden)).astype(np.float32)
+        self.b2 = np.float32(0)
+        self.calls = 0  # 推理调用次数
+        self.positions = 0  # 评估过的局面数
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        evaluator = cls(hidden=data["w1"].shape[1])
+        for name in ("mean", "std", "w1", "b1", "w2"):
+            setattr(evaluator, name, data[name].astype(np.float32))
+        evaluator.b2 = np.float32(data["b2"])
+        return evaluator
+
+    def save(self, path):
+        np.savez(
+            path,
+            mean=self.mean,
+            std=self.std,
+            w1=self.w1,
+            b1=self.b1,
+            w2=self.w2,
+            b2=self.b2,
+        )
+
+    def _normalize(self, features):
+        return (np.log1p(features) - self.mean) / self.std
+
+    def _forward(self, x):
+        hidden = np.tanh(x @ self.w1 + self.b1)
+        return hidden, np.tanh(hidden @ self.w2 + self.b2)
+
+    def evaluate(self, boards, movers):
+        """批量评估，返回每个局面走子方视角的价值(-1~1)"""
+        self.calls += 1
+        self.positions += len(boards)
+        _, value = self._forward(self._normalize(extract_features(boards, movers)))
+        return value
+
+    def score_board(self, board, mover):
+        """单个局面(二维列表)走子方视角的搜索分数"""
+        value = self.evaluate(np.array(board, dtype=np.int8)[None], [mover])[0]
+        return float(value) * EVAL_SCALE
+
+    def score_moves(self, board, moves, mover):
+        """mover分别下在moves中各点之后的局面，一次评估，返回下一个走子方视角的搜索分数"""
+        if not moves:
+            return []
+        boards = np.repeat(np.array(board, dtype=np.int8)[None], len(moves), axis=0)
+        rows, cols = zip(*moves)
+        boards[np.arange(len(moves)), rows, cols] = mover
+        values = self.evaluate(boards, np.full(len(moves), 3 - mover))
+        return (values * EVAL_SCALE).tolist()
+
+    def train(
+        self,
+        features,
+        targets,
+        epochs=30,
+        batch_size=256,
+        learning_rate=0.003,
+        validation=None,
+        seed=0,
+        progress=None,
+    ):
+        """用Adam最小化均方误差，targets为走子方视角的结果(胜1 和0 负-1)
+
+        validation为(特征, 结果)时每轮计算验证集误差，训练结束后恢复验证误差最小的一轮的权重。
+        返回每轮的(训练误差, 验证误差)。
+        """
+        logs = np.log1p(features)
+        self.mean = logs.mean(axis=0)
+        self.std = logs.std(axis=0) + 1e-3
+        x = self._normalize(features)
+        targets = np.asarray(targets, dtype=np.float32)
+
+        params = ["w1", "b1", "w2", "b2"]
+        moments = {name: [0.0, 0.0] for name in params}
+        rng = np.random.default_rng(seed)
+        step = 0
+        history = []
+        best = None  # (验证误差, 权重)
+        for epoch in range(epochs):
+            order = rng.permutation(len(x))
+            total = 0.0
+            for start in range(0, len(x), batch_size):
+                index = order[start : start + batch_size]
+                xb, yb = x[index], targets[index]
+                hidden, value = self._forward(xb)
+
+                # 反向传播
+                error = value - yb
+                total += float((error**2).sum())
+                d_out = 2 * error * (1 - value**2) / len(xb)
+                d_hidden = np.outer(d_out, self.w2) * (1 - hidden**2)
+                grads = {
+                    "w2": hidden.T @ d_out,
+                    "b2": d_out.sum(),
+                    "w1": xb.T @ d_hidden,
+                    "b1": d_hidden.sum(axis=0),
+                }
+
+                step += 1
+                for name in params:
+                    m, v = moments[name]
+                    m = 0.9 * m + 0.1 * grads[name]
+                    v = 0.999 * v + 0.001 * grads[name] ** 2
+                    moments[name] = [m, v]
+                    m_hat = m / (1 - 0.9**step)
+                    v_hat = v / (1 - 0.999**step)
+                    update = learning_rate * m_hat / (np.sqrt(v_hat) + 1e-8)
+                    setattr(
+                        self, name, (getattr(self, name) - update).astype(np.float32)
+                    )
+
+            loss = total / len(x)
+            val_loss = None
+            if validation is not None:
+                val_x, val_y = validation
+                _, value = self._forward(self._normalize(val_x))
+                val_loss = float(((value - val_y) ** 2).mean())
+                if best is None or val_loss < best[0]:
+                    best = (val_loss, {name: getattr(self, name) for name in params})
+            history.append((loss, val_loss))
+            if progress:
+                progress(epoch + 1, loss, val_loss)
+        if best is not None:
+            for name, value in best[1].items():
+                setattr(self, name, value)
+        return history
+
+
+def _game_result(info):
+    """由RE属性得到黑方视角的结果(胜1 和0 负-1)，没有结果时返回None"""
+    result = str(info.get("RE", ""))
+    if result.startswith("B+"):
+        return 1
+    if result.startswith("W+"):
+        return -1
+    if result.lower().startswith("draw") or result == "0":
+        return 0
+    return None
+
+
+def load_training_data(paths, min_moves=4):
+    """从SGF文件或目录中读取有结果的对局，返回(特征, 走子方视角的结果, 对局编号)
+
+    每局取第min_moves手之后的所有局面，对局编号用于按对局划分验证集。
+    """
+    files = []
+    for path in paths:
+        files += get_sgf_files(path) if os.path.isdir(path) else [path]
+
+    features, targets, groups = [], [], []
+    game_index = 0
+    for sgf_file in files:
+        for info, moves in iter_sgf_games(sgf_file):
+            result = _game_result(info)
+            size = int(str(info.get("SZ", "15")).split(":")[0])
+            if result is None or len(moves) <= min_moves:
+                continue
+            board = np.zeros((size, size), dtype=np.int8)
+            boards, movers = [], []
+            for i, (row, col, player) in enumerate(moves):
+                board[row, col] = player
+                if i + 1 >= min_moves and i + 1 < len(moves):
+                    boards.append(board.copy())
+                    movers.append(moves[i + 1][2])
+            if not boards:
+                continue
+            features.append(extract_features(np.stack(boards), movers))
+            targets += [result if mover == 1 else -result for mover in movers]
+            groups += [game_index] * len(boards)
+            game_index += 1
+
+    if not features:
+        return np.zeros((0, len(FEATURE_NAMES)), np.float32), np.zeros(0), np.zeros(0)
+    return (
+        np.concatenate(features),
+        np.array(targets, dtype=np.float32),
+        np.array(groups),
+    )
+
+
+def self_play(directory, games=100, board_size=15, seed=None, progress=None):
+    """用带随机性的搜索引擎自我对弈，每局保存为一个SGF文件
+
+    开局随机下两手，之后双方都按温度随机选点，使棋谱足够多样。
+    """
+    import random
+
+    from .arena import OpeningAI, play_game, random_openings
+    from .sgf import create_sgf, save_sgf
+
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    engines = [
+        EnhancedMinimaxAI(board_size, depth=2, max_nodes=600, temperature=200)
+        for _ in range(2)
+    ]
+    for engine in engines:
+        engine.random.seed(rng.random())
+
+    openings = random_openings(games, board_size, seed=rng.random())
+    for i, opening in enumerate(openings):
+        game, _ = play_game(
+            OpeningAI(engines[0], opening),
+            OpeningAI(engines[1], opening),
+            None,
+            board_size,
+        )
+        if not game.game_over:
+            continue
+        sgf = create_sgf(game, "自我对弈", "自我对弈", game.get_result_string())
+        save_sgf(sgf, os.path.join(directory, f"selfplay_{i:05d}.sgf"))
+        if progress:
+            progress(i + 1, game)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="NumPy神经网络局面评估")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    selfplay_parser = commands.add_parser("selfplay", help="自我对弈生成训练棋谱")
+    selfplay_parser.add_argument("directory")
+    selfplay_parser.add_argument("--games", type=int, default=100)
+    selfplay_parser.add_argument("--seed", type=int)
+
+    train_parser = commands.add_parser("train", help="从棋谱训练网络")
+    train_parser.add_argument("paths", nargs="+", help="SGF文件或目录")
+    train_parser.add_argument("--out", default="neural.npz")
+    train_parser.add_argument("--hidden", type=int, default=32)
+    train_parser.add_argument("--epochs", type=int, default=30)
+    train_parser.add_argument(
+        "--validation", type=float, default=0.1, help="验证集比例"
+    )
+
+    match_parser = commands.add_parser("match", help="与手工评估在同样时间预算下对战")
+    match_parser.add_argument("weights")
+    match_parser.add_argument("--games", type=int, default=10)
+    match_parser.add_argument("--time", type=float, default=0.5, help="每步时间(秒)")
+    match_parser.add_argument("--depth", type=int, default=3)
+    match_parser.add_argument("--seed", type=int, default=0, help="随机开局的种子")
+    args = parser.parse_args()
+
+    if args.command == "selfplay":
+        self_play(
+            args.directory,
+            args.games,
+            seed=args.seed,
+            progress=lambda n, game: print(
+                f"[{n}] {len(game.move_history)}手 {game.get_result_string()}"
+            ),
+        )
+
+    elif args.command == "train":
+        features, targets, groups = load_training_data(args.paths)
+        if not len(features):
+            parser.error("没有找到有结果的棋谱")
+        validation = (
+            groups % round(1 / args.validation) == 0 if args.validation else None
+        )
+        if validation is None or validation.all():
+            train_x, train_y, val = features, targets, None
+        else:
+            train_x, train_y = features[~validation], targets[~validation]
+            val = (features[validation], targets[validation])
+        print(f"{groups.max() + 1}局 {len(features)}个局面")
+        evaluator = NeuralEvaluator(args.hidden)
+        evaluator.train(
+            train_x,
+            train_y,
+            args.epochs,
+            validation=val,
+            progress=lambda epoch, loss, val_loss: print(
+                f"第{epoch}轮 训练误差{loss:.4f}"
+                + (f" 验证误差{val_loss:.4f}" if val_loss is not None else "")
+            ),
+        )
+        evaluator.save(args.out)
+        print(f"已保存到 {args.out}")
+
+    elif args.command == "match":
+        from .arena import ms_per_move, play_match, random_openings
+
+        neural = EnhancedMinimaxAI(
+            depth=args.depth,
+            time_limit=args.time,
+            evaluator=NeuralEvaluator.load(args.weights),
+        )
+        neural.name = "神经网络评估"
+        manual = EnhancedMinimaxAI(depth=args.depth, time_limit=args.time)
+        manual.name = "手工评估"
+        start = time.perf_counter()
+        openings = random_openings((args.games + 1) // 2, seed=args.seed)
+        stats = play_match(neural, manual, args.games, openings=openings)
+        print(
+            f"{neural.name} 对 {manual.name}: "
+            f"{stats['wins']}胜 {stats['losses']}负 {stats['draws']}和 "
+            f"({time.perf_counter() - start:.0f}秒)"
+        )
+        print(
+            f"平均每步用时: {neural.name} {ms_per_move(stats, 0):.1f}ms, "
+            f"{manual.name} {ms_per_move(stats, 1):.1f}ms"
+        )
+        evaluator = neural.evaluator
+        print(
+            f"推理{evaluator.calls}次，共{evaluator.positions}个局面"
+            f"(平均每批{evaluator.positions / max(evaluator.calls, 1):.1f}个)"
+        )
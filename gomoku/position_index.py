@@ -0,0 +1,342 @@
+"""棋谱局面索引
+
+为棋谱库中每一局的每一个局面记录对称规范化的Zobrist哈希，
+查询时通过二分查找在mmap映射的索引文件中定位，与棋谱数量无关。
+
+索引文件格式(小端序):
+    头部: 魔数 b"GMKP" + 保留(u32) + 条目数N(u64)
+    哈希: N个u64，升序排列
+    位置: N个u64，(来源编号 << 40) | (局号 << 16) | 手数
+    来源: JSON对象{"sources": 来源文件路径列表, "signatures": 各来源的[修改时间(纳秒), 大小]}
+          (旧版本的索引只有路径列表)
+
+更新索引时，修改时间和大小都没有变化的来源直接复用旧索引中的条目，只解析新增或修改过的文件。
+"""
+
+import bisect
+import json
+import mmap
+import os
+import struct
+from array import array
+from functools import lru_cache
+
+from .board import get_zobrist_table
+from .gamestore import FLAG_WHITE_FIRST, GameStore
+from .sgf import get_sgf_files, iter_sgf_games
+
+INDEX_MAGIC = b"GMKP"
+_HEADER = struct.Struct("<4sIQ")
+
+# 按哈希高位分桶，写入时逐桶排序以控制内存
+_BUCKET_BITS = 12
+
+
+@lru_cache(maxsize=None)
+def _symmetric_zobrist(size):
+    """预计算每个交叉点在8种对称变换下的Zobrist值，table[cell][player] -> 8元组"""
+    zobrist = get_zobrist_table(size)
+    last = size - 1
+    transforms = [
+        lambda r, c: (r, c),
+        lambda r, c: (c, last - r),
+        lambda r, c: (last - r, last - c),
+        lambda r, c: (last - c, r),
+        lambda r, c: (r, last - c),
+        lambda r, c: (last - r, c),
+        lambda r, c: (c, r),
+        lambda r, c: (last - c, last - r),
+    ]
+    table = []
+    for cell in range(size * size):
+        row, col = divmod(cell, size)
+        cells = [t(row, col) for t in transforms]
+        table.append(
+            tuple(
+                tuple(zobrist[r * size + c][player] for r, c in cells)
+                for player in (0, 1, 2)
+            )
+        )
+    return tuple(table)
+
+
+def iter_position_hashes(cells, players, size):
+    """依次产生每一手之后局面的规范化哈希(8种对称变换中的最小值)"""
+    table = _symmetric_zobrist(size)
+    h0 = h1 = h2 = h3 = h4 = h5 = h6 = h7 = 0
+    for cell, player in zip(cells, players):
+        z0, z1, z2, z3, z4, z5, z6, z7 = table[cell][player]
+        h0 ^= z0
+        h1 ^= z1
+        h2 ^= z2
+        h3 ^= z3
+        h4 ^= z4
+        h5 ^= z5
+        h6 ^= z6
+        h7 ^= z7
+        yield min(h0, h1, h2, h3, h4, h5, h6, h7)
+
+
+def position_hash(board):
+    """计算棋盘(二维列表)的规范化哈希"""
+    size = len(board)
+    table = _symmetric_zobrist(size)
+    hashes = [0] * 8
+    for row in range(size):
+        for col in range(size):
+            player = board[row][col]
+            if player:
+                values = table[row * size + col][player]
+                hashes = [h ^ z for h, z in zip(hashes, values)]
+    return min(hashes)
+
+
+def source_signature(path):
+    """来源文件的[修改时间(纳秒), 大小]，用于判断文件在建立索引之后是否变化"""
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class PositionIndexBuilder:
+    """收集棋谱中的局面哈希并写出索引文件"""
+
+    def __init__(self):
+        self.sources = []
+        self.signatures = []
+        self._hashes = [array("Q") for _ in range(1 << _BUCKET_BITS)]
+        self._locations = [array("Q") for _ in range(1 << _BUCKET_BITS)]
+
+    def _add_source(self, path, signature=None):
+        # 签名在解析之前取得，解析期间被修改的文件下次更新时会重新解析
+        self.sources.append(os.path.abspath(path))
+        self.signatures.append(signature or source_signature(path))
+        return len(self.sources) - 1
+
+    def add_entries(self, path, signature, entries):
+        """添加一个来源，entries为旧索引中该来源的(哈希, 局号和手数)，不重新解析文件"""
+        source_id = self._add_source(path, signature)
+        shift = 64 - _BUCKET_BITS
+        for h, game_move in entries:
+            bucket = h >> shift
+            self._hashes[bucket].append(h)
+            self._locations[bucket].append((source_id << 40) | game_move)
+
+    def _add_hashes(self, source_id, game_no, hashes):
+        shift = 64 - _BUCKET_BITS
+        base = (source_id << 40) | (game_no << 16)
+        for move_no, h in enumerate(hashes, 1):
+            bucket = h >> shift
+            self._hashes[bucket].append(h)
+            self._locations[bucket].append(base | move_no)
+
+    def add_sgf(self, path):
+        """添加一个SGF文件(可以包含多局)"""
+        source_id = self._add_source(path)
+        for game_no, (info, moves) in enumerate(iter_sgf_games(path)):
+            size = int(str(info.get("SZ", "15")).split(":")[0])
+            cells = [row * size + col for row, col, _ in moves]
+            players = [player for _, _, player in moves]
+            self._add_hashes(
+                source_id, game_no, iter_position_hashes(cells, players, size)
+            )
+
+    def add_store(self, path):
+        """添加一个二进制棋谱文件，直接使用mmap中的着手数据"""
+        source_id = self._add_source(path)
+        with GameStore(path) as store:
+            for game_no, (header, cells) in enumerate(store.iter_move_views()):
+                size = int(header["SZ"])
+                first = 2 if header["flags"] & FLAG_WHITE_FIRST else 1
+                players = [first, 3 - first] * (len(cells) // 2 + 1)
+                self._add_hashes(
+                    source_id, game_no, iter_position_hashes(cells, players, size)
+                )
+
+    def add(self, path):
+        if path.endswith(".gmk"):
+            self.add_store(path)
+        else:
+            self.add_sgf(path)
+
+    def write(self, index_path):
+        """按哈希排序后写出索引文件"""
+        count = sum(len(bucket) for bucket in self._hashes)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(INDEX_MAGIC, 0, count))
+            order = []
+            for hashes in self._hashes:
+                bucket_order = sorted(range(len(hashes)), key=hashes.__getitem__)
+                order.append(bucket_order)
+                f.write(array("Q", (hashes[i] for i in bucket_order)).tobytes())
+            for locations, bucket_order in zip(self._locations, order):
+                f.write(array("Q", (locations[i] for i in bucket_order)).tobytes())
+            sources = {"sources": self.sources, "signatures": self.signatures}
+            f.write(json.dumps(sources, ensure_ascii=False).encode("utf-8"))
+        os.replace(tmp_path, index_path)
+        return count
+
+
+def build_position_index(paths, index_path):
+    """为SGF文件和二进制棋谱(.gmk)建立局面索引，返回索引的局面数"""
+    builder = PositionIndexBuilder()
+    for path in paths:
+        builder.add(path)
+    return builder.write(index_path)
+
+
+def update_position_index(paths, index_path):
+    """增量更新局面索引，返回(索引的局面数, 重新解析的文件数)
+
+    没有变化的来源复用旧索引中的条目，新增或修改过的文件重新解析，不在paths中的来源被删除；
+    全部没有变化时不重写索引文件。旧索引不存在或无法读取时完整建立。
+    """
+    try:
+        index = PositionIndex(index_path)
+    except (OSError, ValueError):
+        index = None
+
+    try:
+        known = index.source_ids() if index is not None else {}
+        reused = {}  # 旧来源编号 -> (路径, 签名)
+        parsed = []
+        for path in paths:
+            signature = source_signature(path)
+            old = known.get(os.path.abspath(path))
+            if old is not None and old[1] == signature:
+                reused[old[0]] = (path, signature)
+            else:
+                parsed.append(path)
+        if index is not None and not parsed and len(reused) == len(known):
+            return len(index), 0
+
+        builder = PositionIndexBuilder()
+        if reused:
+            # 按来源分组复制旧条目(旧索引按哈希排序，各来源的条目是交错的)
+            groups = {source_id: [] for source_id in reused}
+            for h, location in zip(index._hashes, index._locations):
+                group = groups.get(location >> 40)
+                if group is not None:
+                    group.append((h, location & 0xFFFFFFFFFF))
+            for source_id, (path, signature) in reused.items():
+                builder.add_entries(path, signature, groups[source_id])
+    finally:
+        if index is not None:
+            index.close()
+    for path in parsed:
+        builder.add(path)
+    return builder.write(index_path), len(parsed)
+
+
+class PositionIndex:
+    """只读的局面索引，通过mmap和二分查找查询"""
+
+    def __init__(self, index_path):
+        with open(index_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != INDEX_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"不是有效的局面索引文件: {index_path}")
+
+        view = memoryview(self._mmap)
+        start = _HEADER.size
+        self._hashes = view[start : start + count * 8].cast("Q")
+        self._locations = view[start + count * 8 : start + count * 16].cast("Q")
+        sources = json.loads(bytes(view[start + count * 16 :]).decode("utf-8"))
+        view.release()
+        if isinstance(sources, list):
+            sources = {"sources": sources, "signatures": [None] * len(sources)}
+        self.sources = sources["sources"]
+        self.signatures = sources["signatures"]
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def source_ids(self):
+        """{来源路径: (来源编号, 建立索引时的文件签名)}"""
+        return {
+            path: (i, signature)
+            for i, (path, signature) in enumerate(zip(self.sources, self.signatures))
+        }
+
+    def find_hash(self, position_key):
+        """查找哈希对应的所有(来源路径, 局号, 手数)"""
+        left = bisect.bisect_left(self._hashes, position_key)
+        right = bisect.bisect_right(self._hashes, position_key, left)
+        results = []
+        for i in range(left, right):
+            location = self._locations[i]
+            results.append(
+                (
+                    self.sources[location >> 40],
+                    (location >> 16) & 0xFFFFFF,
+                    location & 0xFFFF,
+                )
+            )
+        return results
+
+    def find(self, board):
+        """查找出现过该局面(含对称局面)的所有对局"""
+        return self.find_hash(position_hash(board))
+
+    def close(self):
+        if self._mmap is None:
+            return
+        self._hashes.release()
+        self._locations.release()
+        self._mmap.close()
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def ensure_history_index(directory, index_name="positions.idx"):
+    """确保历史记录目录的局面索引是最新的(只解析新增或修改过的棋谱)，返回索引文件路径"""
+    index_path = os.path.join(directory, index_name)
+    update_position_index(get_sgf_files(directory), index_path)
+    return index_path
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from .sgf import parse_sgf
+
+    parser = argparse.ArgumentParser(description="建立或查询棋谱局面索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="建立索引")
+    build.add_argument("index")
+    build.add_argument("paths", nargs="+", help="SGF文件、.gmk文件或目录")
+    query = sub.add_parser("query", help="查询SGF第N手之后的局面")
+    query.add_argument("index")
+    query.add_argument("sgf_file")
+    query.add_argument("move", type=int)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        paths = []
+        for path in args.paths:
+            paths.extend(get_sgf_files(path) if os.path.isdir(path) else [path])
+        start = time.perf_counter()
+        count, parsed = update_position_index(paths, args.index)
+        elapsed = time.perf_counter() - start
+        print(f"已索引{count}个局面(解析了{parsed}个文件)，用时{elapsed:.2f}秒")
+    else:
+        info, moves = parse_sgf(args.sgf_file)
+        size = int(str(info.get("SZ", "15")).split(":")[0])
+        board = [[0] * size for _ in range(size)]
+        for row, col, player in moves[: args.move]:
+            board[row][col] = player
+        start = time.perf_counter()
+        with PositionIndex(args.index) as index:
+            results = index.find(board)
+        elapsed = (time.perf_counter() - start) * 1000
+        for source, game_no, move_no in results:
+            print(f"{source} 第{game_no + 1}局 第{move_no}手")
+        print(f"共{len(results)}个结果，用时{elapsed:.2f}毫秒")
@@ -0,0 +1,200 @@
+"""连珠(Renju)规则的禁手判断
+
+黑棋不能下长连(六子及以上)、四四和三三，白棋没有限制。黑棋同时形成五连时不算禁手。
+
+棋盘按四个方向拆成若干条线，每条线用一个整数编码(每个交叉点2位: 0空 1黑 2白，
+两端各补5个值为3的边界)，落子和提子时只需增减对应位。判断某点时，取出该点在
+每个方向上前后各5格共11格的窗口，窗口的棋形分类(五连、长连、冲四数、可成活四
+的点)只与窗口编码有关，计算一次后全局缓存。三三需要递归判断成活四的点本身
+是否为禁手，结果按(局面Zobrist哈希, 交叉点)缓存，搜索中同一局面不会重复判断。
+"""
+
+from functools import lru_cache
+
+from .board import get_zobrist_table
+
+DIRECTIONS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+_PADDING = 5  # 每条线两端补充的边界格数，也是窗口的半宽
+_WINDOW_MASK = (1 << (2 * (2 * _PADDING + 1))) - 1
+_CENTER = _PADDING
+
+_window_kinds = {}  # 窗口编码 -> (是否五连, 是否长连, 冲四数, 可成活四的点的偏移)
+
+
+@lru_cache(maxsize=None)
+def get_line_table(size):
+    """把棋盘拆成四个方向的线，返回(lines, cells)
+
+    lines[d]为方向d上每条线包含的交叉点列表，
+    cells[d][row * size + col]为该点所在的(线编号, 在线上的位置)。
+    """
+    lines = []
+    cells = []
+    for dr, dc in DIRECTIONS:
+        direction_lines = []
+        direction_cells = [None] * (size * size)
+        for row in range(size):
+            for col in range(size):
+                # 只从线的起点出发(前一个点在棋盘外)
+                if 0 <= row - dr < size and 0 <= col - dc < size:
+                    continue
+                line = []
+                r, c = row, col
+                while 0 <= r < size and 0 <= c < size:
+                    direction_cells[r * size + c] = (len(direction_lines), len(line))
+                    line.append((r, c))
+                    r += dr
+                    c += dc
+                direction_lines.append(line)
+        lines.append(direction_lines)
+        cells.append(direction_cells)
+    return lines, cells
+
+
+def _empty_line_code(length):
+    """空线的编码: 两端为边界，中间为空"""
+    code = 0
+    for i in range(length + 2 * _PADDING):
+        if i < _PADDING or i >= length + _PADDING:
+            code |= 3 << (2 * i)
+    return code
+
+
+def _five_completions(cells):
+    """中心点所在的、再下一子即成恰好五连的(黑子集合, 空点)列表"""
+    completions = []
+    for start in range(_CENTER - 4, _CENTER + 1):
+        window = cells[start : start + 5]
+        if window.count(1) != 4 or window.count(0) != 1:
+            continue
+        # 五连之外紧邻的点不能是黑子，否则成为长连
+        if cells[start - 1] == 1 or cells[start + 5] == 1:
+            continue
+        empty = start + window.index(0)
+        stones = frozenset(i for i in range(start, start + 5) if i != empty)
+        completions.append((stones, empty))
+    return completions
+
+
+def _is_straight_four(cells):
+    """是否为活四: 同一组四子有两个不同的成五点"""
+    ends = {}
+    for stones, empty in _five_completions(cells):
+        ends.setdefault(stones, set()).add(empty)
+    return any(len(points) >= 2 for points in ends.values())
+
+
+def _classify_window(window):
+    """对黑棋下在窗口中心后的一条线分类"""
+    cells = [(window >> (2 * i)) & 3 for i in range(2 * _PADDING + 1)]
+    cells[_CENTER] = 1
+
+    left = right = _CENTER
+    while left > 0 and cells[left - 1] == 1:
+        left -= 1
+    while right < 2 * _PADDING and cells[right + 1] == 1:
+        right += 1
+    length = right - left + 1
+    if length == 5:
+        return True, False, 0, ()
+    if length > 5:
+        return False, True, 0, ()
+
+    # 冲四(含活四): 不同的四子组合各算一个四
+    fours = len({stones for stones, _ in _five_completions(cells)})
+    if fours:
+        return False, False, fours, ()
+
+    # 活三: 再下一子可以成为活四的点
+    points = []
+    for i in range(2 * _PADDING + 1):
+        if cells[i] == 0:
+            cells[i] = 1
+            if _is_straight_four(cells):
+                points.append(i - _CENTER)
+            cells[i] = 0
+    return False, False, 0, tuple(points)
+
+
+class RenjuDetector:
+    """增量维护线编码的禁手检测器，落子和提子必须通过place/remove同步"""
+
+    def __init__(self, size, max_cache=200000):
+        self.size = size
+        self.max_cache = max_cache
+        self._zobrist = get_zobrist_table(size)
+        lines, self._cells = get_line_table(size)
+        self._codes = [
+            [_empty_line_code(len(line)) for line in direction_lines]
+            for direction_lines in lines
+        ]
+        self._hash = 0
+        self._cache = {}
+
+    def place(self, row, col, player):
+        cell = row * self.size + col
+        for codes, cells in zip(self._codes, self._cells):
+            line, pos = cells[cell]
+            codes[line] += player << (2 * (pos + _PADDING))
+        self._hash ^= self._zobrist[cell][player]
+
+    def remove(self, row, col, player):
+        cell = row * self.size + col
+        for codes, cells in zip(self._codes, self._cells):
+            line, pos = cells[cell]
+            codes[line] -= player << (2 * (pos + _PADDING))
+        self._hash ^= self._zobrist[cell][player]
+
+    def _line_kinds(self, cell):
+        """该点在四个方向上的棋形分类"""
+        kinds = []
+        for codes, cells in zip(self._codes, self._cells):
+            line, pos = cells[cell]
+            window = (codes[line] >> (2 * pos)) & _WINDOW_MASK
+            kind = _window_kinds.get(window)
+            if kind is None:
+                kind = _window_kinds[window] = _classify_window(window)
+            kinds.append(kind)
+        return kinds
+
+    def is_forbidden(self, row, col):
+        """黑棋下在空点(row, col)是否为禁手"""
+        cell = row * self.size + col
+        key = (self._hash, cell)
+        result = self._cache.get(key)
+        if result is None:
+            result = self._check(row, col, cell)
+            if len(self._cache) >= self.max_cache:
+                self._cache.clear()
+            self._cache[key] = result
+        return result
+
+    def _check(self, row, col, cell):
+        kinds = self._line_kinds(cell)
+        if any(five for five, _, _, _ in kinds):
+            return False  # 成五优先于禁手
+        if any(overline for _, overline, _, _ in kinds):
+            return True
+        if sum(fours for _, _, fours, _ in kinds) >= 2:
+            return True
+
+        three_lines = [
+            (direction, points)
+            for direction, (_, _, _, points) in zip(DIRECTIONS, kinds)
+            if points
+        ]
+        if len(three_lines) < 2:
+            return False
+
+        # 只有能下出活四(成活四的点本身不是禁手)的三才是真正的活三
+        threes = 0
+        self.place(row, col, 1)
+        try:
+            for (dr, dc), points in three_lines:
+                for offset in points:
+                    if not self.is_forbidden(row + dr * offset, col + dc * offset):
+                        threes += 1
+                        break
+        finally:
+            self.remove(row, col, 1)
+        return threes >= 2
@@ -0,0 +1,483 @@
+"""多局人机对战服务器
+
+python -m gomoku.server serve --port 9777 --workers 4
+python -m gomoku.server loadtest --port 9777 --sessions 200 --connections 4
+
+协议: TCP上每行一个UTF-8编码的JSON对象。请求可以带"id"字段，响应中原样返回，
+同一连接上的请求并发处理，响应顺序不一定与请求顺序相同。
+
+    {"cmd": "new", "level": 3, "size": 15, "rule": "freestyle", "ai_player": 2}
+        -> {"ok": true, "session": "...", "ai_move": [row, col] 或 null, ...}
+    {"cmd": "move", "session": "...", "row": 7, "col": 7}
+        -> {"ok": true, "ai_move": [row, col] 或 null, "game_over": false, ...}
+    {"cmd": "undo" / "resign" / "state" / "close", "session": "..."}
+    {"cmd": "metrics"}
+    失败时返回 {"ok": false, "error": "..."}
+
+轮到AI时服务器在AI落子后才回复。AI搜索在共享的进程池中执行，每次搜索有节点数
+和时间预算；等待中的搜索按客户端连接轮流分发，一个连接开再多对局也不会让其他
+连接饿死。metrics命令返回会话数、排队深度以及排队/搜索/总延迟的统计。
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .ai import get_ai_by_level
+from .board import RULE_FREESTYLE, RULES
+from .game import Game
+
+MAX_BOARD_SIZE = 26
+
+# 工作进程中按难度级别缓存的AI实例
+_worker_ais = {}
+
+
+def _min_budget(a, b):
+    """两个预算(None表示不限)中较小的一个"""
+    if a is None:
+        return b
+    return a if b is None else min(a, b)
+
+
+def _search(task):
+    """在工作进程中计算AI的着手，返回((row, col)或None, 搜索秒数)"""
+    level, size, rule, moves, time_limit, max_nodes = task
+    game = Game(size, rule)
+    for row, col, _ in moves:
+        game.make_move(row, col)
+
+    ai = _worker_ais.get(level)
+    if ai is None:
+        ai = _worker_ais[level] = get_ai_by_level(level, size)
+        # 服务器的预算是上限，难度级别自身的预算更小时以级别为准
+        ai.time_limit = _min_budget(ai.time_limit, time_limit)
+        ai.max_nodes = _min_budget(ai.max_nodes, max_nodes)
+
+    start = time.perf_counter()
+    move = ai.get_move(game)
+    return move, time.perf_counter() - start
+
+
+class LatencyStats:
+    """保留最近若干次的延迟样本，统计平均值和分位数(毫秒)"""
+
+    def __init__(self, maxlen=1000):
+        self.samples = deque(maxlen=maxlen)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds * 1000)
+        self.count += 1
+
+    def summary(self):
+        if not self.samples:
+            return {"count": self.count}
+        ordered = sorted(self.samples)
+        return {
+            "count": self.count,
+            "mean": round(sum(ordered) / len(ordered), 2),
+            "p50": round(ordered[len(ordered) // 2], 2),
+            "p95": round(ordered[min(len(ordered) - 1, len(ordered) * 95 // 100)], 2),
+            "max": round(ordered[-1], 2),
+        }
+
+
+class SearchScheduler:
+    """把搜索任务分发到共享进程池
+
+    同时执行的任务数不超过max_inflight，其余任务按客户端分队列等待，
+    每次从下一个有任务的客户端取一个，实现客户端之间的轮转调度。
+    """
+
+    def __init__(self, executor, max_inflight):
+        self.executor = executor
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.queues = OrderedDict()  # 客户端 -> deque[(任务, future, 入队时间)]
+        self.queued = 0
+        self.wait_latency = LatencyStats()
+        self.search_latency = LatencyStats()
+
+    def submit(self, client, task):
+        """提交任务，返回可等待的future，结果为_search的返回值"""
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(client, deque()).append(
+            (task, future, time.perf_counter())
+        )
+        self.queued += 1
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self.inflight < self.max_inflight and self.queues:
+            client, queue = next(iter(self.queues.items()))
+            task, future, enqueued = queue.popleft()
+            if queue:
+                self.queues.move_to_end(client)
+            else:
+                del self.queues[client]
+            self.queued -= 1
+            if future.cancelled():
+                continue
+
+            self.wait_latency.add(time.perf_counter() - enqueued)
+            self.inflight += 1
+            job = loop.run_in_executor(self.executor, _search, task)
+            job.add_done_callback(lambda job, future=future: self._done(job, future))
+
+    def _done(self, job, future):
+        self.inflight -= 1
+        if job.cancelled():
+            future.cancel()
+        elif not future.cancelled():
+            if job.exception() is not None:
+                future.set_exception(job.exception())
+            else:
+                move, elapsed = job.result()
+                self.search_latency.add(elapsed)
+                future.set_result(move)
+        self._dispatch()
+
+    def drop_client(self, client):
+        """连接断开时取消该客户端还在排队的任务"""
+        queue = self.queues.pop(client, ())
+        for _, future, _ in queue:
+            future.cancel()
+        self.queued -= len(queue)
+
+
+class Session:
+    """一局人机对战"""
+
+    def __init__(self, game, level, ai_player):
+        self.game = game
+        self.level = level
+        self.ai_player = ai_player
+        self.busy = False  # AI搜索中不接受新的请求
+        self.last_active = time.monotonic()
+
+    def state(self):
+        game = self.game
+        return {
+            "size": game.board.size,
+            "rule": game.board.rule,
+            "ai_player": self.ai_player,
+            "current_player": game.current_player,
+            "move_count": game.move_count,
+            "game_over": game.game_over,
+            "winner": game.winner,
+            "result": game.get_result_string(),
+        }
+
+
+class RequestError(Exception):
+    """请求无效，错误信息返回给客户端"""
+
+
+class GameServer:
+    def __init__(
+        self,
+        workers=None,
+        time_limit=1.0,
+        max_nodes=20000,
+        max_sessions=10000,
+        session_ttl=600,
+    ):
+        workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(workers)
+        self.scheduler = SearchScheduler(self.executor, workers)
+        self.time_limit = time_limit  # 每个会话每步的搜索时间预算(秒)
+        self.max_nodes = max_nodes  # 每个会话每步的搜索节点预算
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl  # 会话空闲多久后回收(秒)
+        self.sessions = {}
+        self.connections = 0
+        self.request_latency = LatencyStats()
+
+    async def serve(self, host="127.0.0.1", port=9777):
+        server = await asyncio.start_server(self._handle_client, host, port)
+        reaper = asyncio.create_task(self._reap_sessions())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reaper.cancel()
+            self.executor.shutdown(cancel_futures=True)
+
+    async def _reap_sessions(self):
+        """定期回收空闲的会话"""
+        while True:
+            await asyncio.sleep(min(60, self.session_ttl))
+            deadline = time.monotonic() - self.session_ttl
+            for session_id, session in list(self.sessions.items()):
+                if not session.busy and session.last_active < deadline:
+                    del self.sessions[session_id]
+
+    async def _handle_client(self, reader, writer):
+        self.connections += 1
+        client = object()  # 调度器中代表该连接的键
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._handle_line(client, line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            self.scheduler.drop_client(client)
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _handle_line(self, client, line, writer):
+        start = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            handler = getattr(self, f"_cmd_{request.get('cmd')}", None)
+            if handler is None:
+                raise RequestError(f"未知命令: {request.get('cmd')}")
+            response = {"ok": True, **await handler(client, request)}
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            response = {"ok": False, "error": f"请求格式错误: {e}"}
+        except RequestError as e:
+            response = {"ok": False, "error": str(e)}
+        if request_id is not None:
+            response["id"] = request_id
+        self.request_latency.add(time.perf_counter() - start)
+
+        writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def _get_session(self, request):
+        session = self.sessions.get(request["session"])
+        if session is None:
+            raise RequestError("会话不存在或已过期")
+        if session.busy:
+            raise RequestError("AI思考中，请等待上一步的结果")
+        session.last_active = time.monotonic()
+        return session
+
+    async def _ai_move(self, client, session):
+        """轮到AI时在进程池中搜索并落子，返回AI的着手"""
+        game = session.game
+        if game.game_over or game.current_player != session.ai_player:
+            return None
+        task = (
+            session.level,
+            game.board.size,
+            game.board.rule,
+            list(game.move_history),
+            self.time_limit,
+            self.max_nodes,
+        )
+        session.busy = True
+        try:
+            move = await self.scheduler.submit(client, task)
+        except Exception as e:
+            raise RequestError(f"AI搜索失败: {e!r}")
+        finally:
+            session.busy = False
+        if move is None or not game.make_move(*move):
+            game.resign()  # AI无子可下时认输
+            return None
+        return list(move)
+
+    async def _cmd_new(self, client, request):
+        if len(self.sessions) >= self.max_sessions:
+            raise RequestError("会话数已达上限")
+        size = int(request.get("size", 15))
+        rule = request.get("rule", RULE_FREESTYLE)
+        ai_player = int(request.get("ai_player", 2))
+        if (
+            not 5 <= size <= MAX_BOARD_SIZE
+            or rule not in RULES
+            or ai_player not in (1, 2)
+        ):
+            raise RequestError("棋盘大小、规则或AI执子颜色无效")
+
+        session_id = uuid.uuid4().hex
+        session = Session(Game(size, rule), int(request.get("level", 3)), ai_player)
+        self.sessions[session_id] = session
+        ai_move = await self._ai_move(client, session)
+        return {"session": session_id, "ai_move": ai_move, "state": session.state()}
+
+    async def _cmd_move(self, client, request):
+        session = self._get_session(request)
+        game = session.game
+        if game.game_over:
+            raise RequestError("对局已经结束")
+        if game.current_player == session.ai_player:
+            raise RequestError("还没有轮到玩家")
+        if not game.make_move(int(request["row"]), int(request["col"])):
+            raise RequestError("该位置不能落子")
+        ai_move = await self._ai_move(client, session)
+        return {"ai_move": ai_move, "state": session.state()}
+
+    async def _cmd_undo(self, client, request):
+        """悔棋: 撤销AI和玩家各一步"""
+        session = self._get_session(request)
+        undone = 0
+        while session.game.undo():
+            undone += 1
+            if session.game.current_player != session.ai_player:
+                break
+        return {"undone": undone, "state": session.state()}
+
+    async def _cmd_resign(self, client, request):
+        session = self._get_session(request)
+        # AI的搜索被中断时可能正轮到AI，认输的总是玩家一方
+        session.game.resign(3 - session.ai_player)
+        return {"state": session.state()}
+
+    async def _cmd_state(self, client, request):
+        """返回完整的着手记录；上次AI搜索被中断(例如连接断开)时继续让AI落子"""
+        session = self._get_session(request)
+        ai_move = await self._ai_move(client, session)
+        return {
+            "moves": session.game.move_history,
+            "ai_move": ai_move,
+            "state": session.state(),
+        }
+
+    async def _cmd_close(self, client, request):
+        self._get_session(request)
+        del self.sessions[request["session"]]
+        return {}
+
+    async def _cmd_metrics(self, client, request):
+        scheduler = self.scheduler
+        return {
+            "sessions": len(self.sessions),
+            "connections": self.connections,
+            "queue_depth": scheduler.queued,
+            "inflight": scheduler.inflight,
+            "workers": scheduler.max_inflight,
+            "queue_wait_ms": scheduler.wait_latency.summary(),
+            "search_ms": scheduler.search_latency.summary(),
+            "request_ms": self.request_latency.summary(),
+        }
+
+
+async def _loadtest(host, port, sessions, connections, moves, level, seed):
+    """模拟多个客户端同时对局，返回(客户端测得的每步往返延迟统计, 服务器指标)"""
+    import random
+
+    rng = random.Random(seed)
+    latency = LatencyStats(maxlen=sessions * moves)
+
+    async def request(conn, payload):
+        reader, writer, pending = conn
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        pending[request_id] = future
+        writer.write(json.dumps({**payload, "id": request_id}).encode() + b"\n")
+        await writer.drain()
+        return await future
+
+    async def read_responses(conn):
+        reader, _, pending = conn
+        while line := await reader.readline():
+            response = json.loads(line)
+            pending.pop(response["id"]).set_result(response)
+
+    async def play(conn):
+        response = await request(conn, {"cmd": "new", "level": level})
+        session_id = response["session"]
+        size = response["state"]["size"]
+        occupied = set()
+        for _ in range(moves):
+            if response["state"]["game_over"]:
+                break
+            if response.get("ai_move"):
+                occupied.add(tuple(response["ai_move"]))
+            center = size // 2
+            while True:
+                move = (center + rng.randint(-4, 4), center + rng.randint(-4, 4))
+                if move not in occupied:
+                    break
+            occupied.add(move)
+            start = time.perf_counter()
+            response = await request(
+                conn,
+                {"cmd": "move", "session": session_id, "row": move[0], "col": move[1]},
+            )
+            latency.add(time.perf_counter() - start)
+        await request(conn, {"cmd": "close", "session": session_id})
+
+    conns = []
+    readers = []
+    for _ in range(connections):
+        reader, writer = await asyncio.open_connection(host, port)
+        conn = (reader, writer, {})
+        conns.append(conn)
+        readers.append(asyncio.create_task(read_responses(conn)))
+
+    await asyncio.gather(*(play(conns[i % connections]) for i in range(sessions)))
+    metrics = await request(conns[0], {"cmd": "metrics"})
+    for reader_task, (_, writer, _) in zip(readers, conns):
+        reader_task.cancel()
+        writer.close()
+    return latency.summary(), metrics
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="多局人机对战服务器")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="启动服务器")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=9777)
+    serve.add_argument("--workers", type=int, help="搜索进程数(默认等于CPU核数)")
+    serve.add_argument("--time", type=float, default=1.0, help="每步搜索时间预算(秒)")
+    serve.add_argument("--nodes", type=int, default=20000, help="每步搜索节点预算")
+    serve.add_argument("--max-sessions", type=int, default=10000)
+    load = sub.add_parser("loadtest", help="模拟多个客户端同时对局")
+    load.add_argument("--host", default="127.0.0.1")
+    load.add_argument("--port", type=int, default=9777)
+    load.add_argument("--sessions", type=int, default=100)
+    load.add_argument("--connections", type=int, default=4)
+    load.add_argument("--moves", type=int, default=5, help="每局玩家下几步")
+    load.add_argument("--level", type=int, default=3)
+    load.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = GameServer(args.workers, args.time, args.nodes, args.max_sessions)
+        print(f"服务器已启动: {args.host}:{args.port}")
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        start = time.perf_counter()
+        latency, metrics = asyncio.run(
+            _loadtest(
+                args.host,
+                args.port,
+                args.sessions,
+                args.connections,
+                args.moves,
+                args.level,
+                args.seed,
+            )
+        )
+        print(f"{args.sessions}局完成，用时{time.perf_counter() - start:.1f}秒")
+        print(f"客户端每步往返延迟(毫秒): {latency}")
+        print(f"服务器指标: {json.dumps(metrics, ensure_ascii=False)}")
@@ -1,36 +1,70 @@
 import os
+from collections import OrderedDict
 from datetime import datetime
 import re
 
+from .board import RULE_FREESTYLE, RULE_RENJU
+
+
+def create_sgf(
+    game, black_name="黑棋", white_name="白棋", result="", date=None, comments=None
+):
+    """根据游戏记录创建SGF格式的棋谱，date为空时使用当天日期
+
+    comments为{着手序号(从0开始): 注释文本}，写入对应着手节点的C属性。
+    """
+    if date is None:
+        date = datetime.now().strftime("%Y-%m-%d")
 
-def create_sgf(game, black_name="黑棋", white_name="白棋", result=""):
-    """根据游戏记录创建SGF格式的棋谱"""
     # 基本信息
-    sgf = "(;GM[2]FF[4]SZ[15]\n"  # GM[2]表示五子棋
-    sgf += f"DT[{datetime.now().strftime('%Y-%m-%d')}]\n"
+    sgf = f"(;GM[2]FF[4]SZ[{game.board.size}]\n"  # GM[2]表示五子棋
+    if game.board.rule == RULE_RENJU:
+        sgf += "RU[Renju]\n"
+    sgf += f"DT[{date}]\n"
     sgf += f"PB[{black_name}]\n"
     sgf += f"PW[{white_name}]\n"
+    if game.time_control:
+        # 主时间(秒)和加秒/读秒的说明
+        control = game.time_control
+        sgf += f"TM[{control.main_time:g}]\n"
+        if control.increment or control.byoyomi:
+            sgf += f"OT[{escape_sgf_text(control.describe())}]\n"
 
     # 游戏结果
     if result:
         sgf += f"RE[{result}]\n"
 
     # 着手记录
-    for move in game.move_history:
+    for i, move in enumerate(game.move_history):
         row, col, player = move
         # 将行列转换为SGF坐标(字母表示)
-        sgf_col = chr(ord("a") + col)
-        sgf_row = chr(ord("a") + row)
+        sgf_col = index_to_sgf_coord(col)
+        sgf_row = index_to_sgf_coord(row)
 
         if player == 1:  # 黑棋
             sgf += f";B[{sgf_col}{sgf_row}]"
         else:  # 白棋
             sgf += f";W[{sgf_col}{sgf_row}]"
 
+        if comments and comments.get(i):
+            sgf += f"C[{escape_sgf_text(comments[i])}]"
+
     sgf += ")"
     return sgf
 
 
+def get_rule(info):
+    """根据棋谱的RU属性判断规则，没有记录时为无禁手"""
+    if str(info.get("RU", "")).lower() == RULE_RENJU:
+        return RULE_RENJU
+    return RULE_FREESTYLE
+
+
+def escape_sgf_text(text):
+    """转义SGF属性值中的反斜杠和右方括号"""
+    return text.replace("\\", "\\\\").replace("]", "\\]")
+
+
 def save_sgf(sgf_content, filename):
     """保存SGF内容到文件"""
     with open(filename, "w", encoding="utf-8") as f:
@@ -39,30 +73,275 @@ def save_sgf(sgf_content, filename):
 
 
 def parse_sgf(sgf_file):
-    """解析SGF文件，返回游戏信息和落子序列"""
-    with open(sgf_file, "r", encoding="utf-8") as f:
-        content = f.read()
-
-    # 解析基本信息
-    info = {}
-    for key in ["DT", "PB", "PW", "RE"]:
-        start = content.find(f"{key}[") + len(key) + 1
-        if start > len(key):
-            end = content.find("]", start)
-            if end > start:
-                info[key] = content[start:end]
-
-    # 解析落子序列
-    moves = []
-    # 提取所有的B[xx]和W[xx]
-    pattern = r";([BW])\[([a-o])([a-o])\]"
-    for match in re.finditer(pattern, content):
-        player = 1 if match.group(1) == "B" else 2
-        col = ord(match.group(2)) - ord("a")
-        row = ord(match.group(3)) - ord("a")
-        moves.append((row, col, player))
-
-    return info, moves
+    """解析SGF文件，返回第一局的游戏信息和落子序列"""
+    games = iter_sgf_games(sgf_file)
+    try:
+        return next(games, ({}, []))
+    finally:
+        games.close()
+
+
+# SGF词法单元: 括号/分号、属性名、属性值(支持转义)
+_SGF_TOKEN = re.compile(r"\s*(?:([();])|([A-Za-z]+)|\[((?:[^\\\]]|\\.)*)\])", re.S)
+_SGF_ESCAPE = re.compile(r"\\(\r\n|\n\r|\n|\r|.)", re.S)
+
+# 压缩格式的文件头
+_GZIP_MAGIC = b"\x1f\x8b"
+_XZ_MAGIC = b"\xfd7zXZ\x00"
+
+
+def get_sgf_compression(sgf_file):
+    """根据文件头判断SGF文件的压缩格式: "gzip"、"xz"或None"""
+    with open(sgf_file, "rb") as f:
+        magic = f.read(6)
+    if magic.startswith(_GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(_XZ_MAGIC):
+        return "xz"
+    return None
+
+
+def open_sgf_stream(sgf_file, mode="r", compression=None):
+    """以文本流方式打开SGF文件，读取时自动识别gzip/xz压缩，写入时按compression压缩"""
+    if mode == "r":
+        compression = get_sgf_compression(sgf_file)
+    errors = "replace" if mode == "r" else "strict"
+    if compression == "gzip":
+        import gzip
+
+        return gzip.open(sgf_file, mode + "t", encoding="utf-8", errors=errors)
+    if compression == "xz":
+        import lzma
+
+        return lzma.open(sgf_file, mode + "t", encoding="utf-8", errors=errors)
+    return open(sgf_file, mode, encoding="utf-8", errors=errors)
+
+
+def _unescape_value(value):
+    """处理属性值中的转义字符，软换行直接删除"""
+    return _SGF_ESCAPE.sub(
+        lambda m: "" if m.group(1) in "\r\n\r\n" else m.group(1), value
+    )
+
+
+# SGF坐标字母到下标的查找表: a-z为0-25，A-Z为26-51
+_SGF_COORDS = {
+    ch: i
+    for i, ch in enumerate(
+        [chr(ord("a") + i) for i in range(26)] + [chr(ord("A") + i) for i in range(26)]
+    )
+}
+
+
+def sgf_coord_to_index(ch):
+    """SGF坐标字母转换为下标，无效字母返回-1"""
+    return _SGF_COORDS.get(ch, -1)
+
+
+def index_to_sgf_coord(index):
+    """下标转换为SGF坐标字母"""
+    if index < 26:
+        return chr(ord("a") + index)
+    return chr(ord("A") + index - 26)
+
+
+def _parse_board_size(value):
+    """解析SZ属性，支持"19"和"19:15"两种写法，返回(列数, 行数)"""
+    try:
+        if ":" in value:
+            cols, rows = value.split(":", 1)
+            return int(cols), int(rows)
+        return int(value), int(value)
+    except ValueError:
+        return 15, 15
+
+
+def _tokenize_sgf(stream, chunk_size):
+    """按块读取文本并逐个产生词法单元，不把整个文件读入内存"""
+    buffer = ""
+    eof = False
+    while not eof:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer += chunk
+
+        pos = 0
+        length = len(buffer)
+        while pos < length:
+            match = _SGF_TOKEN.match(buffer, pos)
+            if match is None:
+                # 跳过空白后，如果是未闭合的属性值则等待更多数据
+                rest = buffer[pos:].lstrip()
+                if not rest or (rest[0] == "[" and not eof):
+                    break
+                # 集合文件中游戏之间的无关字符，直接跳过
+                pos = length - len(rest) + 1
+                continue
+            token = match.groups()
+            # 属性名可能被分块截断，留到下一块再处理
+            if token[1] is not None and match.end() == length and not eof:
+                break
+            pos = match.end()
+            yield token
+        buffer = buffer[pos:]
+
+
+def iter_sgf_games(sgf_file, chunk_size=65536):
+    """流式解析SGF文件(可以是棋谱集合或gzip/xz压缩文件)，逐局产生(info, moves)
+
+    info为根节点属性，moves为主变化的落子序列[(row, col, player), ...]。
+    棋谱中包含其他变化时，以完整着手序列的列表形式放在info["variations"]中。
+    """
+    stream = open_sgf_stream(sgf_file) if isinstance(sgf_file, str) else sgf_file
+    try:
+        yield from _iter_sgf_games(stream, chunk_size)
+    finally:
+        if isinstance(sgf_file, str):
+            stream.close()
+
+
+def _iter_sgf_games(stream, chunk_size):
+    depth = 0
+    info = None
+    size = (15, 15)
+    line = []  # 当前变化路线上的着手
+    branch_starts = []  # 每层括号开始时的着手数
+    lines = []  # 已完成的所有变化(第一条为主变化)
+    leaf_pending = False  # 当前路线是否还没有被记录
+    node = None  # 正在解析的节点属性
+    prop = None  # 正在解析的属性名
+
+    def finish_node():
+        nonlocal info, size, node, leaf_pending
+        if node is None:
+            return
+        if info is None:
+            info = {
+                key: values[0] if len(values) == 1 else values
+                for key, values in node.items()
+            }
+            if "SZ" in info:
+                size = _parse_board_size(info["SZ"])
+        for key, player in (("B", 1), ("W", 2)):
+            for value in node.get(key, ()):
+                if len(value) != 2:
+                    continue  # 空着(pass)在五子棋中没有意义
+                col = _SGF_COORDS.get(value[0], -1)
+                row = _SGF_COORDS.get(value[1], -1)
+                if 0 <= col < size[0] and 0 <= row < size[1]:
+                    line.append((row, col, player))
+        node = None
+        leaf_pending = True
+
+    for punct, ident, value in _tokenize_sgf(stream, chunk_size):
+        if punct == "(":
+            finish_node()
+            if depth == 0:
+                info = None
+                size = (15, 15)
+                line = []
+                lines = []
+                leaf_pending = False
+            branch_starts.append(len(line))
+            depth += 1
+        elif punct == ")":
+            if depth == 0:
+                continue
+            finish_node()
+            if leaf_pending:
+                lines.append(list(line))
+                leaf_pending = False
+            del line[branch_starts.pop() :]
+            depth -= 1
+            if depth == 0 and info is not None:
+                if len(lines) > 1:
+                    info["variations"] = lines[1:]
+                yield info, lines[0] if lines else []
+        elif punct == ";":
+            if depth == 0:
+                continue
+            finish_node()
+            node = {}
+            prop = None
+        elif ident is not None:
+            # FF[3]允许属性名中混有小写字母，只保留大写部分
+            prop = ident if ident.isupper() else "".join(filter(str.isupper, ident))
+        elif value is not None and node is not None and prop:
+            node.setdefault(prop, []).append(_unescape_value(value))
+
+
+def insert_move_comments(text, comments, marker=None):
+    """在SGF文本第一局的主变化节点中写入着手注释，其余内容(属性、变化、其他对局)原样保留
+
+    comments为{着手序号(从0开始): 注释文本}，序号与iter_sgf_games产生的moves一致。
+    节点已有的C属性保留在前面；给出marker时，已有注释中从marker开始的部分
+    (上一次写入的注释)被新的注释替换。
+    """
+    edits = []  # (开始, 结束, 替换文本)，最后从后往前应用
+    size = (15, 15)
+    move_index = 0
+    node = None  # 正在解析的节点: 属性结束位置、包含的着手序号、已有的C属性
+    prop = None
+
+    def finish_node():
+        nonlocal node
+        if node is None:
+            return
+        texts = [comments[i] for i in node["moves"] if comments.get(i)]
+        if texts:
+            if node["comment"] is None:
+                start = end = node["end"]
+            else:
+                start, end, old = node["comment"]
+                if marker is not None:
+                    old = old.split(marker, 1)[0]
+                texts.insert(0, old.rstrip())
+            merged = "\n\n".join(part for part in texts if part)
+            edits.append((start, end, f"C[{escape_sgf_text(merged)}]"))
+        node = None
+
+    pos = 0
+    depth = 0
+    while pos < len(text):
+        match = _SGF_TOKEN.match(text, pos)
+        if match is None:
+            pos += 1  # 文件开头等处的无关字符
+            continue
+        pos = match.end()
+        punct, ident, value = match.groups()
+        if punct == "(":
+            finish_node()
+            depth += 1
+        elif punct == ")":
+            # 主变化(每层的第一个分支)在第一个")"之前就已经结束
+            finish_node()
+            break
+        elif punct == ";":
+            finish_node()
+            if depth:
+                node = {"end": pos, "moves": [], "comment": None}
+            prop = None
+        elif ident is not None:
+            prop = ident if ident.isupper() else "".join(filter(str.isupper, ident))
+            prop_start = match.start(2)
+        elif value is not None and node is not None and prop:
+            node["end"] = pos
+            value = _unescape_value(value)
+            if prop == "SZ":
+                size = _parse_board_size(value)
+            elif prop == "C":
+                node["comment"] = (prop_start, pos, value)
+            elif prop in ("B", "W") and len(value) == 2:
+                col = _SGF_COORDS.get(value[0], -1)
+                row = _SGF_COORDS.get(value[1], -1)
+                if 0 <= col < size[0] and 0 <= row < size[1]:
+                    node["moves"].append(move_index)
+                    move_index += 1
+
+    for start, end, replacement in sorted(edits, reverse=True):
+        text = text[:start] + replacement + text[end:]
+    return text
 
 
 def get_sgf_files(directory):
@@ -70,14 +349,16 @@ def get_sgf_files(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    files = []
-    for file in os.listdir(directory):
-        if file.endswith(".sgf"):
-            files.append(os.path.join(directory, file))
+    # 使用scandir一次性获取修改时间，避免对每个文件重复stat
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith(".sgf") and entry.is_file():
+                entries.append((entry.stat().st_mtime, entry.path))
 
     # 按修改日期排序，最新的在前
-    files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-    return files
+    entries.sort(key=lambda x: x[0], reverse=True)
+    return [path for _, path in entries]
 
 
 def generate_sgf_filename(directory, black_name="黑棋", white_name="白棋"):
@@ -139,3 +420,52 @@ def create_history_record(
     # 生成文件名并保存
     filename = generate_sgf_filename(directory, black_name, white_name)
     return save_sgf(sgf_content, filename)
+
+
+class HistoryStore:
+    """历史记录存储 - 按页懒加载对局摘要
+
+    只在初始化时列出文件名，摘要在首次访问时按页解析，
+    并只缓存最近使用的若干页，因此内存占用与对局总数无关。
+    match_moves为{文件路径: 手数}，用于局面搜索结果中标记局面出现的手数。
+    """
+
+    def __init__(
+        self, directory, page_size=20, max_pages=8, files=None, match_moves=None
+    ):
+        self.directory = directory
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.files = get_sgf_files(directory) if files is None else list(files)
+        self.match_moves = match_moves or {}
+        self._pages = OrderedDict()  # 页号 -> 摘要列表(LRU顺序)
+
+    def __len__(self):
+        return len(self.files)
+
+    def get_summary(self, index):
+        """获取第index条对局的摘要"""
+        if not 0 <= index < len(self.files):
+            raise IndexError(index)
+
+        page_no = index // self.page_size
+        page = self._pages.get(page_no)
+        if page is None:
+            page = self._load_page(page_no)
+        else:
+            self._pages.move_to_end(page_no)
+        return page[index - page_no * self.page_size]
+
+    def _load_page(self, page_no):
+        """解析一页摘要并放入缓存，超出容量时淘汰最久未用的页"""
+        start = page_no * self.page_size
+        page = []
+        for path in self.files[start : start + self.page_size]:
+            summary = get_game_summary(path)
+            if path in self.match_moves:
+                summary["match_move"] = self.match_moves[path]
+            page.append(summary)
+        self._pages[page_no] = page
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return page
@@ -0,0 +1,223 @@
+"""多进程共用的置换表(可选功能，需要安装numpy)
+
+置换表是放在multiprocessing.shared_memory中的定长NumPy结构化数组，
+每个条目为(校验, 分数, 信息)三个64位字段，按Zobrist哈希的低位直接寻址，总是覆盖旧条目。
+写入时不加锁，校验字段存的是哈希 ^ 分数的位模式 ^ 信息: 两个进程同时写同一个条目时
+读到的三个字段可能来自不同的写入，此时校验不通过，当作没有命中，不会读到错误的结果。
+
+工作进程通过共享内存的名字连接到同一块内存，条目不需要序列化。
+ParallelSearch把根节点的候选着手分给进程池中的各个进程，各自搜索时共用一张置换表。
+
+python -m gomoku.shared_tt --workers 4 --depth 3   # 测量1~4个进程的搜索用时
+"""
+
+import struct
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from .ai import EnhancedMinimaxAI
+from .board import RULE_FREESTYLE
+
+ENTRY_DTYPE = np.dtype([("check", "<u8"), ("value", "<f8"), ("info", "<u8")])
+_VALID = 1 << 63  # 信息字段的最高位，清空后的条目全为0，不会被当作有效条目
+_DOUBLE = struct.Struct("<d")
+_QWORD = struct.Struct("<Q")
+
+
+def _value_bits(value):
+    return _QWORD.unpack(_DOUBLE.pack(value))[0]
+
+
+class SharedTranspositionTable:
+    """共享内存中的定长置换表，接口与EnhancedMinimaxAI使用的dict相同
+
+    条目为(深度, 分数, 最佳着手, 分数类型)，最佳着手为(row, col)或None。
+    信息字段的32~47位为深度，48~49位为分数类型，低32位为最佳着手的行列(各加1，0表示None)。
+    可以直接传给工作进程: 序列化时只传共享内存的名字，反序列化时重新连接。
+    """
+
+    def __init__(self, entries=1 << 20, name=None):
+        if entries & (entries - 1):
+            raise ValueError("置换表的条目数必须是2的幂")
+        self.entries = entries
+        self._mask = entries - 1
+        self._owner = name is None  # 创建共享内存的进程负责释放
+        if name is None:
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=entries * ENTRY_DTYPE.itemsize
+            )
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._table = np.ndarray(entries, ENTRY_DTYPE, buffer=self._shm.buf)
+        if self._owner:
+            self.clear()
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __getstate__(self):
+        return {"entries": self.entries, "name": self.name}
+
+    def __setstate__(self, state):
+        self.__init__(state["entries"], state["name"])
+
+    def clear(self):
+        """清空所有条目(开始分析新的局面前调用)"""
+        self._table.fill(0)
+
+    def get(self, key, default=None):
+        check, value, info = self._table.item(key & self._mask)
+        if not info & _VALID or check ^ _value_bits(value) ^ info != key:
+            return default
+        move = None
+        if info & 0xFFFFFFFF:
+            move = ((info >> 16) & 0xFFFF) - 1, (info & 0xFFFF) - 1
+        return (info >> 32) & 0xFFFF, value, move, (info >> 48) & 3
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        entry = self.get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def __setitem__(self, key, entry):
+        depth, value, move, bound = entry
+        info = _VALID | bound << 48 | depth << 32
+        if move is not None:
+            info |= (move[0] + 1) << 16 | (move[1] + 1)
+        value = float(value)
+        self._table[key & self._mask] = (key ^ _value_bits(value) ^ info, value, info)
+
+    def usage(self):
+        """已使用的条目比例"""
+        return float(np.count_nonzero(self._table["info"])) / self.entries
+
+    def close(self):
+        """断开与共享内存的连接，创建者同时释放共享内存"""
+        self._table = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+# 工作进程中的AI实例
+_worker_ai = None
+
+
+def _init_worker(table, depth, max_nodes, time_limit):
+    global _worker_ai
+    _worker_ai = EnhancedMinimaxAI(
+        depth=depth, max_nodes=max_nodes, time_limit=time_limit, shared_table=table
+    )
+
+
+def _search_moves(task):
+    """在工作进程中搜索根节点的一部分着手"""
+    board, player, moves, rule = task
+    _worker_ai.set_board_size(len(board))
+    return _worker_ai.analyse(board, player, rule=rule, moves=moves)
+
+
+class ParallelSearch:
+    """把根节点的候选着手分给多个进程搜索，进程之间共用一张置换表
+
+    shared=False时每个进程使用私有的置换表(用于比较共享带来的收益)。
+    max_nodes和time_limit是每个进程的预算。
+    """
+
+    def __init__(
+        self,
+        workers,
+        depth=3,
+        max_nodes=None,
+        time_limit=None,
+        table_entries=1 << 20,
+        shared=True,
+    ):
+        self.workers = workers
+        self.table = SharedTranspositionTable(table_entries) if shared else None
+        self.ai = EnhancedMinimaxAI(depth=depth)  # 主进程中只用来生成候选着手
+        self.pool = Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(self.table, depth, max_nodes, time_limit),
+        )
+
+    def analyse(self, board, player, max_candidates=10, rule=RULE_FREESTYLE):
+        """与EnhancedMinimaxAI.analyse相同，返回[(分数, (row, col)), ...]"""
+        self.ai.set_board_size(len(board))
+        moves = self.ai.root_moves(board, player, max_candidates, rule)
+        if self.table is not None:
+            self.table.clear()
+        # 按启发式顺序轮流分配，每个进程都能分到较好的着手
+        tasks = [
+            (board, player, moves[i :: self.workers], rule)
+            for i in range(self.workers)
+            if moves[i :: self.workers]
+        ]
+        results = []
+        for part in self.pool.imap_unordered(_search_moves, tasks):
+            results += part
+        results.sort(key=lambda item: item[0], reverse=True)
+        return results
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        if self.table is not None:
+            self.table.close()
+
+
+def bench_scaling(max_workers, depth=3, stones=12, positions=3, repeat=2):
+    """测量1~max_workers个进程分析同样几个局面的用时
+
+    返回{(进程数, 是否共享置换表): 每个局面的毫秒数}。
+    """
+    import time
+
+    from .bench import make_position
+
+    boards = []
+    for seed in range(positions):
+        game = make_position(15, stones, seed)
+        boards.append((game.board.board, game.current_player))
+
+    results = {}
+    for workers in range(1, max_workers + 1):
+        for shared in (False, True):
+            search = ParallelSearch(workers, depth, shared=shared)
+            try:
+                search.analyse(*boards[0])  # 预热进程池
+                best = float("inf")
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    for board, player in boards:
+                        search.analyse(board, player)
+                    best = min(best, time.perf_counter() - start)
+            finally:
+                search.close()
+            results[(workers, shared)] = best * 1000 / len(boards)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="测量共享置换表的多进程搜索加速比")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="最多的进程数")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--stones", type=int, default=12, help="测试局面的棋子数")
+    parser.add_argument("--positions", type=int, default=3, help="测试局面数")
+    args = parser.parse_args()
+
+    results = bench_scaling(args.workers, args.depth, args.stones, args.positions)
+    base = results[(1, False)]
+    for (workers, shared), ms in results.items():
+        label = "共享置换表" if shared else "私有置换表"
+        print(f"{workers}个进程 {label}: {ms:.0f}ms/局面 加速比{base / ms:.2f}")
@@ -0,0 +1,497 @@
+"""证明数搜索(df-pn)求解器: 判断走子方能否靠连续威胁取胜
+
+攻方只走威胁着手: 冲四(VCF)，开启vct时还包括做活三的着手；守方只考虑能挡住威胁的着手
+和自己的冲四反击。攻方证明成功即为真正的必胜(守方所有可能的应对都已被覆盖或必败)；
+证明失败只说明不存在这样的连续威胁取胜，不代表局面必败。
+
+双方的成五点(再下一子即成五的空点)随落子增量维护，冲四和活三的候选点由五格窗口中
+的棋子数得到。置换表按Zobrist哈希保存证明数和反证数，超过上限时淘汰搜索量最小的
+一半条目。长时间求解可以定期把置换表写入检查点文件，中断后从检查点继续。
+
+python -m gomoku.solver 棋谱.sgf --move 30 --vct --nodes 1000000 --checkpoint solve.ckpt
+"""
+
+import json
+import os
+import struct
+from functools import lru_cache
+
+from .board import RULE_FREESTYLE, RULE_RENJU, get_zobrist_table
+from .renju import RenjuDetector, get_line_table
+
+INF = 10**9  # 证明数/反证数的无穷大
+_SIDE_KEY = 0x9E3779B97F4A7C15  # 守方走子时哈希额外异或的值
+
+CHECKPOINT_MAGIC = b"GMKD"
+_CHECKPOINT_HEADER = struct.Struct("<4sI")  # 魔数 + JSON描述的长度
+_CHECKPOINT_ENTRY = struct.Struct("<QIII")  # 哈希, 证明数, 反证数, 搜索量
+
+PROVEN = "proven"  # 攻方可以靠连续威胁取胜
+DISPROVEN = "disproven"  # 不存在连续威胁取胜
+UNKNOWN = "unknown"  # 节点数用完，尚未得出结论
+
+
+@lru_cache(maxsize=None)
+def _geometry(size):
+    """按棋盘大小预先计算的几何信息
+
+    返回(lines, where, windows, cell_windows, reach):
+    lines[d][i]为方向d第i条线上的交叉点编号列表，where[d][cell]为(线编号, 位置)，
+    windows为所有五格窗口，cell_windows[cell]为包含该点的窗口编号，
+    reach[cell]为与该点同线且距离不超过5的交叉点集合。
+    """
+    line_points, line_where = get_line_table(size)
+    lines = [
+        [[r * size + c for r, c in line] for line in direction_lines]
+        for direction_lines in line_points
+    ]
+    windows = []
+    cell_windows = [[] for _ in range(size * size)]
+    reach = [set() for _ in range(size * size)]
+    for direction_lines in lines:
+        for line in direction_lines:
+            for start in range(len(line) - 4):
+                window = tuple(line[start : start + 5])
+                for cell in window:
+                    cell_windows[cell].append(len(windows))
+                windows.append(window)
+            for pos, cell in enumerate(line):
+                reach[cell].update(line[max(0, pos - 5) : pos + 6])
+    return (
+        lines,
+        line_where,
+        windows,
+        [tuple(w) for w in cell_windows],
+        [frozenset(r) for r in reach],
+    )
+
+
+class ThreatSolver:
+    """对一个局面做df-pn求解，attacker为攻方(必须是走子方)"""
+
+    def __init__(self, board, attacker, rule=RULE_FREESTYLE, vct=False, max_tt=1000000):
+        self.size = len(board)
+        self.attacker = attacker
+        self.rule = rule
+        self.vct = vct
+        self.max_tt = max_tt
+        self.nodes = 0
+        self.tt = {}  # 哈希 -> [证明数, 反证数, 搜索量]
+
+        size = self.size
+        (
+            self._lines,
+            self._where,
+            self._windows,
+            self._cell_windows,
+            self._reach,
+        ) = _geometry(size)
+        self._zobrist = get_zobrist_table(size)
+        self._cells = [board[row][col] for row in range(size) for col in range(size)]
+        self._exact = {1: rule == RULE_RENJU, 2: False}  # 连珠规则下黑棋必须恰好五连
+        self._renju = RenjuDetector(size) if rule == RULE_RENJU else None
+        self._hash = 0
+        self._stones = {1: set(), 2: set()}
+        for cell, stone in enumerate(self._cells):
+            if stone:
+                self._hash ^= self._zobrist[cell][stone]
+                self._stones[stone].add(cell)
+                if self._renju:
+                    self._renju.place(cell // size, cell % size, stone)
+        self.root_stones = sorted(
+            (cell, stone) for cell, stone in enumerate(self._cells) if stone
+        )
+
+        # 双方的成五点，落子和提子时增量更新
+        self._fives = {player: self._scan_fives(player) for player in (1, 2)}
+        self._undo = []
+        self._limit = None
+
+    # 棋形判断
+
+    def _makes_five(self, cell, player, directions=range(4)):
+        """player下在空点cell后是否在directions中的某个方向上成五"""
+        cells = self._cells
+        for d in directions:
+            line_no, pos = self._where[d][cell]
+            line = self._lines[d][line_no]
+            count = 1
+            i = pos - 1
+            while i >= 0 and cells[line[i]] == player:
+                count += 1
+                i -= 1
+            i = pos + 1
+            while i < len(line) and cells[line[i]] == player:
+                count += 1
+                i += 1
+            if count == 5 or (count > 5 and not self._exact[player]):
+                return True
+        return False
+
+    def _scan_fives(self, player):
+        """扫描player的全部成五点(成五点一定与player的棋子相邻)"""
+        fives = set()
+        for stone in self._stones[player]:
+            for w in self._cell_windows[stone]:
+                for cell in self._windows[w]:
+                    if self._cells[cell] == 0 and cell not in fives:
+                        if self._makes_five(cell, player):
+                            fives.add(cell)
+        return fives
+
+    def _is_legal(self, cell, player):
+        if self._renju and player == 1:
+            return not self._renju.is_forbidden(cell // self.size, cell % self.size)
+        return True
+
+    def _window_moves(self, player, own):
+        """五格窗口中有own个player的棋子、其余为空时，窗口中的空点(冲四或活三的候选)"""
+        opponent = 3 - player
+        cells = self._cells
+        moves = set()
+        seen = set()
+        for stone in self._stones[player]:
+            for w in self._cell_windows[stone]:
+                if w in seen:
+                    continue
+                seen.add(w)
+                window = self._windows[w]
+                stones = [cells[c] for c in window]
+                if stones.count(player) == own and opponent not in stones:
+                    moves.update(c for c in window if cells[c] == 0)
+        return moves
+
+    def _four_points(self, player):
+        """player下了之后会有两个以上成五点的空点(活四点，或同时冲四)"""
+        points = []
+        for cell in self._window_moves(player, 3):
+            if not self._is_legal(cell, player):
+                continue
+            self._place(cell, player)
+            if len(self._fives[player]) >= 2:
+                points.append(cell)
+            self._remove()
+        return points
+
+    # 落子和提子
+
+    def _place(self, cell, player):
+        self._undo.append(
+            (cell, player, self._hash, set(self._fives[1]), set(self._fives[2]))
+        )
+        self._cells[cell] = player
+        self._stones[player].add(cell)
+        self._hash ^= self._zobrist[cell][player] ^ _SIDE_KEY
+        if self._renju:
+            self._renju.place(cell // self.size, cell % self.size, player)
+
+        # 同线5格以内的成五点需要重新判断，player在该线上可能出现新的成五点
+        reach = self._reach[cell]
+        for p in (1, 2):
+            fives = self._fives[p]
+            fives.discard(cell)
+            for point in [point for point in fives if point in reach]:
+                if not self._makes_five(point, p):
+                    fives.discard(point)
+        for d in range(4):
+            line_no, pos = self._where[d][cell]
+            line = self._lines[d][line_no]
+            for point in line[max(0, pos - 4) : pos + 5]:
+                if self._cells[point] == 0 and self._makes_five(point, player, (d,)):
+                    self._fives[player].add(point)
+
+    def _remove(self):
+        cell, player, self._hash, self._fives[1], self._fives[2] = self._undo.pop()
+        self._cells[cell] = 0
+        self._stones[player].discard(cell)
+        if self._renju:
+            self._renju.remove(cell // self.size, cell % self.size, player)
+
+    # 着手生成
+
+    def _expand(self, is_or):
+        """返回(结论, 着手列表)，结论为PROVEN/DISPROVEN时局面已确定"""
+        attacker = self.attacker
+        defender = 3 - attacker
+        if is_or:
+            if self._fives[attacker]:
+                return PROVEN, []
+            threats = self._fives[defender]
+            if threats:
+                # 守方冲四，攻方只能挡住；两个成五点挡不住
+                if len(threats) > 1:
+                    return DISPROVEN, []
+                cell = next(iter(threats))
+                return None, [cell] if self._is_legal(cell, attacker) else []
+            moves = self._window_moves(attacker, 3)
+            if self.vct:
+                moves |= self._window_moves(attacker, 2)
+            return None, [cell for cell in moves if self._is_legal(cell, attacker)]
+
+        if self._fives[defender]:
+            return DISPROVEN, []
+        threats = self._fives[attacker]
+        if threats:
+            if len(threats) > 1:
+                return PROVEN, []
+            cell = next(iter(threats))
+            return None, [cell] if self._is_legal(cell, defender) else []
+        if not self.vct:
+            return DISPROVEN, []  # 攻方没有冲四，连续冲四中断
+
+        # 攻方有活三(下一手可成活四)时，守方只能破坏活四所在的窗口或者冲四反击
+        fours = self._four_points(attacker)
+        if not fours:
+            return DISPROVEN, []
+        cells = self._cells
+        moves = self._window_moves(defender, 3)
+        for point in fours:
+            moves.add(point)
+            for w in self._cell_windows[point]:
+                window = self._windows[w]
+                stones = [cells[c] for c in window]
+                if stones.count(attacker) == 3 and defender not in stones:
+                    moves.update(c for c in window if cells[c] == 0)
+        return None, [cell for cell in moves if self._is_legal(cell, defender)]
+
+    # df-pn
+
+    def _lookup(self, key):
+        entry = self.tt.get(key)
+        return (entry[0], entry[1]) if entry else (1, 1)
+
+    def _store(self, key, pn, dn, work):
+        entry = self.tt.get(key)
+        if entry is None and len(self.tt) >= self.max_tt:
+            self._evict()
+        self.tt[key] = [pn, dn, work]
+
+    def _evict(self):
+        """置换表已满: 淘汰搜索量最小的一半条目"""
+        works = sorted(entry[2] for entry in self.tt.values())
+        cutoff = works[len(works) // 2]
+        self.tt = {k: v for k, v in self.tt.items() if v[2] > cutoff}
+
+    def _mid(self, is_or, th_pn, th_dn):
+        key = self._hash
+        start = self.nodes
+        self.nodes += 1
+        result, moves = self._expand(is_or)
+        if result is None and not moves:
+            # 攻方无威胁可走，或守方无法应对
+            result = DISPROVEN if is_or else PROVEN
+        if result is not None:
+            pn, dn = (0, INF) if result == PROVEN else (INF, 0)
+            self._store(key, pn, dn, 1)
+            return pn, dn
+
+        mover = self.attacker if is_or else 3 - self.attacker
+        child_keys = [
+            self._hash ^ self._zobrist[cell][mover] ^ _SIDE_KEY for cell in moves
+        ]
+        while True:
+            # 取出子节点的证明数和反证数，OR节点取证明数最小的，AND节点取反证数最小的
+            best = second = None
+            total = 0
+            best_index = 0
+            for i, child_key in enumerate(child_keys):
+                cpn, cdn = self._lookup(child_key)
+                own, other = (cpn, cdn) if is_or else (cdn, cpn)
+                total = min(INF, total + other)
+                if best is None or own < best[0]:
+                    second = best[0] if best else None
+                    best = (own, other)
+                    best_index = i
+                elif second is None or own < second:
+                    second = own
+            if is_or:
+                pn, dn = best[0], total
+            else:
+                pn, dn = total, best[0]
+            if pn >= th_pn or dn >= th_dn or self._stopped():
+                break
+
+            second = INF if second is None else second
+            if is_or:
+                child_th_pn = min(th_pn, second + 1)
+                child_th_dn = min(INF, th_dn - dn + best[1])
+            else:
+                child_th_dn = min(th_dn, second + 1)
+                child_th_pn = min(INF, th_pn - pn + best[1])
+            self._place(moves[best_index], mover)
+            self._mid(not is_or, child_th_pn, child_th_dn)
+            self._remove()
+
+        self._store(key, pn, dn, self.nodes - start)
+        return pn, dn
+
+    def _stopped(self):
+        return self._limit is not None and self.nodes >= self._limit
+
+    def solve(self, max_nodes=None, checkpoint=None, checkpoint_interval=200000):
+        """求解，返回PROVEN、DISPROVEN或UNKNOWN(节点数用完)
+
+        指定checkpoint时每搜索checkpoint_interval个节点保存一次置换表。
+        """
+        while True:
+            limits = []
+            if max_nodes is not None:
+                limits.append(max_nodes)
+            if checkpoint:
+                limits.append(self.nodes + checkpoint_interval)
+            self._limit = min(limits) if limits else None
+            pn, dn = self._mid(True, INF, INF)
+            if checkpoint:
+                self.save_checkpoint(checkpoint)
+            if pn == 0:
+                return PROVEN
+            if dn == 0:
+                return DISPROVEN
+            if max_nodes is not None and self.nodes >= max_nodes:
+                return UNKNOWN
+
+    def best_move(self):
+        """证明成功后攻方的取胜着手(row, col)"""
+        line = self.proof_line(1)
+        return line[0] if line else None
+
+    def proof_line(self, limit=60):
+        """证明成功后的一条取胜变化[(row, col), ...]"""
+        line = []
+        is_or = True
+        while len(line) < limit:
+            result, moves = self._expand(is_or)
+            mover = self.attacker if is_or else 3 - self.attacker
+            if result == PROVEN and is_or:
+                line.append(divmod(min(self._fives[self.attacker]), self.size))
+                break
+            if result is not None or not moves:
+                break
+            # OR节点选搜索量最小的已证明着手(最直接的取胜)，AND节点选搜索量最大的应对(最顽强的防守)
+            choice = None
+            best_work = None
+            for cell in moves:
+                entry = self.tt.get(self._hash ^ self._zobrist[cell][mover] ^ _SIDE_KEY)
+                if entry is None or (is_or and entry[0] != 0):
+                    continue
+                work = entry[2] if is_or else -entry[2]
+                if best_work is None or work < best_work:
+                    choice, best_work = cell, work
+            if choice is None:
+                break
+            self._place(choice, mover)
+            line.append(divmod(choice, self.size))
+            is_or = not is_or
+        for _ in range(len(self._undo)):
+            self._remove()
+        return line
+
+    # 检查点
+
+    def _description(self):
+        return {
+            "size": self.size,
+            "rule": self.rule,
+            "vct": self.vct,
+            "attacker": self.attacker,
+            "stones": self.root_stones,
+            "nodes": self.nodes,
+        }
+
+    def save_checkpoint(self, path):
+        """把置换表和局面描述写入检查点文件(先写临时文件再原子替换)"""
+        header = json.dumps(self._description()).encode("utf-8")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, len(header)))
+            f.write(header)
+            pack = _CHECKPOINT_ENTRY.pack
+            for key, (pn, dn, work) in self.tt.items():
+                f.write(pack(key, pn, dn, min(work, 0xFFFFFFFF)))
+        os.replace(tmp_path, path)
+
+    def load_checkpoint(self, path):
+        """从检查点恢复置换表，局面或参数不一致时抛出ValueError"""
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, header_len = _CHECKPOINT_HEADER.unpack_from(data, 0)
+        if magic != CHECKPOINT_MAGIC:
+            raise ValueError(f"不是有效的检查点文件: {path}")
+        start = _CHECKPOINT_HEADER.size
+        description = json.loads(data[start : start + header_len].decode("utf-8"))
+        nodes = description.pop("nodes")
+        expected = self._description()
+        expected.pop("nodes")
+        description["stones"] = [tuple(s) for s in description["stones"]]
+        expected["stones"] = [tuple(s) for s in expected["stones"]]
+        if description != expected:
+            raise ValueError("检查点与要求解的局面或参数不一致")
+
+        self.nodes = nodes
+        self.tt = {
+            key: [pn, dn, work]
+            for key, pn, dn, work in _CHECKPOINT_ENTRY.iter_unpack(
+                data[start + header_len :]
+            )
+        }
+
+
+def solve_position(board, player, rule=RULE_FREESTYLE, vct=False, max_nodes=10000):
+    """求解player(走子方)能否靠连续威胁取胜，返回(结论, 取胜着手或None)"""
+    solver = ThreatSolver(board, player, rule, vct)
+    result = solver.solve(max_nodes)
+    return result, solver.best_move() if result == PROVEN else None
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from .analysis import format_move
+    from .sgf import get_rule, parse_sgf
+
+    parser = argparse.ArgumentParser(description="df-pn求解连续威胁取胜")
+    parser.add_argument("sgf_file")
+    parser.add_argument("--move", type=int, help="求解第N手之后的局面(默认为终局)")
+    parser.add_argument("--vct", action="store_true", help="攻方也可以走活三")
+    parser.add_argument("--nodes", type=int, help="最多搜索的节点数")
+    parser.add_argument("--tt-size", type=int, default=1000000, help="置换表条目上限")
+    parser.add_argument("--checkpoint", help="检查点文件，存在时从中继续求解")
+    parser.add_argument("--interval", type=int, default=200000, help="检查点间隔节点数")
+    args = parser.parse_args()
+
+    info, moves = parse_sgf(args.sgf_file)
+    size = int(str(info.get("SZ", "15")).split(":")[0])
+    moves = moves if args.move is None else moves[: args.move]
+    board = [[0] * size for _ in range(size)]
+    for row, col, stone in moves:
+        board[row][col] = stone
+    player = 3 - moves[-1][2] if moves else 1
+
+    solver = ThreatSolver(board, player, get_rule(info), args.vct, args.tt_size)
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        try:
+            solver.load_checkpoint(args.checkpoint)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"从检查点继续: 已搜索{solver.nodes}个节点，置换表{len(solver.tt)}条")
+
+    start = time.perf_counter()
+    start_nodes = solver.nodes
+    result = solver.solve(args.nodes, args.checkpoint, args.interval)
+    elapsed = time.perf_counter() - start
+
+    name = "黑棋" if player == 1 else "白棋"
+    kind = "连续冲四或活三" if args.vct else "连续冲四"
+    if result == PROVEN:
+        line = " ".join(format_move(move) for move in solver.proof_line())
+        print(f"{name}可以靠{kind}取胜: {line}")
+    elif result == DISPROVEN:
+        print(f"{name}不能靠{kind}取胜")
+    else:
+        print("节点数用完，尚未得出结论")
+    searched = solver.nodes - start_nodes
+    print(
+        f"搜索{searched}个节点，用时{elapsed:.2f}秒"
+        f"({searched / elapsed if elapsed else 0:.0f}节点/秒)，置换表{len(solver.tt)}条"
+    )
@@ -0,0 +1,117 @@
+"""引擎的用时管理
+
+按棋钟的剩余时间给每一步分配时间，再用迭代加深搜索决定什么时候停:
+
+- 计划用时: 剩余主时间按预计的剩余步数平分，加上大部分的每步加秒；读秒阶段只用一次读秒的一部分
+- 上限: 不超过剩余时间的一部分(减去安全余量)，保证不会超时
+- 最佳着手在相邻两层之间变化、或者对方有活三以上的威胁时，计划用时延长到上限以内
+- 只有一步可走(直接成五，或必须挡住对方的成五点)时不搜索，立即走棋
+- 按上一层的用时估计下一层的用时，估计超出上限时不再开始下一层
+"""
+
+import time
+
+from .board import RULE_FREESTYLE
+
+
+class TimeManager:
+    """为EnhancedMinimaxAI分配每一步的用时
+
+    max_depth为迭代加深的最大深度，AI的节点预算和时间预算(time_limit)仍然有效。
+    """
+
+    def __init__(
+        self,
+        max_depth=6,
+        moves_to_go=30,
+        safety=0.3,
+        max_fraction=0.25,
+        unstable_factor=2.0,
+        threat_factor=1.5,
+        depth_growth=4.0,
+    ):
+        self.max_depth = max_depth
+        self.moves_to_go = moves_to_go  # 主时间按这么多步平分
+        self.safety = safety  # 每步预留的秒数(界面和进程调度的延迟)
+        self.max_fraction = max_fraction  # 一步最多使用剩余时间的比例
+        self.unstable_factor = unstable_factor  # 最佳着手变化时计划用时的倍数
+        self.threat_factor = threat_factor  # 有威胁时计划用时的倍数
+        self.depth_growth = depth_growth  # 估计下一层用时是这一层的多少倍
+
+    def allocate(self, clock, player):
+        """返回(计划用时, 上限)，单位为秒"""
+        control = clock.control
+        remaining = max(clock.time_left(player), 0)
+        main_left = max(clock.remaining[player], 0) if control.byoyomi else remaining
+        if control.byoyomi and main_left <= control.byoyomi:
+            # 读秒阶段(或即将进入): 每步只用一次读秒，不消耗读秒次数
+            period = control.byoyomi if main_left <= 0 else main_left + control.byoyomi
+            hard = max(min(period, remaining) - self.safety, 0.05)
+            return hard * 0.5, hard
+        planned = main_left / self.moves_to_go + control.increment * 0.8
+        hard = remaining * self.max_fraction + control.increment * 0.8
+        if control.byoyomi:
+            hard += control.byoyomi * 0.5
+        hard = max(min(hard, remaining - self.safety), 0.05)
+        return min(planned, hard), hard
+
+    def choose_move(self, ai, game):
+        """在分配的时间内为game的走子方选择着手"""
+        board = game.board.board
+        player = game.current_player
+        rule = game.board.rule
+        soft, hard = self.allocate(game.clock, player)
+        if ai.time_limit:
+            hard = min(hard, ai.time_limit)
+            soft = min(soft, hard)
+
+        forced, threatened = self._forced_move(ai, board, player, rule)
+        if forced is not None:
+            return forced
+        if threatened:
+            soft = min(soft * self.threat_factor, hard)
+
+        start = time.monotonic()
+        top_n = None if ai.temperature > 0 else 2
+        results = None
+        last_best = None
+        last_elapsed = 0.0
+        for depth, results, _ in ai.iter_analyse(
+            board,
+            player,
+            max(self.max_depth, 1),
+            rule=rule,
+            top_n=top_n,
+            time_limit=hard,
+        ):
+            best = results[0][1]
+            if last_best is not None and best != last_best:
+                soft = min(soft * self.unstable_factor, hard)
+            last_best = best
+            elapsed = time.monotonic() - start
+            depth_time = elapsed - last_elapsed
+            last_elapsed = elapsed
+            if elapsed >= soft or elapsed + depth_time * self.depth_growth > hard:
+                break
+
+        if not results:
+            return None
+        if ai.temperature > 0:
+            return ai._sample_move(results)
+        return results[0][1]
+
+    @staticmethod
+    def _forced_move(ai, board, player, rule=RULE_FREESTYLE):
+        """返回(必须走的着手或None, 对方是否有活三以上的威胁)"""
+        board = [row[:] for row in board]
+        ai.set_board_size(len(board))
+        ai.rule = rule
+        ai._start_search(board)
+        fives, _, _, opp_fives, opp_fours = ai._scan_threats(board, player)
+        for row, col in fives:
+            if ai._is_legal(row, col, player):
+                return (row, col), False  # 直接成五
+        legal_blocks = [pos for pos in opp_fives if ai._is_legal(pos[0], pos[1], player)]
+        if len(opp_fives) == 1 and legal_blocks:
+            return legal_blocks[0], True  # 只能挡住对方的成五点
+        return None, bool(opp_fives or opp_fours)
@@ -0,0 +1,489 @@
+"""Texel方法调优局面评估的棋形分数和权重(需要安装numpy)
+
+从历史棋谱和自我对弈棋谱中取出有结果的对局，每个局面分别以黑白双方为视角，
+统计与棋子相邻的空位上双方在四个方向上的棋形，以及远处空位的棋形。
+EnhancedMinimaxAI的局面评估对这些计数是(多)线性的:
+
+    己方分 = 己方棋形计数·分数 + 防守权重 * 对方威胁棋形计数·分数
+    评估 = 进攻权重 * (己方分 + 远处分) - 防守系数 * (对方分 + 远处分)
+
+所以每个局面只需提取一次计数，之后调整参数时整批向量化计算评估值。
+以sigmoid(评估 / K)作为胜率预测，K取使默认参数误差最小的值，
+再用梯度下降(对数空间，保证参数为正)最小化预测与实际结果的均方误差，
+并惩罚参数偏离初始值。
+
+特征提取按棋谱文件分发到进程池，结果缓存在npz文件中，棋谱没有变化时直接复用。
+调优结果写入eval_weights.json，AI在启动时载入。--games大于0时再让新旧权重
+在随机开局下对战(同样分发到进程池)，报告新权重的胜率和Elo差。
+验证误差没有下降(或对战得分不超过一半)时不覆盖权重文件，改写到旁边的
+*.candidate.json，除非指定--force。
+
+python -m gomoku.tuning gomoku/history selfplay/ --workers 4 --games 40
+"""
+
+import json
+import math
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from .ai import DEFAULT_WEIGHTS, THREAT_PATTERNS, WEIGHTS_FILE, PatternAI
+from .board import get_neighbor_table
+from .sgf import get_sgf_files, iter_sgf_games
+
+PATTERN_KEYS = [
+    (count, open_ends) for count, open_ends, _ in DEFAULT_WEIGHTS["patterns"]
+]
+PATTERN_COUNT = len(PATTERN_KEYS)
+_THREAT_MASK = np.array([key in THREAT_PATTERNS for key in PATTERN_KEYS])
+_FIXED = np.array([key == (5, 0) for key in PATTERN_KEYS])  # 五连的分数表示胜负，不调整
+
+
+def _pattern_index(count, open_ends):
+    """(连子数, 开放端数)对应的棋形编号，与PatternAI的匹配规则一致，不属于任何棋形时为None"""
+    for i, (pattern_count, pattern_open_ends) in enumerate(PATTERN_KEYS):
+        if count == pattern_count and open_ends >= pattern_open_ends:
+            return i
+    return None
+
+
+def _cell_patterns(pattern_ai, board, row, col, player):
+    """player下在空位(row, col)时四个方向上的棋形编号列表"""
+    indexes = []
+    for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        count, open_ends = pattern_ai.scan_direction(board, row, col, dr, dc, player)
+        index = _pattern_index(count, open_ends)
+        if index is not None:
+            indexes.append(index)
+    return indexes
+
+
+def _empty_board_counts(size):
+    """空棋盘上每个位置的棋形计数(size * size, 棋形数)"""
+    pattern_ai = PatternAI(size)
+    board = [[0] * size for _ in range(size)]
+    counts = np.zeros((size * size, PATTERN_COUNT), dtype=np.int16)
+    for row in range(size):
+        for col in range(size):
+            for index in _cell_patterns(pattern_ai, board, row, col, 1):
+                counts[row * size + col, index] += 1
+    return counts
+
+
+def position_features(board, pattern_ai=None, empty_counts=None):
+    """提取一个局面的计数，返回(黑方棋形计数, 白方棋形计数, 远处空位棋形计数)
+
+    与_evaluate_board相同，只统计与棋子相邻的空位，其余空位使用空棋盘上的计数。
+    """
+    size = len(board)
+    if pattern_ai is None:
+        pattern_ai = PatternAI(size)
+    if empty_counts is None:
+        empty_counts = _empty_board_counts(size)
+    adjacent = get_neighbor_table(size, 1)
+    stones = [
+        row * size + col
+        for row in range(size)
+        for col in range(size)
+        if board[row][col]
+    ]
+    near = set()
+    for cell in stones:
+        near.update(adjacent[cell])
+
+    counts = {
+        1: np.zeros(PATTERN_COUNT, np.int16),
+        2: np.zeros(PATTERN_COUNT, np.int16),
+    }
+    far = empty_counts.sum(axis=0)
+    far -= empty_counts[stones].sum(axis=0)
+    for row, col in near:
+        if board[row][col] != 0:
+            continue
+        far -= empty_counts[row * size + col]
+        for player in (1, 2):
+            for index in _cell_patterns(pattern_ai, board, row, col, player):
+                counts[player][index] += 1
+    return counts[1], counts[2], far
+
+
+def _game_result(info):
+    """由RE属性得到黑方的得分(胜1 和0.5 负0)，没有结果时返回None"""
+    result = str(info.get("RE", ""))
+    if result.startswith("B+"):
+        return 1.0
+    if result.startswith("W+"):
+        return 0.0
+    if result.lower().startswith("draw") or result == "0":
+        return 0.5
+    return None
+
+
+def _extract_file(sgf_file, min_moves=4):
+    """在工作进程中提取一个棋谱文件中所有局面的计数
+
+    返回(文件, {"black", "white", "far": 计数数组, "result": 黑方得分, "game": 对局编号})。
+    每局取第min_moves手之后、终局之前的局面，终局局面已经有五连，评估只是胜负分数。
+    """
+    rows = {"black": [], "white": [], "far": [], "result": [], "game": []}
+    tables = {}  # 棋盘大小 -> (PatternAI, 空棋盘计数)
+    for game_index, (info, moves) in enumerate(iter_sgf_games(sgf_file)):
+        result = _game_result(info)
+        if result is None:
+            continue
+        size = int(str(info.get("SZ", "15")).split(":")[0])
+        if size not in tables:
+            tables[size] = (PatternAI(size), _empty_board_counts(size))
+        board = [[0] * size for _ in range(size)]
+        for i, (row, col, player) in enumerate(moves[:-1]):
+            board[row][col] = player
+            if i + 1 < min_moves:
+                continue
+            black, white, far = position_features(board, *tables[size])
+            rows["black"].append(black)
+            rows["white"].append(white)
+            rows["far"].append(far)
+            rows["result"].append(result)
+            rows["game"].append(game_index)
+
+    arrays = {}
+    for key, values in rows.items():
+        if key in ("black", "white", "far"):
+            arrays[key] = np.array(values, dtype=np.int16).reshape(-1, PATTERN_COUNT)
+        else:
+            dtype = np.float32 if key == "result" else np.int32
+            arrays[key] = np.array(values, dtype=dtype)
+    return sgf_file, arrays
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def load_positions(paths, cache_path, workers=None, progress=None):
+    """提取所有棋谱的局面计数，返回按列合并的数组字典
+
+    缓存文件中记录了每个棋谱文件的签名(路径、大小、修改时间)，签名没变的文件直接复用。
+    """
+    files = []
+    for path in paths:
+        files += get_sgf_files(path) if os.path.isdir(path) else [path]
+
+    cached = {}
+    if cache_path and os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            offsets = data["offsets"]
+            for i, signature in enumerate(data["sources"]):
+                start, end = offsets[i], offsets[i + 1]
+                cached[str(signature)] = {
+                    key: data[key][start:end]
+                    for key in ("black", "white", "far", "result", "game")
+                }
+
+    signatures = {path: _file_signature(path) for path in files}
+    missing = [path for path in files if signatures[path] not in cached]
+    if missing:
+        with Pool(workers) as pool:
+            for done, (path, arrays) in enumerate(
+                pool.imap_unordered(_extract_file, missing), 1
+            ):
+                cached[signatures[path]] = arrays
+                if progress:
+                    progress(done, len(missing), path)
+
+    shards = [cached[signatures[path]] for path in files]
+    if not shards:
+        return {}
+    merged = {
+        key: np.concatenate([shard[key] for shard in shards]) for key in shards[0]
+    }
+    if cache_path and missing:
+        lengths = [len(shard["result"]) for shard in shards]
+        np.savez_compressed(
+            cache_path,
+            sources=np.array([signatures[path] for path in files]),
+            offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            **merged,
+        )
+
+    # 对局编号在每个文件内从0开始，合并后加上偏移，用于按对局划分验证集
+    game_offsets = np.cumsum([0] + [int(s["game"].max(initial=-1)) + 1 for s in shards])
+    merged["game"] = np.concatenate(
+        [shard["game"] + offset for shard, offset in zip(shards, game_offsets)]
+    )
+    return merged
+
+
+class TexelTuner:
+    """向量化计算所有局面的评估值和梯度
+
+    每个局面产生黑白两个视角的样本: 己方/对方计数、远处计数和己方的实际得分。
+    """
+
+    def __init__(self, positions):
+        black = positions["black"].astype(np.float64)
+        white = positions["white"].astype(np.float64)
+        far = positions["far"].astype(np.float64)
+        result = positions["result"].astype(np.float64)
+        self.mine = np.concatenate([black, white])
+        self.theirs = np.concatenate([white, black])
+        self.far = np.concatenate([far, far])
+        self.target = np.concatenate([result, 1 - result])
+        self.game = np.concatenate([positions["game"], positions["game"]])
+        self.mask = np.ones(len(self.target), dtype=bool)  # 参与训练的样本
+        self.scale = 1000.0  # sigmoid的K
+
+    @staticmethod
+    def pack(weights):
+        """权重字典 -> 参数向量(各棋形分数, 防守权重, 进攻权重, 防守系数)"""
+        scores = [score for _, _, score in weights["patterns"]]
+        return np.array(
+            scores + [weights["block"], weights["attack"], weights["defense"]],
+            dtype=np.float64,
+        )
+
+    @staticmethod
+    def unpack(params):
+        return {
+            "patterns": [
+                [count, open_ends, round(float(score), 2)]
+                for (count, open_ends), score in zip(PATTERN_KEYS, params)
+            ],
+            "block": round(float(params[PATTERN_COUNT]), 4),
+            "attack": round(float(params[PATTERN_COUNT + 1]), 4),
+            "defense": round(float(params[PATTERN_COUNT + 2]), 4),
+        }
+
+    def evaluate(self, params, mask=None):
+        """返回(评估值, 计算梯度用的中间量)"""
+        mask = self.mask if mask is None else mask
+        scores = params[:PATTERN_COUNT]
+        block, attack, defense = params[PATTERN_COUNT:]
+        threat_scores = scores * _THREAT_MASK
+        mine, theirs, far = self.mine[mask], self.theirs[mask], self.far[mask]
+
+        my_blocks = theirs @ threat_scores  # 己方空位上挡住对方威胁的分数
+        their_blocks = mine @ threat_scores
+        far_score = far @ scores
+        my_score = mine @ scores + block * my_blocks + far_score
+        their_score = theirs @ scores + block * their_blocks + far_score
+        value = attack * my_score - defense * their_score
+        return value, (
+            mine,
+            theirs,
+            far,
+            my_blocks,
+            their_blocks,
+            my_score,
+            their_score,
+        )
+
+    def loss(self, params, mask=None):
+        value, _ = self.evaluate(params, mask)
+        target = self.target[self.mask if mask is None else mask]
+        return float(np.mean((_sigmoid(value / self.scale) - target) ** 2))
+
+    def gradient(self, params):
+        """均方误差对参数的梯度"""
+        value, (mine, theirs, far, my_blocks, their_blocks, my_score, their_score) = (
+            self.evaluate(params)
+        )
+        block, attack, defense = params[PATTERN_COUNT:]
+        predicted = _sigmoid(value / self.scale)
+        d_value = (
+            2 * (predicted - self.target[self.mask]) * predicted * (1 - predicted)
+        ) / (self.scale * len(value))
+
+        d_scores = d_value @ (
+            attack * (mine + block * theirs * _THREAT_MASK + far)
+            - defense * (theirs + block * mine * _THREAT_MASK + far)
+        )
+        d_block = d_value @ (attack * my_blocks - defense * their_blocks)
+        d_attack = d_value @ my_score
+        d_defense = -(d_value @ their_score)
+        return np.concatenate([d_scores, [d_block, d_attack, d_defense]])
+
+    def fit_scale(self, params):
+        """在对数网格上选取使误差最小的K"""
+        best = None
+        for scale in np.geomspace(10, 1e6, 81):
+            self.scale = scale
+            loss = self.loss(params)
+            if best is None or loss < best[0]:
+                best = (loss, scale)
+        self.scale = best[1]
+        return self.scale
+
+    def tune(self, params, steps=3000, learning_rate=0.01, l2=1e-4, progress=None):
+        """在对数空间中用Adam最小化误差，五连分数保持不变
+
+        l2为对数参数偏离初始值的惩罚系数。棋谱不多时，出现次数很多的弱棋形(活一、眠一等)
+        的分数会被拟合成与局面进程相关的噪声，惩罚项让它们保持在初始值附近。
+        """
+        log_params = np.log(params)
+        initial = log_params.copy()
+        trainable = np.concatenate([~_FIXED, [True, True, True]])
+        m = np.zeros_like(log_params)
+        v = np.zeros_like(log_params)
+        for step in range(1, steps + 1):
+            params = np.exp(log_params)
+            # 对log参数的梯度
+            grad = self.gradient(params) * params + 2 * l2 * (log_params - initial)
+            grad *= trainable
+            m = 0.9 * m + 0.1 * grad
+            v = 0.999 * v + 0.001 * grad**2
+            log_params -= (
+                learning_rate
+                * (m / (1 - 0.9**step))
+                / (np.sqrt(v / (1 - 0.999**step)) + 1e-12)
+            )
+            if progress and (step % 200 == 0 or step == steps):
+                progress(step, self.loss(np.exp(log_params)))
+        return np.exp(log_params)
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-np.clip(x, -50, 50)))
+
+
+def save_weights(weights, path=WEIGHTS_FILE, info=None):
+    """写出权重文件(先写临时文件再原子替换)，info为附加的调优信息"""
+    data = dict(weights)
+    if info:
+        data["tuning"] = info
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+_worker_ais = None
+
+
+def _init_match_worker(weights_a, weights_b, depth, time_limit):
+    global _worker_ais
+    from .ai import EnhancedMinimaxAI
+
+    _worker_ais = []
+    for weights in (weights_a, weights_b):
+        ai = EnhancedMinimaxAI(depth=depth, time_limit=time_limit)
+        ai.pattern_ai.set_weights(weights)
+        _worker_ais.append(ai)
+
+
+def _play_opening(opening):
+    """在工作进程中用一个开局下两局(双方各执黑一次)，返回新权重的得分"""
+    from .arena import play_match
+
+    stats = play_match(*_worker_ais, games=2, openings=[opening])
+    return stats["wins"] + stats["draws"] / 2
+
+
+def strength_report(weights, baseline, games=40, depth=3, time_limit=0.3, workers=None):
+    """新权重对旧权重在随机开局下对战，返回(得分, 对局数, Elo差)"""
+    from .arena import random_openings
+
+    openings = random_openings((games + 1) // 2, seed=0)
+    with Pool(
+        workers,
+        initializer=_init_match_worker,
+        initargs=(weights, baseline, depth, time_limit),
+    ) as pool:
+        score = sum(pool.imap_unordered(_play_opening, openings))
+    played = 2 * len(openings)
+    # 与arena.estimate_elo相同，加一局虚拟和棋避免全胜时发散
+    rate = (score + 0.5) / (played + 1)
+    return score, played, 400 * math.log10(rate / (1 - rate))
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from .ai import load_eval_weights
+
+    parser = argparse.ArgumentParser(description="Texel方法调优局面评估参数")
+    parser.add_argument("paths", nargs="+", help="SGF文件或目录")
+    parser.add_argument("--cache", default="tuning_cache.npz", help="局面计数缓存文件")
+    parser.add_argument("--out", default=WEIGHTS_FILE, help="输出的权重文件")
+    parser.add_argument("--workers", type=int, help="进程数(默认等于CPU核数)")
+    parser.add_argument("--steps", type=int, default=3000, help="梯度下降步数")
+    parser.add_argument("--l2", type=float, default=1e-4, help="偏离初始权重的惩罚系数")
+    parser.add_argument("--validation", type=float, default=0.1, help="验证集比例")
+    parser.add_argument("--games", type=int, default=0, help="新旧权重对战的局数")
+    parser.add_argument("--time", type=float, default=0.3, help="对战时每步时间(秒)")
+    parser.add_argument(
+        "--force", action="store_true", help="新权重没有改进时也写入--out"
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    positions = load_positions(
+        args.paths,
+        args.cache,
+        args.workers,
+        progress=lambda done, total, path: print(f"[{done}/{total}] {path}"),
+    )
+    if not positions or not len(positions["result"]):
+        parser.error("没有找到有结果的棋谱")
+    tuner = TexelTuner(positions)
+    print(
+        f"{int(positions['game'].max()) + 1}局 {len(positions['result'])}个局面，"
+        f"提取用时{time.perf_counter() - start:.1f}秒"
+    )
+
+    validation = None
+    if args.validation:
+        validation = tuner.game % round(1 / args.validation) == 0
+        tuner.mask = ~validation
+    baseline = load_eval_weights(args.out)  # 在已有的权重上继续调优
+    initial = TexelTuner.pack(baseline)
+    scale = tuner.fit_scale(initial)
+    before = tuner.loss(initial), tuner.loss(initial, validation)
+    print(f"K={scale:.0f} 初始误差 训练{before[0]:.5f} 验证{before[1]:.5f}")
+
+    params = tuner.tune(
+        initial,
+        args.steps,
+        l2=args.l2,
+        progress=lambda step, loss: print(f"第{step}步 训练误差{loss:.5f}"),
+    )
+    after = tuner.loss(params), tuner.loss(params, validation)
+    print(f"调优后误差 训练{after[0]:.5f} 验证{after[1]:.5f}")
+    weights = TexelTuner.unpack(params)
+    for (count, open_ends, old), (_, _, new) in zip(
+        baseline["patterns"], weights["patterns"]
+    ):
+        print(f"  {count}子 开放{open_ends}端: {old} -> {new}")
+    for key in ("block", "attack", "defense"):
+        print(f"  {key}: {baseline[key]} -> {weights[key]}")
+
+    info = {
+        "positions": int(len(positions["result"])),
+        "scale": round(float(scale), 1),
+        "loss_before": round(before[1], 6),
+        "loss_after": round(after[1], 6),
+    }
+    if args.games:
+        score, played, elo = strength_report(
+            weights, baseline, args.games, time_limit=args.time, workers=args.workers
+        )
+        print(f"新权重对旧权重: {score:g}/{played}分，Elo差约{elo:+.0f}")
+        info.update(match_score=score, match_games=played, elo_gain=round(elo))
+
+    # 权重文件会被所有AI载入，没有改进时不覆盖
+    rejected = []
+    if not after[1] < before[1]:
+        rejected.append(f"验证误差没有下降({before[1]:.5f} -> {after[1]:.5f})")
+    if args.games and not score > played / 2:
+        rejected.append(f"对旧权重得分没有超过一半({score:g}/{played})")
+    out = args.out
+    if rejected and not args.force:
+        root, ext = os.path.splitext(args.out)
+        out = f"{root}.candidate{ext}"
+        print("新权重没有改进，不覆盖" + args.out + ": " + "，".join(rejected))
+        print("确认要使用时可以加--force重新运行，或手动替换")
+    save_weights(weights, out, info)
+    print(f"已保存到 {out}")